@@ -3,25 +3,27 @@
 """
 
 import streamlit as st
-import requests
 import time
 from pathlib import Path
 import plotly.graph_objects as go
-import pandas as pd
 from datetime import datetime, timedelta
 # Import from new Supabase adapter
 from database_supabase import (
-    get_portfolio_data, 
-    calculate_cost_basis, 
-    get_current_year_investment_sales,
-    get_portfolio_history,
-    save_price_cache,
-    load_price_cache,
-    load_price_cache_if_valid,
-    get_latest_ai_comment,
+    get_dashboard_data,
+    get_data_version,
     save_ai_comment,
     save_portfolio_snapshot
 )
+from dashboard_loader import load_dashboard_context
+from chart_cache import get_market_chart
+from chart_prefetch import start_chart_prefetch
+from price_service import (
+    get_prices, get_currency_rate, get_currency_change, get_price_version,
+    start_price_refresher, get_price_refresher_status
+)
+from constants import DISPLAY_CURRENCIES, FIAT_CURRENCIES
+from valuation import build_price_frame, value_portfolio
+from fx_service import get_usd_jpy_rate, get_fx_history, get_fx_version, get_fx_warning, start_fx_refresher
 
 # ページ設定
 st.set_page_config(
@@ -51,312 +53,170 @@ st.markdown("""
 from components.sidebar import render_sidebar
 from components.metrics import render_metrics
 from components.charts import render_charts, render_price_analysis_chart
+from components.holdings import render_holdings_table
 
 currency = render_sidebar()
-currency_symbol = "$" if currency == "USD" else "¥"
+currency_symbol = DISPLAY_CURRENCIES[currency]["symbol"]
 vs_currency = currency.lower()
 
 # --- データ取得ロジック ---
-# Note: get_portfolio_data and calculate_cost_basis are now imported from database_supabase
+# Note: holdings, cost basis and YTD totals come from one call (get_dashboard_data)
 
-# USD/JPY為替レートを取得（CoinGecko以外のAPIを使用）
-@st.cache_data(ttl=3600)  # 1時間キャッシュ
-def fetch_usd_jpy_rate():
-    """USD/JPY為替レートを取得（CoinGecko以外のAPI）"""
-    
-    # 方法1: exchangerate.host API (無料、APIキー不要)
-    try:
-        response = requests.get(
-            "https://api.exchangerate.host/latest",
-            params={"base": "USD", "symbols": "JPY"},
-            timeout=5
-        )
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("success") and "rates" in data:
-                return data["rates"].get("JPY", 155.0)
-    except:
-        pass
-    
-    # 方法2: Open Exchange Rates API (無料プラン)
-    try:
-        response = requests.get(
-            "https://open.er-api.com/v6/latest/USD",
-            timeout=5
-        )
-        if response.status_code == 200:
-            data = response.json()
-            if "rates" in data:
-                return data["rates"].get("JPY", 155.0)
-    except:
-        pass
-    
-    # フォールバック: 固定レート
-    return 155.0
-
-# 現在価格の取得 (USDのみ) - キャッシュ有効化
-@st.cache_data(ttl=1800)  # 30分キャッシュ（APIレート制限対策）
-def fetch_current_prices_usd(api_ids):
-    """CoinGecko APIからUSD価格のみを取得（レート制限対策）"""
-    if not api_ids:
-        return {}
-    
-    # USDのみ取得（JPYはレート換算で対応）
-    url = "https://api.coingecko.com/api/v3/simple/price"
-    params = {
-        "ids": ",".join(api_ids),
-        "vs_currencies": "usd",
-        "include_24hr_change": "true"
-    }
-    
-    max_retries = 3
-    last_error = None
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params=params, timeout=15)
-            
-            # レート制限エラー
-            if response.status_code == 429:
-                last_error = "rate_limit"
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** (attempt + 1)  # 2s, 4s, 8s wait
-                    print(f"[API] レート制限検出。{wait_time}秒待機中... (試行 {attempt + 1}/{max_retries})")
-                    time.sleep(wait_time)
-                    continue
-                print("[API] レート制限: 最大リトライ回数に達しました")
-                return None
-            
-            # サーバーエラー
-            if response.status_code >= 500:
-                last_error = "server_error"
-                if attempt < max_retries - 1:
-                    print(f"[API] サーバーエラー ({response.status_code})。リトライ中...")
-                    time.sleep(2)
-                    continue
-                print(f"[API] サーバーエラー: {response.status_code}")
-                return None
-                
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.Timeout:
-            last_error = "timeout"
-            print(f"[API] タイムアウト (試行 {attempt + 1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            return None
-            
-        except requests.exceptions.ConnectionError:
-            last_error = "connection"
-            print(f"[API] 接続エラー (試行 {attempt + 1}/{max_retries})")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                continue
-            return None
-            
-        except Exception as e:
-            last_error = str(e)
-            print(f"[API] 予期しないエラー: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            return None
-    
-    return None
+# 現在価格・USD/JPYレートは price_service に一本化（全ページ共通のキャッシュ）
+
+# 過去の価格チャートデータを取得 (chart_cache: ディスク上の時系列に差分のみ追記)
+# 失敗は短時間だけネガティブキャッシュし、手元のデータがあればそれを返す
+# 法定通貨はUSDの系列だけを保存し、現在のレートを掛ける（通貨の切り替えでAPIを呼ばない）。
+# その場合は converted_at_current_rate=True を付け、チャート側で換算値であることを表示する。
+# BTC など法定通貨以外は値動きそのものが違うため、その通貨建ての系列を取得する
+def chart_series_currency(vs_curr):
+    """チャートの系列を保存・取得する通貨 (法定通貨は usd)"""
+    currency = vs_curr.upper()
+    return "usd" if currency == "USD" or currency in FIAT_CURRENCIES else currency.lower()
 
-def get_prices_with_jpy(api_ids, usd_jpy_rate):
-    """USD価格を取得し、JPY価格も計算して追加"""
-    prices_usd = fetch_current_prices_usd(tuple(api_ids))  # tupleに変換してキャッシュ可能に
-    if prices_usd is None:
-        return None
-    
-    # JPY価格を追加
-    result = {}
-    for api_id, data in prices_usd.items():
-        result[api_id] = {
-            "usd": data.get("usd"),
-            "jpy": data.get("usd", 0) * usd_jpy_rate if data.get("usd") else None,
-            "usd_24h_change": data.get("usd_24h_change"),
-            "jpy_24h_change": data.get("usd_24h_change"),  # 変動率はUSDと同じ
-        }
-    return result
 
-# 過去の価格チャートデータを取得 (キャッシュ無効化: エラー時のNoneキャッシュを防ぐため)
 def fetch_market_chart(api_id, vs_curr="usd", days=7):
-    """CoinGecko APIから過去の価格データを取得"""
-    if not api_id:
+    """過去の価格データを取得 (market_chart 形式)"""
+    series_currency = chart_series_currency(vs_curr)
+    data = get_market_chart(api_id, vs_currency=series_currency, days=days)
+    if data is None or series_currency != "usd" or vs_curr.lower() == "usd":
+        return data
+    rate = get_currency_rate(vs_curr, exchange_rate)
+    if rate is None:
         return None
+    return {"prices": [[ts, price * rate] for ts, price in data["prices"]], "converted_at_current_rate": True}
 
-    url = f"https://api.coingecko.com/api/v3/coins/{api_id}/market_chart"
-    params = {
-        "vs_currency": vs_curr,
-        "days": days
-    }
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # 少し待機 (連打防止)
-            if attempt == 0:
-                time.sleep(0.5)
-            
-            response = requests.get(url, params=params, timeout=10)
-            if response.status_code == 429:
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt + 1)
-                    continue
-                return None
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            print(f"[ERROR] API呼び出し失敗 (fetch_market_chart): {str(e)}")
-            return None
-        except Exception as e:
-            print(f"[ERROR] 予期しないエラー (fetch_market_chart): {str(e)}")
-            return None
-    return None
+
+# 為替レート(USD/JPY)の履歴を取得 - fx_service の日次レートテーブルから (market_chart 形式)
+# レートテーブルが更新されるまで (fx_version が変わるまで) 結果を使い回す
+@st.cache_data(max_entries=4, show_spinner=False)
+def get_cached_exchange_rate_history(days, fx_version):
+    """USD/JPYの日次レート履歴 (fx_version はキャッシュキー)"""
+    history = get_fx_history(days)
+    if not history:
+        return None
+    return {"prices": [[datetime.strptime(d, "%Y-%m-%d").timestamp() * 1000, rate] for d, rate in history]}
 
 
-# 為替レート(USDT/JPY)の履歴を取得 - キャッシュ有効化 (TTL: 1時間)
-@st.cache_data(ttl=3600)
 def fetch_exchange_rate_history(days=30):
-    """CoinGecko APIからUSDT/JPYの履歴を取得してドル円レートの代用とする"""
-    url = "https://api.coingecko.com/api/v3/coins/tether/market_chart"
-    params = {
-        "vs_currency": "jpy",
-        "days": days
-    }
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            time.sleep(1)
-            response = requests.get(url, params=params, timeout=10)
-            if response.status_code == 429:
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                    continue
-                return None
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            print(f"[ERROR] 為替レート取得失敗: {str(e)}")
-            return None
-        except Exception as e:
-            print(f"[ERROR] 予期しないエラー (exchange_rate): {str(e)}")
-            return None
-    return None
+    """USD/JPYの日次レート履歴を取得"""
+    return get_cached_exchange_rate_history(days, get_fx_version())
 
 # ポートフォリオデータをキャッシュ（60秒TTL）
 @st.cache_data(ttl=60)
 def get_cached_portfolio_data():
-    """キャッシュされたポートフォリオデータを取得"""
-    return get_portfolio_data()
-
-# データを取得（キャッシュから）
-portfolio_data, asset_count, transaction_count = get_cached_portfolio_data()
-
-# API IDリスト作成
-api_ids = [item[3] for item in portfolio_data if item[3]]
-
-# 為替レートを先に取得（CoinGecko以外のAPIを使用）
-with st.spinner('為替レートを取得中...'):
-    exchange_rate = fetch_usd_jpy_rate()
+    """キャッシュされたダッシュボードデータを取得（保有量・コストベース・今年の売買額）"""
+    return get_dashboard_data()
 
 # 価格取得の最適化: キャッシュが有効ならAPIを呼び出さない
 force_refresh = st.session_state.get('force_price_refresh', False)
 st.session_state['force_price_refresh'] = False  # フラグをリセット
 
-# まずキャッシュをチェック（5分以内なら有効）
-cached_prices = load_price_cache_if_valid(max_age_minutes=5)
+# 互いに依存しない読み込み（集計・為替・価格キャッシュ・AIコメント・推移）を並列に取得
+# 表示通貨の切り替えだけのリランでは読み込み済みのデータを使い回す（DBを呼ばない）。
+# ただし読み込みから DASHBOARD_CTX_REUSE_SECONDS 以内で、メモリ上のデータ版 (get_data_version) が
+# 変わっていない場合のみ（他のページでの編集を古いまま表示しない）
+DASHBOARD_CTX_REUSE_SECONDS = 60
+
+def can_reuse_dashboard_ctx(ctx):
+    """読み込み済みのダッシュボードデータを使い回せるか"""
+    if ctx is None or force_refresh:
+        return False
+    if st.session_state.get('dashboard_ctx_currency') in (None, currency):
+        return False
+    if time.time() - ctx.loaded_at >= DASHBOARD_CTX_REUSE_SECONDS:
+        return False
+    return ctx.data_version == get_data_version()
+
+dashboard_ctx = st.session_state.get('dashboard_ctx')
+if not can_reuse_dashboard_ctx(dashboard_ctx):
+    with st.spinner('データを取得中...'):
+        dashboard_ctx = load_dashboard_context(get_usd_jpy_rate, load_dashboard=get_cached_portfolio_data)
+    st.session_state['dashboard_ctx'] = dashboard_ctx
+st.session_state['dashboard_ctx_currency'] = currency
+portfolio_data = dashboard_ctx.portfolio
+asset_count = dashboard_ctx.asset_count
+transaction_count = dashboard_ctx.transaction_count
+exchange_rate = dashboard_ctx.exchange_rate
 
-if cached_prices and not force_refresh:
-    # キャッシュが有効 - APIを呼び出さない
-    current_prices = cached_prices
-    # キャッシュ使用を示す小さなインジケーター（デバッグ用、本番では非表示可）
-    # st.caption("📦 キャッシュデータ使用中")
-else:
-    # キャッシュが古いか無効 - APIから取得
-    with st.spinner('最新価格を取得中...'):
-        current_prices = get_prices_with_jpy(api_ids, exchange_rate)
-    
-    if current_prices is None or len(current_prices) == 0:
-        # API制限時はキャッシュから読み込み（期限切れでも使用）
-        cached_prices = load_price_cache()
-        if cached_prices:
-            st.info("📦 キャッシュされた価格データを表示しています（API制限により最新データを取得できませんでした）")
-            current_prices = cached_prices
-        else:
-            st.warning("⚠️ 価格データを取得できませんでした。しばらく待ってから「データ更新」ボタンを押してください。")
-            current_prices = {}
-    else:
-        # 成功時はキャッシュを更新
-        save_price_cache(current_prices)
-
-
-# 総資産額の計算とチャート用データ作成
-total_portfolio_value = 0
-portfolio_display_data = []
+# API IDリスト作成
+api_ids = [item[3] for item in portfolio_data if item[3]]
 
-# コストベースデータを取得
-cost_basis_data = calculate_cost_basis()
+# 価格はバックグラウンドスレッドが更新し、描画はキャッシュを読むだけ
+# （初回など価格が1件もない銘柄のみ数秒だけ更新を待つ）
+start_price_refresher()
+start_fx_refresher()
+# 取得より前に読む（取得中に更新されても、古い版の番号で新しい価格を持つだけで済む）
+price_version = get_price_version()
+with st.spinner('最新価格を取得中...'):
+    current_prices = get_prices(
+        api_ids, exchange_rate,
+        force_refresh=force_refresh,
+        persisted=dashboard_ctx.price_cache
+    )
 
-for item in portfolio_data:
-    p_id, symbol, name, api_id, icon_url, location, holdings = item
-    
-    # 価格データの抽出
-    price_data = current_prices.get(api_id, {})
-    price = price_data.get(vs_currency, 0)
-    
-    # 評価額計算
-    value = holdings * price
-    total_portfolio_value += value
-    
-    # コストベース情報の取得
-    cb = cost_basis_data.get(p_id, {})
-    avg_cost = cb.get('avg_cost', 0)
-    total_cost = cb.get('total_cost', 0)
-    
-    # 損益率と未実現損益の計算 (USDベース)
-    if avg_cost > 0:
-        # 現在価格をUSDで取得（損益計算は常にUSDベース）
-        price_usd = current_prices.get(api_id, {}).get('usd', 0)
-        value_usd = holdings * price_usd
-        unrealized_pl = value_usd - total_cost
-        pl_percent = ((price_usd - avg_cost) / avg_cost) * 100
-    else:
-        unrealized_pl = 0
-        pl_percent = 0
-    
-    portfolio_display_data.append({
-        "id": p_id,
-        "symbol": symbol,
-        "name": name,
-        "api_id": api_id,
-        "icon_url": icon_url,
-        "location": location,
-        "holdings": holdings,
-        "price": price,
-        "value": value,
-        "avg_cost": avg_cost,
-        "pl_percent": pl_percent,
-        "unrealized_pl": unrealized_pl
-    })
+if api_ids and not current_prices:
+    st.warning("⚠️ 価格データを取得できませんでした。しばらく待ってから「データ更新」ボタンを押してください。")
+else:
+    # stale-while-revalidate: 期限切れの価格もそのまま表示し、該当銘柄だけ裏で再取得中
+    stale_count = sum(1 for p in current_prices.values() if p.get("stale"))
+    if stale_count:
+        refresher_status = get_price_refresher_status()
+        last_success = (refresher_status["last_success_at"] or "")[11:19] or "-"
+        st.caption(f"📦 {stale_count}件の価格はキャッシュを表示中（最終更新 {last_success}、バックグラウンドで再取得中）")
+
+# 為替レートが古い・取得できていない場合は換算値の前提を明示する
+fx_warning = get_fx_warning()
+if fx_warning:
+    st.caption(fx_warning)
+
+# 1 USD あたりの表示通貨 (価格と同じ換算マトリクスのレート)。換算できなければUSDで表示
+currency_rate = get_currency_rate(currency, exchange_rate)
+if currency_rate is None:
+    st.caption(f"⚠️ {currency} への換算レートを取得できないため、USDで表示しています")
+    currency, vs_currency, currency_rate = "USD", "usd", 1.0
+    currency_symbol = DISPLAY_CURRENCIES[currency]["symbol"]
+
+
+def format_price_age(price_data):
+    """価格の経過時間表示（🟢 鮮度内 / 🟡 期限切れで再取得中 / ⚪ 価格なし）"""
+    age = price_data.get("age_seconds")
+    if age is None:
+        return "⚪ -"
+    icon = "🟡" if price_data.get("stale") else "🟢"
+    if age < 60:
+        return f"{icon} {age:.0f}秒前"
+    if age < 3600:
+        return f"{icon} {age / 60:.0f}分前"
+    if age < 86400:
+        return f"{icon} {age / 3600:.0f}時間前"
+    return f"{icon} {age / 86400:.0f}日前"
+
+
+# 評価は USD で一度だけ計算し、(台帳の版, 価格の版) が変わるまで使い回す
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_base_valuation(ledger_version, price_version, _portfolio, _cost_basis, _prices):
+    """USD建ての評価 (引数の _portfolio / _cost_basis / _prices はキーに含めない)"""
+    return value_portfolio(_portfolio, _cost_basis, build_price_frame(_prices, "usd"))
+
+
+# 表示通貨への換算はレートを掛けるだけ（評価額・損益・24h変動・上昇/下落トップ）
+base_valuation = get_base_valuation(
+    dashboard_ctx.ledger_version, price_version, portfolio_data, dashboard_ctx.cost_basis, current_prices
+)
+valuation = base_valuation.in_currency(currency_rate, get_currency_change(currency, exchange_rate))
+total_portfolio_value = valuation.total_value
+portfolio_display_data = valuation.records()
+for item in portfolio_display_data:
+    item["price_age"] = format_price_age(current_prices.get(item["api_id"], {}))
 
 # 今年の取引のみの投資額と売却額を計算（含み益計算用）
 from datetime import datetime
 current_year = datetime.now().year
 
-# Use helper from database_supabase
-total_investment_this_year, total_sales_this_year = get_current_year_investment_sales()
+# Computed server-side together with the holdings
+total_investment_this_year = dashboard_ctx.year_investment
+total_sales_this_year = dashboard_ctx.year_sales
 
 # 価格フォーマット用ヘルパー関数
 def format_price(val, currency="USD"):
@@ -384,58 +244,21 @@ st.markdown("# Crypto Portfolio")
 
 
 # 総損益の計算（含み益のみ、今年の取引ベース）
-# まず、現在のポートフォリオ価値をUSDで計算
-total_portfolio_value_usd = 0
-for item in portfolio_display_data:
-    api_id = item['api_id']
-    holdings = item['holdings']
-    price_data = current_prices.get(api_id, {})
-    price_usd = price_data.get('usd', 0)  # 常にUSD価格を使用
-    total_portfolio_value_usd += holdings * price_usd
-
-# 含み益（USD）= 現在の保有資産価値 - (今年の投資額 - 今年の売却額)
+# 含み益（USD）= 現在の保有資産価値(USD) - (今年の投資額 - 今年の売却額)
+total_portfolio_value_usd = valuation.total_value_usd
 net_investment_this_year = total_investment_this_year - total_sales_this_year
-total_pl_usd = total_portfolio_value_usd - net_investment_this_year
-total_pl_percent = (total_pl_usd / net_investment_this_year * 100) if net_investment_this_year > 0 else 0
+total_pl_usd, total_pl_percent = valuation.total_pl(net_investment_this_year)
 
 # 表示用に選択された通貨に換算
-if vs_currency == "jpy":
-    total_pl_display = total_pl_usd * exchange_rate
-else:
-    total_pl_display = total_pl_usd
+total_pl_display = total_pl_usd * currency_rate
 
-# 24時間変動の計算（全資産の24h変動を合計）
-portfolio_24h_change = 0
-for item in portfolio_display_data:
-    value = item['value']
-    api_id = item['api_id']
-    price_data = current_prices.get(api_id, {})
-    change_key = f"{vs_currency}_24h_change"
-    change_percent = price_data.get(change_key, 0) or 0
-    portfolio_24h_change += value * (change_percent / 100)
-
-portfolio_24h_percent = (portfolio_24h_change / total_portfolio_value * 100) if total_portfolio_value > 0 else 0
-
-# 最高値・最安値の資産を特定
-top_performer = max(portfolio_display_data, key=lambda x: current_prices.get(x['api_id'], {}).get(f'{vs_currency}_24h_change', 0) or 0) if portfolio_display_data else None
-worst_performer = min(portfolio_display_data, key=lambda x: current_prices.get(x['api_id'], {}).get(f'{vs_currency}_24h_change', 0) or 0) if portfolio_display_data else None
-
-top_change = 0
-worst_change = 0
-top_symbol = "-"
-worst_symbol = "-"
-
-if top_performer:
-    api_id = top_performer['api_id']
-    change_key = f"{vs_currency}_24h_change"
-    top_change = current_prices.get(api_id, {}).get(change_key, 0) or 0
-    top_symbol = top_performer['symbol']
-
-if worst_performer:
-    api_id = worst_performer['api_id']
-    change_key = f"{vs_currency}_24h_change"
-    worst_change = current_prices.get(api_id, {}).get(change_key, 0) or 0
-    worst_symbol = worst_performer['symbol']
+portfolio_24h_change = valuation.change_24h
+portfolio_24h_percent = valuation.change_24h_percent
+
+top_performer, top_change = valuation.top_performer, valuation.top_change
+worst_performer, worst_change = valuation.worst_performer, valuation.worst_change
+top_symbol = top_performer['symbol'] if top_performer else "-"
+worst_symbol = worst_performer['symbol'] if worst_performer else "-"
 
 # メトリクスエリア（コンポーネント使用）
 render_metrics(
@@ -467,8 +290,7 @@ def generate_and_save_ai_comment():
         # ポートフォリオデータを収集
         top_assets_data = []
         for item in sorted(portfolio_display_data, key=lambda x: x['value'], reverse=True)[:5]:
-            api_id = item['api_id']
-            change_24h = current_prices.get(api_id, {}).get(f'{vs_currency}_24h_change', 0) or 0
+            change_24h = item['change_24h']
             percent = (item['value'] / total_portfolio_value * 100) if total_portfolio_value > 0 else 0
             top_assets_data.append({
                 'symbol': item['symbol'],
@@ -505,7 +327,7 @@ def generate_and_save_ai_comment():
         return None
 
 # AIコメントの表示
-ai_comment_data = get_latest_ai_comment()
+ai_comment_data = dashboard_ctx.ai_comment
 
 # コメントがない場合、または古い場合は生成を試みる（1日1回）
 from datetime import timezone, timedelta
@@ -526,6 +348,7 @@ if ai_comment_data is None or ai_comment_data.get('date') != today_str:
             new_comment = generate_and_save_ai_comment()
             if new_comment:
                 ai_comment_data = {'date': today_str, 'comment': new_comment}
+                dashboard_ctx.ai_comment = ai_comment_data
 
 # 手動更新ボタン（Gemini APIが設定されている場合のみ）
 gemini_configured = False
@@ -541,6 +364,7 @@ if gemini_configured and portfolio_display_data:
             new_comment = generate_and_save_ai_comment()
             if new_comment:
                 ai_comment_data = {'date': today_str, 'comment': new_comment}
+                dashboard_ctx.ai_comment = ai_comment_data
                 st.success("インサイトを更新しました！")
                 time.sleep(1)
                 st.rerun()
@@ -586,102 +410,30 @@ if ai_comment_data and ai_comment_data.get('comment'):
 
 # --- チャートセクション ---
 # --- チャートセクション（コンポーネント使用） ---
-render_charts(portfolio_display_data, get_portfolio_history)
+render_charts(portfolio_display_data, dashboard_ctx.history)
+
+# 価格推移チャートの描画後に、評価額上位の銘柄のチャートを先読みする (銘柄切り替えをディスクから応答するため)
+# 期間の変更はフラグメント内で完結するため、チャート側から表示中の日数で呼ばれる
+def prefetch_top_charts(days):
+    """評価額上位の銘柄のチャートをバックグラウンドで先読み"""
+    prefetch_ids = [item['api_id'] for item in sorted(portfolio_display_data, key=lambda x: x['value'], reverse=True)]
+    start_chart_prefetch(prefetch_ids, vs_currency=chart_series_currency(vs_currency), days=days)
 
 # --- 価格分析チャート（コンポーネント使用） ---
+# 価格推移・為替チャートはそれぞれフラグメントで、操作してもそのチャートだけが再実行される
 render_price_analysis_chart(
     portfolio_display_data, 
     fetch_market_chart, 
     fetch_exchange_rate_history, 
     currency_symbol, 
-    vs_currency
+    vs_currency,
+    prefetch_func=prefetch_top_charts if portfolio_display_data else None
 )
 
 # --------------------------
 
-# 保有資産リスト
-if portfolio_display_data:
-    st.markdown("### 保有資産リスト")
-
-    # データフレームの作成
-    df_holdings = pd.DataFrame(portfolio_display_data)
-    
-    # 評価額（value）でソート（降順）
-    df_holdings = df_holdings.sort_values(by='value', ascending=False)
-    
-    # 表示用にデータを整形
-    display_df = df_holdings.copy()
-    
-    # カラム設定 - widthを調整して見切れを防止
-    column_config = {
-        "icon_url": st.column_config.ImageColumn(
-            "Icon",
-            help="Asset Icon",
-            width="small"
-        ),
-        "symbol": st.column_config.TextColumn(
-            "Symbol",
-            width="small"
-        ),
-        "name": st.column_config.TextColumn(
-            "Name",
-            width="medium"
-        ),
-        "location": st.column_config.TextColumn(
-            "Storage",
-            width="medium"  # smallからmediumに変更（見切れ防止）
-        ),
-        "holdings": st.column_config.NumberColumn(
-            "Qty",
-            format="%.8f",
-            width="medium"  # 桁が多いためmediumに変更
-        ),
-        "price": st.column_config.NumberColumn(
-            f"Price ({currency_symbol})",
-            format="%.6f" if currency == "USD" else "%.2f",
-            width="medium"  # 桁が多いためmediumに変更
-        ),
-        "value": st.column_config.NumberColumn(
-            f"Value ({currency_symbol})",
-            format="%.2f" if currency == "USD" else "%.0f",
-            width="medium"  # 桁が多いためmediumに変更
-        ),
-        "avg_cost": st.column_config.NumberColumn(
-            "Avg Cost ($)",
-            format="%.6f",
-            width="medium",  # 桁が多いためmediumに変更
-            help="平均取得単価 (USD)"
-        ),
-        "pl_percent": st.column_config.NumberColumn(
-            "P/L %",
-            format="%.1f%%",
-            width="small",
-            help="損益率（現在価格 vs 平均取得単価）"
-        ),
-        "unrealized_pl": st.column_config.NumberColumn(
-            "Unrealized P/L ($)",
-            format="%.2f",
-            width="medium",  # 桁が多いためmediumに変更
-            help="未実現損益 (USD)"
-        )
-    }
-
-    # 表示するカラムの順序
-    display_cols = ["icon_url", "symbol", "name", "location", "holdings", "price", "value", "avg_cost", "pl_percent", "unrealized_pl"]
-
-    # 行数に応じて高さを動的に計算（1行あたり35px + ヘッダー40px）
-    table_height = max(500, len(display_df) * 35 + 40)
-    
-    st.dataframe(
-        display_df[display_cols],
-        column_config=column_config,
-        use_container_width=True,
-        hide_index=True,
-        height=table_height
-    )
-
-else:
-    st.info("保有している資産はありません。")
+# 保有資産リスト（コンポーネント使用）
+render_holdings_table(portfolio_display_data, currency, currency_symbol)
 
 st.markdown("<br><br>", unsafe_allow_html=True)
 
@@ -0,0 +1,149 @@
+"""
+get_statistics ベンチマーク
+
+旧実装 (行ごとに pd.to_datetime で期間判定するループ) と、
+列指向台帳 (ledger.TransactionLedger) によるベクトル化実装を比較する。
+データベースには接続せず、合成した取引データで計測する。
+
+使い方:
+    python benchmark_statistics.py
+    python benchmark_statistics.py 1000 10000 100000
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from constants import TRANSACTION_TYPES
+from ledger import TransactionLedger
+
+SIZES = [1_000, 10_000, 100_000]
+ASSET_COUNT = 60
+PERIOD_START = "2024-01-01 00:00:00"
+PERIOD_END = "2024-12-31 23:59:59"
+
+
+def generate_rows(num_transactions, seed=42):
+    """Supabaseのレスポンスと同じ形の合成取引データを生成"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    types = list(TRANSACTION_TYPES.keys())
+    rows = []
+    for i in range(num_transactions):
+        d = start + timedelta(seconds=rng.randint(0, 6 * 365 * 86400))
+        qty = rng.uniform(0.001, 100)
+        price = rng.uniform(0.01, 1000)
+        rows.append({
+            "id": i + 1,
+            "date": d.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+            "type": rng.choice(types),
+            "asset_id": rng.randint(1, ASSET_COUNT),
+            "quantity": qty,
+            "total_amount": qty * price,
+        })
+    return rows
+
+
+def to_tuples(rows):
+    """get_all_transactions() 形式のタプルに変換"""
+    return [
+        (r["id"], r["date"], r["type"], "SYM", "Name", r["quantity"], 0.0, r["total_amount"], "", r["asset_id"])
+        for r in rows
+    ]
+
+
+def legacy_statistics(all_trans, start_date=None, end_date=None):
+    """旧 get_statistics の集計部分 (ベースライン)"""
+    filtered = []
+    for t in all_trans:
+        d_val = pd.to_datetime(t[1])
+        if d_val.tzinfo is not None:
+            d_val = d_val.tz_localize(None)
+
+        if start_date:
+            start_dt = pd.to_datetime(start_date)
+            if start_dt.tzinfo is not None:
+                start_dt = start_dt.tz_localize(None)
+            if d_val < start_dt:
+                continue
+        if end_date:
+            end_dt = pd.to_datetime(end_date)
+            if end_dt.tzinfo is not None:
+                end_dt = end_dt.tz_localize(None)
+            if d_val > end_dt:
+                continue
+        filtered.append(t)
+
+    total_investment = 0.0
+    total_sales = 0.0
+    holdings_map = {}
+
+    for t in filtered:
+        t_type = t[2]
+        qty = t[5]
+        total = t[7]
+        aid = t[9]
+
+        if t_type == 'Buy':
+            total_investment += total
+        elif t_type == 'Sell':
+            total_sales += total
+
+        current_qty = holdings_map.get(aid, 0.0)
+        if t_type in ['Buy', 'Airdrop', 'Staking Reward', 'Interest', 'Gift']:
+            current_qty += qty
+        elif t_type in ['Sell', 'Transfer']:
+            current_qty -= qty
+        holdings_map[aid] = current_qty
+
+    return total_investment, total_sales, len(filtered), holdings_map
+
+
+def ledger_statistics(ledger, start_date=None, end_date=None):
+    """新 get_statistics の集計部分"""
+    mask = ledger.date_mask(start_date, end_date)
+    total_investment, total_sales = ledger.buy_sell_totals(mask)
+    return total_investment, total_sales, int(mask.sum()), ledger.holdings(mask)
+
+
+def timed(func, *args, repeat=3):
+    """最短実行時間 (秒) と戻り値"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(sizes):
+    print(f"Period: {PERIOD_START} - {PERIOD_END}")
+    print(f"{'rows':>8} | {'legacy':>10} | {'ledger build':>12} | {'ledger query':>12} | {'speedup':>8}")
+    print("-" * 64)
+
+    for n in sizes:
+        rows = generate_rows(n)
+        tuples = to_tuples(rows)
+
+        legacy_time, legacy = timed(legacy_statistics, tuples, PERIOD_START, PERIOD_END, repeat=1)
+        build_time, ledger = timed(TransactionLedger.from_rows, rows)
+        query_time, new = timed(ledger_statistics, ledger, PERIOD_START, PERIOD_END)
+
+        # 結果の一致を確認
+        assert legacy[2] == new[2], "transaction_count mismatch"
+        assert abs(legacy[0] - new[0]) < 1e-6 * max(1.0, legacy[0]), "total_investment mismatch"
+        assert abs(legacy[1] - new[1]) < 1e-6 * max(1.0, legacy[1]), "total_sales mismatch"
+        for aid, qty in legacy[3].items():
+            assert abs(qty - new[3][aid]) < 1e-6 * max(1.0, abs(qty)), "holdings mismatch"
+
+        speedup = legacy_time / query_time if query_time > 0 else float("inf")
+        print(f"{n:>8} | {legacy_time * 1000:>8.1f}ms | {build_time * 1000:>10.1f}ms | {query_time * 1000:>10.2f}ms | {speedup:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
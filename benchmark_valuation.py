@@ -0,0 +1,147 @@
+"""
+value_portfolio ベンチマーク
+
+旧実装 (app.py で portfolio_display_data を4回ループし、current_prices.get を
+繰り返す集計) と、valuation.value_portfolio によるベクトル化実装を比較する。
+Streamlit・データベース・API には接続せず、合成した保有資産と価格で計測する。
+
+使い方:
+    python benchmark_valuation.py
+    python benchmark_valuation.py 50 1000 10000
+"""
+
+import random
+import sys
+import time
+
+from valuation import build_price_frame, value_portfolio
+
+SIZES = [50, 1_000, 10_000]
+VS_CURRENCY = "jpy"
+USD_JPY = 150.0
+
+
+def generate_inputs(num_assets, seed=42):
+    """get_dashboard_data() / get_prices() と同じ形の合成データを生成"""
+    rng = random.Random(seed)
+    portfolio = []
+    cost_basis = {}
+    prices = {}
+    for i in range(num_assets):
+        api_id = f"coin-{i}"
+        holdings = rng.uniform(0.001, 1000)
+        portfolio.append((i + 1, f"C{i}", f"Coin {i}", api_id, "", "Wallet", holdings))
+        # 一部はコストベースなし・価格なし
+        if rng.random() < 0.9:
+            avg_cost = rng.uniform(0.01, 1000)
+            cost_basis[i + 1] = {"avg_cost": avg_cost, "holdings": holdings, "total_cost": avg_cost * holdings}
+        if rng.random() < 0.95:
+            usd = rng.uniform(0.01, 1000)
+            prices[api_id] = {
+                "usd": usd, "jpy": usd * USD_JPY,
+                "usd_24h_change": rng.uniform(-20, 20), "jpy_24h_change": rng.uniform(-20, 20),
+                "age_seconds": rng.uniform(0, 600), "stale": False,
+            }
+    return portfolio, cost_basis, prices
+
+
+def legacy_valuation(portfolio, cost_basis, current_prices, vs_currency):
+    """旧 app.py の集計部分 (ベースライン)"""
+    total_portfolio_value = 0
+    portfolio_display_data = []
+    for item in portfolio:
+        p_id, symbol, name, api_id, icon_url, location, holdings = item
+        price_data = current_prices.get(api_id, {})
+        price = price_data.get(vs_currency) or 0
+        value = holdings * price
+        total_portfolio_value += value
+        cb = cost_basis.get(p_id, {})
+        avg_cost = cb.get('avg_cost', 0)
+        total_cost = cb.get('total_cost', 0)
+        if avg_cost > 0:
+            price_usd = current_prices.get(api_id, {}).get('usd', 0)
+            unrealized_pl = holdings * price_usd - total_cost
+            pl_percent = ((price_usd - avg_cost) / avg_cost) * 100
+        else:
+            unrealized_pl = 0
+            pl_percent = 0
+        portfolio_display_data.append({
+            "id": p_id, "symbol": symbol, "api_id": api_id, "holdings": holdings, "price": price,
+            "value": value, "avg_cost": avg_cost, "pl_percent": pl_percent, "unrealized_pl": unrealized_pl,
+        })
+
+    total_portfolio_value_usd = 0
+    for item in portfolio_display_data:
+        total_portfolio_value_usd += item['holdings'] * current_prices.get(item['api_id'], {}).get('usd', 0)
+
+    portfolio_24h_change = 0
+    for item in portfolio_display_data:
+        change_percent = current_prices.get(item['api_id'], {}).get(f"{vs_currency}_24h_change", 0) or 0
+        portfolio_24h_change += item['value'] * (change_percent / 100)
+
+    def change_of(x):
+        return current_prices.get(x['api_id'], {}).get(f'{vs_currency}_24h_change', 0) or 0
+
+    top_performer = max(portfolio_display_data, key=change_of)
+    worst_performer = min(portfolio_display_data, key=change_of)
+    return (portfolio_display_data, total_portfolio_value, total_portfolio_value_usd, portfolio_24h_change,
+            top_performer['symbol'], worst_performer['symbol'])
+
+
+def vectorized_valuation(portfolio, cost_basis, current_prices, vs_currency):
+    """新 app.py の集計部分 (行の dict は作らない)"""
+    return value_portfolio(portfolio, cost_basis, build_price_frame(current_prices, vs_currency))
+
+
+def vectorized_records(portfolio, cost_basis, current_prices, vs_currency):
+    """新 app.py の集計部分 + 表示用の行 (portfolio_display_data) の作成"""
+    valuation = vectorized_valuation(portfolio, cost_basis, current_prices, vs_currency)
+    return valuation, valuation.records()
+
+
+def timed(func, *args, repeat=3):
+    """最短実行時間 (秒) と戻り値"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def close(a, b):
+    return abs(a - b) <= 1e-9 * max(1.0, abs(a))
+
+
+def main(sizes):
+    print(f"Currency: {VS_CURRENCY}")
+    print(f"{'assets':>8} | {'legacy':>10} | {'vectorized':>10} | {'+ records':>10} | {'speedup':>8}")
+    print("-" * 59)
+
+    for n in sizes:
+        portfolio, cost_basis, prices = generate_inputs(n)
+
+        legacy_time, legacy = timed(legacy_valuation, portfolio, cost_basis, prices, VS_CURRENCY)
+        new_time, new = timed(vectorized_valuation, portfolio, cost_basis, prices, VS_CURRENCY)
+        records_time, (_, records) = timed(vectorized_records, portfolio, cost_basis, prices, VS_CURRENCY)
+
+        # 結果の一致を確認
+        rows, total, total_usd, change, top_symbol, worst_symbol = legacy
+        assert close(total, new.total_value), "total_value mismatch"
+        assert close(total_usd, new.total_value_usd), "total_value_usd mismatch"
+        assert close(change, new.change_24h), "change_24h mismatch"
+        assert (top_symbol, worst_symbol) == (new.top_performer['symbol'], new.worst_performer['symbol']), \
+            "performer mismatch"
+        for old_row, new_row in zip(rows, records):
+            for key in ("value", "pl_percent", "unrealized_pl"):
+                assert close(old_row[key], new_row[key]), f"{key} mismatch"
+
+        speedup = legacy_time / new_time if new_time > 0 else float("inf")
+        print(f"{n:>8} | {legacy_time * 1000:>8.2f}ms | {new_time * 1000:>8.2f}ms | "
+              f"{records_time * 1000:>8.2f}ms | {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
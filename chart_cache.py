@@ -0,0 +1,234 @@
+"""
+価格チャート (market_chart) のディスクキャッシュ
+
+(api_id, 通貨) ごとの時系列を SQLite に保存し、2回目以降は最後の点以降の
+差分だけを /market_chart/range で取得して追記する。解像度の異なる3つの層を持ち、
+期間の切り替えはほぼローカルのデータで応答する。
+
+  fine   : 5分足, 直近1日   (1h / 4h / 1d)
+  hourly : 1時間足, 直近90日 (7d / 1m / 3m)
+  daily  : 日足, 直近400日   (1y)
+
+取得に失敗した場合は短時間だけ記録し (ネガティブキャッシュ)、その間は API を
+呼ばずに手元のデータ (なければ None) を返す。空の応答 (上場廃止・未対応の銘柄など) も
+成功として checked_at を記録し、層の鮮度の間は再取得しない。
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from rate_limiter import PRIORITY_CHARTS, coingecko_get
+
+CHART_CACHE_PATH = Path(__file__).parent / "chart_cache.db"
+
+# 層名 -> (バケット幅 秒, 保持期間 日, 差分取得までの鮮度 秒)
+CHART_TIERS = {
+    "fine": (300, 1, 300),
+    "hourly": (3600, 90, 1800),
+    "daily": (86400, 400, 6 * 3600),
+}
+# 失敗を記録して API を呼ばない秒数
+CHART_NEGATIVE_TTL = 60
+# レート制限の待ち時間の上限 (秒)
+CHART_RATE_LIMIT_WAIT = 20.0
+CHART_REQUEST_TIMEOUT = 10
+
+_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+_locks_guard = threading.Lock()
+_schema_ready = False
+
+
+def tier_for_days(days: float) -> str:
+    """表示日数に足りる最も細かい層"""
+    for tier, (_, retention_days, _) in CHART_TIERS.items():
+        if days <= retention_days:
+            return tier
+    return "daily"
+
+
+def _connect() -> sqlite3.Connection:
+    global _schema_ready
+    conn = sqlite3.connect(CHART_CACHE_PATH, timeout=10)
+    if not _schema_ready:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chart_points (
+                api_id TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                tier TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                price REAL NOT NULL,
+                PRIMARY KEY (api_id, currency, tier, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS chart_meta (
+                api_id TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                tier TEXT NOT NULL,
+                checked_at REAL NOT NULL DEFAULT 0,
+                failed_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                PRIMARY KEY (api_id, currency, tier)
+            );
+        """)
+        _schema_ready = True
+    return conn
+
+
+def _key_lock(key: Tuple[str, str, str]) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.Lock()
+        return lock
+
+
+def _read_points(conn: sqlite3.Connection, key: Tuple[str, str, str], since_ms: int) -> List[List[float]]:
+    rows = conn.execute(
+        "SELECT ts, price FROM chart_points WHERE api_id = ? AND currency = ? AND tier = ? AND ts >= ? "
+        "ORDER BY ts",
+        (*key, since_ms)
+    ).fetchall()
+    return [[ts, price] for ts, price in rows]
+
+
+def _read_meta(conn: sqlite3.Connection, key: Tuple[str, str, str]) -> Tuple[float, float, Optional[int]]:
+    """(checked_at, failed_until, 最後の点の ts)"""
+    meta = conn.execute(
+        "SELECT checked_at, failed_until FROM chart_meta WHERE api_id = ? AND currency = ? AND tier = ?", key
+    ).fetchone()
+    last_ts = conn.execute(
+        "SELECT MAX(ts) FROM chart_points WHERE api_id = ? AND currency = ? AND tier = ?", key
+    ).fetchone()[0]
+    checked_at, failed_until = meta if meta else (0.0, 0.0)
+    return checked_at, failed_until, last_ts
+
+
+def _write_points(conn: sqlite3.Connection, key: Tuple[str, str, str], prices: List[List[float]]):
+    """バケットごとに最新の点だけを残して追記し、保持期間外の点を削除する"""
+    bucket_seconds, retention_days, _ = CHART_TIERS[key[2]]
+    bucket_ms = bucket_seconds * 1000
+    conn.executemany(
+        "INSERT OR REPLACE INTO chart_points (api_id, currency, tier, bucket, ts, price) VALUES (?, ?, ?, ?, ?, ?)",
+        [(*key, int(ts) // bucket_ms, int(ts), float(price)) for ts, price in prices if price is not None]
+    )
+    cutoff_ms = int((time.time() - (retention_days + 1) * 86400) * 1000)
+    conn.execute("DELETE FROM chart_points WHERE api_id = ? AND currency = ? AND tier = ? AND ts < ?",
+                 (*key, cutoff_ms))
+
+
+def _write_meta(conn: sqlite3.Connection, key: Tuple[str, str, str], ok: bool, error: Optional[str] = None):
+    now = time.time()
+    conn.execute(
+        "INSERT INTO chart_meta (api_id, currency, tier, checked_at, failed_until, last_error) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (api_id, currency, tier) DO UPDATE SET "
+        "checked_at = excluded.checked_at, failed_until = excluded.failed_until, last_error = excluded.last_error",
+        (*key, now if ok else 0.0, 0.0 if ok else now + CHART_NEGATIVE_TTL, error)
+    )
+
+
+def _request(api_id: str, currency: str, tier: str, last_ts: Optional[int],
+             priority: int, max_wait: float) -> Optional[List[List[float]]]:
+    """
+    不足分を取得する。最後の点があれば range で差分のみ、なければ保持期間ぶんを取得。
+    失敗時は None
+    """
+    base = f"https://api.coingecko.com/api/v3/coins/{api_id}/market_chart"
+    _, retention_days, _ = CHART_TIERS[tier]
+    now = int(time.time())
+    if last_ts is not None and last_ts >= (now - retention_days * 86400) * 1000:
+        url = f"{base}/range"
+        params = {"vs_currency": currency, "from": last_ts // 1000, "to": now}
+    else:
+        url = base
+        params = {"vs_currency": currency, "days": retention_days}
+
+    try:
+        response = coingecko_get(url, params=params, priority=priority,
+                                 timeout=CHART_REQUEST_TIMEOUT, max_wait=max_wait)
+        if response is None or response.status_code == 429:
+            print(f"[chart-cache] レート制限のため取得できません: {api_id}/{currency}")
+            return None
+        response.raise_for_status()
+        return response.json().get("prices") or []
+    except requests.exceptions.RequestException as e:
+        print(f"[ERROR] API呼び出し失敗 (market_chart {api_id}/{currency}): {str(e)}")
+        return None
+    except Exception as e:
+        print(f"[ERROR] 予期しないエラー (market_chart {api_id}/{currency}): {str(e)}")
+        return None
+
+
+def get_market_chart(api_id: str, vs_currency: str = "usd", days: float = 7,
+                     priority: int = PRIORITY_CHARTS, max_wait: float = CHART_RATE_LIMIT_WAIT,
+                     record_failure: bool = True) -> Optional[Dict]:
+    """
+    直近 days 日の価格推移を返す (CoinGecko の market_chart と同じ {"prices": [[ms, price], ...]} 形式)
+
+    鮮度内ならディスクから返し、古ければ差分だけを取得して追記する。
+    取得に失敗しても手元にデータがあればそれを返す。データが全くなければ None
+
+    Args:
+        priority / max_wait: レートリミッターの優先度と待ち時間の上限
+        record_failure: False なら失敗をネガティブキャッシュしない (先読み用)
+    """
+    if not api_id:
+        return None
+    currency = vs_currency.lower()
+    tier = tier_for_days(days)
+    key = (api_id, currency, tier)
+    since_ms = int((time.time() - days * 86400) * 1000)
+
+    # 同じ系列の取得は1スレッドずつ (待っていた側は取得済みのデータを読む)
+    with _key_lock(key):
+        conn = _connect()
+        try:
+            checked_at, failed_until, last_ts = _read_meta(conn, key)
+            now = time.time()
+            # 成功した取得 (空の応答を含む) から鮮度内なら API を呼ばない
+            fresh = now - checked_at < CHART_TIERS[tier][2]
+            if not fresh and now >= failed_until:
+                prices = _request(api_id, currency, tier, last_ts, priority, max_wait)
+                with conn:
+                    if prices is None:
+                        if record_failure:
+                            _write_meta(conn, key, ok=False, error="fetch failed")
+                    else:
+                        _write_points(conn, key, prices)
+                        _write_meta(conn, key, ok=True)
+            points = _read_points(conn, key, since_ms)
+        finally:
+            conn.close()
+
+    if not points:
+        return None
+    return {"prices": points}
+
+
+def get_chart_cache_stats() -> Dict:
+    """保存している系列数・点数・ネガティブキャッシュ中の系列数"""
+    conn = _connect()
+    try:
+        series, points = conn.execute(
+            "SELECT COUNT(DISTINCT api_id || '/' || currency || '/' || tier), COUNT(*) FROM chart_points"
+        ).fetchone()
+        failing = conn.execute("SELECT COUNT(*) FROM chart_meta WHERE failed_until > ?", (time.time(),)).fetchone()[0]
+    finally:
+        conn.close()
+    return {"series": series, "points": points, "negative": failing, "path": str(CHART_CACHE_PATH)}
+
+
+def clear_chart_cache():
+    """保存しているチャートデータをすべて削除する"""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM chart_points")
+            conn.execute("DELETE FROM chart_meta")
+    finally:
+        conn.close()
@@ -0,0 +1,92 @@
+"""
+価格チャートの先読み
+
+ダッシュボードの描画が終わった後、評価額の大きい上位 N 銘柄のチャートを
+asyncio で並列に chart_cache へ読み込んでおく。銘柄の切り替えはディスクから応答できる。
+
+レートリミッターでは最も低い優先度 (PRIORITY_PREFETCH) で並ぶため、現在価格や
+ユーザーが開いたチャートの取得を遅らせない。429 で停止中は先読みしない。
+"""
+
+import asyncio
+import threading
+from typing import Dict, List, Tuple
+
+from chart_cache import get_market_chart
+from rate_limiter import PRIORITY_PREFETCH, get_rate_limit_stats
+
+# 先読みする銘柄数 (評価額の上位から)
+PREFETCH_TOP_N = 5
+# 同時に取得する銘柄数
+PREFETCH_CONCURRENCY = 3
+# 1銘柄あたりのレート制限の待ち時間の上限 (秒)
+PREFETCH_RATE_LIMIT_WAIT = 30.0
+
+_running: set = set()
+_running_lock = threading.Lock()
+
+
+async def _prefetch(api_ids: List[str], vs_currency: str, days: float,
+                    concurrency: int) -> Dict[str, bool]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(api_id: str) -> Tuple[str, bool]:
+        async with semaphore:
+            # 失敗はネガティブキャッシュせず、表示時の取得に任せる
+            data = await asyncio.to_thread(
+                get_market_chart, api_id, vs_currency, days,
+                priority=PRIORITY_PREFETCH, max_wait=PREFETCH_RATE_LIMIT_WAIT, record_failure=False
+            )
+            return api_id, data is not None
+
+    return dict(await asyncio.gather(*(load(api_id) for api_id in api_ids)))
+
+
+def prefetch_market_charts(api_ids: List[str], vs_currency: str = "usd", days: float = 30,
+                           concurrency: int = PREFETCH_CONCURRENCY) -> Dict[str, bool]:
+    """
+    複数銘柄のチャートを並列に chart_cache へ読み込む (呼び出し元は完了まで待つ)
+
+    Returns:
+        {api_id: データがあるか}
+    """
+    api_ids = list(dict.fromkeys(a for a in api_ids if a))
+    if not api_ids:
+        return {}
+    return asyncio.run(_prefetch(api_ids, vs_currency, days, concurrency))
+
+
+def start_chart_prefetch(api_ids: List[str], vs_currency: str = "usd", days: float = 30,
+                         top_n: int = PREFETCH_TOP_N) -> bool:
+    """
+    先頭 top_n 銘柄の先読みをバックグラウンドスレッドで開始する
+
+    同じ条件の先読みが実行中、または 429 でリミッターが停止中なら何もしない。
+
+    Returns:
+        先読みを開始したか
+    """
+    api_ids = list(dict.fromkeys(a for a in api_ids if a))[:top_n]
+    if not api_ids or get_rate_limit_stats()["blocked_seconds"] > 0:
+        return False
+
+    key = (tuple(api_ids), vs_currency, days)
+    with _running_lock:
+        if key in _running:
+            return False
+        _running.add(key)
+
+    def run():
+        try:
+            loaded = prefetch_market_charts(api_ids, vs_currency, days)
+            missing = [a for a, ok in loaded.items() if not ok]
+            if missing:
+                print(f"[chart-prefetch] 取得できなかった銘柄: {missing}")
+        except Exception as e:
+            print(f"[chart-prefetch] 先読みエラー: {e}")
+        finally:
+            with _running_lock:
+                _running.discard(key)
+
+    threading.Thread(target=run, name="chart-prefetch", daemon=True).start()
+    return True
@@ -191,66 +191,74 @@ def render_charts(portfolio_display_data, get_portfolio_history_func):
 
     # 3. ポートフォリオ履歴チャート（簡略版）
     with chart_col3:
-        snapshot_data = get_portfolio_history_func(days=365)
-        if snapshot_data:
-            hist_dates = [datetime.fromisoformat(s[0]) for s in snapshot_data]
-            hist_values = [s[1] for s in snapshot_data]
-            
-            # 変化率の計算
-            if len(hist_values) >= 2:
-                first_val = hist_values[0]
-                last_val = hist_values[-1]
-                change_pct = ((last_val - first_val) / first_val) * 100 if first_val > 0 else 0
-                change_color = "#00ff9d" if change_pct >= 0 else "#ff4b4b"
-                change_sign = "+" if change_pct >= 0 else ""
-            else:
-                change_pct = 0
-                change_color = "#888"
-                change_sign = ""
-            
-            fig_hist = go.Figure()
-            
-            fig_hist.add_trace(go.Scatter(
-                x=hist_dates, 
-                y=hist_values,
-                mode='lines+markers',
-                name='Portfolio Value',
-                line=dict(color='#3b82f6', width=2),
-                marker=dict(size=4, color='#3b82f6'),
-                fill='tozeroy',
-                fillcolor='rgba(59, 130, 246, 0.1)'
-            ))
-            
-            fig_hist.update_layout(
-                title=dict(
-                    text=f"History ({years_ago_label(len(hist_values))})",
-                    font=dict(color="#1F2937", size=14),
-                    y=0.98,
-                    x=0.5,
-                    xanchor='center',
-                    yanchor='top'
-                ),
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                xaxis=dict(
-                    showgrid=False, 
-                    tickfont=dict(color='#1F2937', size=10),
-                    tickformat='%m/%d'
-                ),
-                yaxis=dict(
-                    showgrid=True, 
-                    gridcolor='rgba(0,0,0,0.05)',
-                    tickfont=dict(color='#1F2937', size=10),
-                    tickformat='s'
-                ),
-                margin=dict(t=40, b=20, l=30, r=10),
-                height=300,
-                showlegend=False
-            )
-            
-            st.plotly_chart(fig_hist, width='stretch')
+        render_history_chart(get_portfolio_history_func)
+
+@st.fragment
+def render_history_chart(get_portfolio_history_func):
+    """
+    Renders the portfolio history chart (simplified).
+    Runs as a fragment, so widgets in other fragments (e.g. the price trend) do not redraw it.
+    """
+    snapshot_data = get_portfolio_history_func(days=365)
+    if snapshot_data:
+        hist_dates = [datetime.fromisoformat(s[0]) for s in snapshot_data]
+        hist_values = [s[1] for s in snapshot_data]
+
+        # 変化率の計算
+        if len(hist_values) >= 2:
+            first_val = hist_values[0]
+            last_val = hist_values[-1]
+            change_pct = ((last_val - first_val) / first_val) * 100 if first_val > 0 else 0
+            change_color = "#00ff9d" if change_pct >= 0 else "#ff4b4b"
+            change_sign = "+" if change_pct >= 0 else ""
         else:
-            st.info("No history data available.")
+            change_pct = 0
+            change_color = "#888"
+            change_sign = ""
+
+        fig_hist = go.Figure()
+
+        fig_hist.add_trace(go.Scatter(
+            x=hist_dates, 
+            y=hist_values,
+            mode='lines+markers',
+            name='Portfolio Value',
+            line=dict(color='#3b82f6', width=2),
+            marker=dict(size=4, color='#3b82f6'),
+            fill='tozeroy',
+            fillcolor='rgba(59, 130, 246, 0.1)'
+        ))
+
+        fig_hist.update_layout(
+            title=dict(
+                text=f"History ({years_ago_label(len(hist_values))})",
+                font=dict(color="#1F2937", size=14),
+                y=0.98,
+                x=0.5,
+                xanchor='center',
+                yanchor='top'
+            ),
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            xaxis=dict(
+                showgrid=False, 
+                tickfont=dict(color='#1F2937', size=10),
+                tickformat='%m/%d'
+            ),
+            yaxis=dict(
+                showgrid=True, 
+                gridcolor='rgba(0,0,0,0.05)',
+                tickfont=dict(color='#1F2937', size=10),
+                tickformat='s'
+            ),
+            margin=dict(t=40, b=20, l=30, r=10),
+            height=300,
+            showlegend=False
+        )
+
+        st.plotly_chart(fig_hist, width='stretch')
+    else:
+        st.info("No history data available.")
 
 def years_ago_label(count):
     if count > 300:
@@ -262,12 +270,107 @@ def years_ago_label(count):
     else:
         return "Last 30 Days"
 
-def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func, fetch_exchange_rate_history_func, currency_symbol, vs_currency):
+# 期間 -> market_chart の取得日数 (1h, 4h は1日分から切り出す)
+TIMEFRAME_DAYS = {"1h": 1, "4h": 1, "1d": 1, "7d": 7, "1m": 30, "3m": 90, "1y": 365}
+TIMEFRAME_HOURS = {"1h": 1, "4h": 4}
+
+def filter_timeframe(prices, timeframe):
+    """[[ms, price], ...] を期間で切り出す (1h, 4hの場合のみ)"""
+    hours = TIMEFRAME_HOURS.get(timeframe)
+    if not hours:
+        return prices
+    cutoff_time = (datetime.now().timestamp() - hours * 3600) * 1000
+    return [p for p in prices if p[0] >= cutoff_time]
+
+def render_price_overlay_chart(symbols, asset_options, color_map, fetch_market_chart_func, timeframe, days_param, vs_currency):
+    """
+    Renders selected assets as normalized lines (% change from the start of the timeframe).
+    """
+    if not symbols:
+        st.info("Select assets above to compare price trends.")
+        return
+
+    fig_overlay = go.Figure()
+    unavailable = []
+    converted = False
+    with st.spinner('Loading price data...'):
+        for symbol in symbols:
+            api_id = asset_options.get(symbol)
+            market_data = fetch_market_chart_func(api_id, vs_curr=vs_currency, days=days_param) if api_id else None
+            prices = filter_timeframe(market_data['prices'], timeframe) if market_data and 'prices' in market_data else []
+            base = next((p[1] for p in prices if p[1]), None)
+            if not base:
+                unavailable.append(symbol)
+                continue
+            converted = converted or market_data.get('converted_at_current_rate', False)
+
+            fig_overlay.add_trace(go.Scatter(
+                x=[datetime.fromtimestamp(p[0]/1000) for p in prices],
+                y=[(p[1] / base - 1) * 100 for p in prices],
+                mode='lines',
+                name=symbol,
+                line=dict(color=color_map.get(symbol, '#00ff9d'), width=2),
+                hovertemplate=f"{symbol}: %{{y:+.2f}}%<extra></extra>"
+            ))
+
+    if not fig_overlay.data:
+        st.warning("Price data for the selected assets is currently unavailable. Please try again later.")
+        return
+
+    fig_overlay.update_layout(
+        title=dict(
+            text=f"Relative Performance - {timeframe.upper()}",
+            font=dict(color="#1F2937", size=16),
+            y=0.98,
+            x=0.5,
+            xanchor='center',
+            yanchor='top'
+        ),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(
+            showgrid=False,
+            tickfont=dict(color='#888'),
+            linecolor='#333'
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor='#333',
+            tickfont=dict(color='#888'),
+            ticksuffix='%',
+            zeroline=True,
+            zerolinecolor='#888'
+        ),
+        margin=dict(t=40, b=0, l=0, r=0),
+        height=350,
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+
+    st.plotly_chart(fig_overlay, width='stretch')
+    if converted:
+        st.caption(f"Based on USD prices converted at the current rate ({vs_currency.upper()} movement not included)")
+    if unavailable:
+        st.caption(f"Price data unavailable: {', '.join(unavailable)}")
+
+def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func, fetch_exchange_rate_history_func, currency_symbol, vs_currency, prefetch_func=None):
     """
     Renders the Price Trend and Exchange Rate charts.
+    Each chart is a fragment, so its widgets rerun only that chart.
     """
     st.markdown("<br>", unsafe_allow_html=True)
-    
+    render_price_trend_chart(portfolio_display_data, fetch_market_chart_func, currency_symbol, vs_currency, prefetch_func)
+    st.markdown("<br>", unsafe_allow_html=True)
+    render_exchange_rate_chart(fetch_exchange_rate_history_func)
+    st.markdown("<br>", unsafe_allow_html=True)
+
+@st.fragment
+def render_price_trend_chart(portfolio_display_data, fetch_market_chart_func, currency_symbol, vs_currency, prefetch_func=None):
+    """
+    Renders the asset price trend chart (single asset or normalized comparison).
+    Runs as a fragment: changing the asset, timeframe or compare mode reruns only this chart,
+    with the arguments from the last full run.
+    """
     # 3. 価格推移チャート（フルワイド版 - Price Trend）
     st.markdown(f"""
     <div style="margin-bottom: 10px;">
@@ -286,19 +389,32 @@ def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func,
         color = CRYPTO_COLORS.get(symbol, FALLBACK_COLORS[i % len(FALLBACK_COLORS)])
         color_map[symbol] = color
 
+    # 比較モード (複数資産を正規化して重ねる)
+    compare_mode = st.toggle("Compare assets (normalized)", key="price_trend_compare")
+
     # 資産選択と期間選択を横並びに
     select_col1, select_col2 = st.columns([3, 1])
     
     with select_col1:
-        # 資産選択 (シングル選択)
         asset_options = {item['symbol']: item['api_id'] for item in sorted_data}
-        default_selection = list(asset_options.keys())[0] if asset_options else None
-        selected_symbol = st.selectbox(
-            "Select Asset", 
-            options=list(asset_options.keys()), 
-            index=0 if asset_options else None,
-            key="price_trend_asset"
-        )
+        selected_symbol = None
+        compare_symbols = []
+        if compare_mode:
+            # 資産選択 (複数選択, 既定は評価額の上位3件)
+            compare_symbols = st.multiselect(
+                "Select Assets",
+                options=list(asset_options.keys()),
+                default=list(asset_options.keys())[:3],
+                key="price_trend_compare_assets"
+            )
+        else:
+            # 資産選択 (シングル選択)
+            selected_symbol = st.selectbox(
+                "Select Asset", 
+                options=list(asset_options.keys()), 
+                index=0 if asset_options else None,
+                key="price_trend_asset"
+            )
     
     with select_col2:
         # 期間選択
@@ -310,16 +426,12 @@ def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func,
         )
     
     # 期間に応じたパラメータ設定
-    days_param = 7
-    if timeframe == "1y": days_param = 365
-    elif timeframe == "3m": days_param = 90
-    elif timeframe == "1m": days_param = 30
-    elif timeframe == "7d": days_param = 7
-    elif timeframe == "1d": days_param = 1
-    elif timeframe == "4h": days_param = 1
-    elif timeframe == "1h": days_param = 1
+    days_param = TIMEFRAME_DAYS.get(timeframe, 7)
     
-    if selected_symbol:
+    if compare_mode:
+        render_price_overlay_chart(compare_symbols, asset_options, color_map,
+                                   fetch_market_chart_func, timeframe, days_param, vs_currency)
+    elif selected_symbol:
         selected_api_id = asset_options[selected_symbol]
         
         if selected_api_id:
@@ -327,17 +439,7 @@ def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func,
                 market_data = fetch_market_chart_func(selected_api_id, vs_curr=vs_currency, days=days_param)
             
             if market_data and 'prices' in market_data:
-                prices = market_data['prices']
-                
-                # データのフィルタリング (1h, 4hの場合)
-                if timeframe in ["1h", "4h"]:
-                    cutoff_time = datetime.now().timestamp() * 1000
-                    if timeframe == "1h":
-                        cutoff_time -= 3600 * 1000
-                    elif timeframe == "4h":
-                        cutoff_time -= 4 * 3600 * 1000
-                    
-                    prices = [p for p in prices if p[0] >= cutoff_time]
+                prices = filter_timeframe(market_data['prices'], timeframe)
 
                 dates = [datetime.fromtimestamp(p[0]/1000) for p in prices]
                 price_values = [p[1] for p in prices]
@@ -402,6 +504,8 @@ def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func,
                 )
                 
                 st.plotly_chart(fig_line, use_container_width=True)
+                if market_data.get('converted_at_current_rate'):
+                    st.caption(f"USD price history converted to {vs_currency.upper()} at the current rate")
             else:
                 st.warning(f"Price data for {selected_symbol} is currently unavailable. Please try again later.")
         else:
@@ -409,10 +513,16 @@ def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func,
     else:
         st.info("Select an asset above to view price trend.")
 
-    st.markdown("<br>", unsafe_allow_html=True)
-    
-    # 4. 為替レートチャート (USD/JPY Analysis)
-    
+    # 表示中の期間で上位銘柄のチャートを先読み (フラグメント内の期間変更でも実行する)
+    if prefetch_func:
+        prefetch_func(days_param)
+
+@st.fragment
+def render_exchange_rate_chart(fetch_exchange_rate_history_func):
+    """
+    Renders the USD/JPY exchange rate chart (last 30 days).
+    Runs as a fragment, so widgets in other fragments (e.g. the price trend) do not redraw it.
+    """
     exchange_data = fetch_exchange_rate_history_func(days=30)
     
     if exchange_data and 'prices' in exchange_data:
@@ -469,5 +579,3 @@ def render_price_analysis_chart(portfolio_display_data, fetch_market_chart_func,
         )
         
         st.plotly_chart(fig_ex, width='stretch')
-
-    st.markdown("<br>", unsafe_allow_html=True)
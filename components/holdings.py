@@ -0,0 +1,98 @@
+import pandas as pd
+import streamlit as st
+
+from constants import DISPLAY_CURRENCIES
+
+@st.fragment
+def render_holdings_table(portfolio_display_data, currency, currency_symbol):
+    """
+    Renders the holdings table.
+    Runs as a fragment, so widgets in other fragments (e.g. the price trend) do not redraw it.
+    """
+    if portfolio_display_data:
+        st.markdown("### 保有資産リスト")
+
+        # データフレームの作成
+        df_holdings = pd.DataFrame(portfolio_display_data)
+        
+        # 評価額（value）でソート（降順）
+        df_holdings = df_holdings.sort_values(by='value', ascending=False)
+        
+        # 表示用にデータを整形
+        display_df = df_holdings.copy()
+        
+        # カラム設定 - widthを調整して見切れを防止
+        column_config = {
+            "icon_url": st.column_config.ImageColumn(
+                "Icon",
+                help="Asset Icon",
+                width="small"
+            ),
+            "symbol": st.column_config.TextColumn(
+                "Symbol",
+                width="small"
+            ),
+            "name": st.column_config.TextColumn(
+                "Name",
+                width="medium"
+            ),
+            "location": st.column_config.TextColumn(
+                "Storage",
+                width="medium"  # smallからmediumに変更（見切れ防止）
+            ),
+            "holdings": st.column_config.NumberColumn(
+                "Qty",
+                format="%.8f",
+                width="medium"  # 桁が多いためmediumに変更
+            ),
+            "price": st.column_config.NumberColumn(
+                f"Price ({currency_symbol})",
+                format=f"%.{DISPLAY_CURRENCIES[currency]['price_decimals']}f",
+                width="medium"  # 桁が多いためmediumに変更
+            ),
+            "value": st.column_config.NumberColumn(
+                f"Value ({currency_symbol})",
+                format=f"%.{DISPLAY_CURRENCIES[currency]['decimals']}f",
+                width="medium"  # 桁が多いためmediumに変更
+            ),
+            "avg_cost": st.column_config.NumberColumn(
+                "Avg Cost ($)",
+                format="%.6f",
+                width="medium",  # 桁が多いためmediumに変更
+                help="平均取得単価 (USD)"
+            ),
+            "pl_percent": st.column_config.NumberColumn(
+                "P/L %",
+                format="%.1f%%",
+                width="small",
+                help="損益率（現在価格 vs 平均取得単価）"
+            ),
+            "unrealized_pl": st.column_config.NumberColumn(
+                "Unrealized P/L ($)",
+                format="%.2f",
+                width="medium",  # 桁が多いためmediumに変更
+                help="未実現損益 (USD)"
+            ),
+            "price_age": st.column_config.TextColumn(
+                "Updated",
+                width="small",
+                help="価格の取得からの経過時間（🟡は期限切れでバックグラウンド更新中）"
+            )
+        }
+
+        # 表示するカラムの順序
+        display_cols = ["icon_url", "symbol", "name", "location", "holdings", "price", "value", "avg_cost", "pl_percent", "unrealized_pl", "price_age"]
+
+        # 行数に応じて高さを動的に計算（1行あたり35px + ヘッダー40px）
+        table_height = max(500, len(display_df) * 35 + 40)
+        
+        st.dataframe(
+            display_df[display_cols],
+            column_config=column_config,
+            use_container_width=True,
+            hide_index=True,
+            height=table_height
+        )
+
+    else:
+        st.info("保有している資産はありません。")
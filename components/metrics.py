@@ -1,6 +1,8 @@
 
 import streamlit as st
 
+from constants import DISPLAY_CURRENCIES
+
 def render_metrics(total_portfolio_value, total_pl_percent, total_pl_display, portfolio_24h_percent, portfolio_24h_change, currency_symbol, portfolio_data_len, top_performer, top_change, worst_performer, worst_change, vs_currency):
     """
     Renders the metrics section of the dashboard.
@@ -16,22 +18,26 @@ def render_metrics(total_portfolio_value, total_pl_percent, total_pl_display, po
     # Worst Performer Info
     worst_symbol = worst_performer['symbol'] if worst_performer else "-"
 
+    # 金額の書式 (BTC建てなど小数が必要な通貨のみ小数を表示)
+    currency_code = vs_currency.upper()
+    amount_format = ",.4f" if DISPLAY_CURRENCIES.get(currency_code, {}).get("decimals", 0) > 2 else ",.0f"
+
     st.markdown(f"""
     <div class="metrics-grid">
         <div class="metric-card" style="border-color: var(--accent-primary); box-shadow: 0 0 15px rgba(0, 217, 255, 0.1);">
-            <div class="metric-label">総資産 ({'USD' if currency_symbol == '$' else 'JPY'})</div>
-            <div class="metric-value">{currency_symbol}{total_portfolio_value:,.0f}</div>
+            <div class="metric-label">総資産 ({currency_code})</div>
+            <div class="metric-value">{currency_symbol}{total_portfolio_value:{amount_format}}</div>
             <div class="metric-label">{portfolio_data_len} Assets</div>
         </div>
         <div class="metric-card">
             <div class="metric-label">総損益 (P/L)</div>
             <div class="metric-value" style="color: {pl_color};">{pl_icon} {abs(total_pl_percent):.1f}%</div>
-            <div class="metric-label">{currency_symbol}{abs(total_pl_display):,.0f}</div>
+            <div class="metric-label">{currency_symbol}{abs(total_pl_display):{amount_format}}</div>
         </div>
         <div class="metric-card">
             <div class="metric-label">24h変動</div>
             <div class="metric-value" style="color: {change_color};">{change_icon} {abs(portfolio_24h_percent):.2f}%</div>
-            <div class="metric-label">{currency_symbol}{abs(portfolio_24h_change):,.0f}</div>
+            <div class="metric-label">{currency_symbol}{abs(portfolio_24h_change):{amount_format}}</div>
         </div>
         <div class="metric-card">
             <div class="metric-label">保有銘柄</div>
@@ -1,6 +1,8 @@
 
 import streamlit as st
 
+from constants import DISPLAY_CURRENCIES
+
 def render_sidebar():
     """
     Renders the sidebar content and returns the selected currency.
@@ -18,7 +20,7 @@ def render_sidebar():
     # Currency selector
     currency = st.sidebar.radio(
         "表示通貨",
-        ["USD", "JPY"],
+        list(DISPLAY_CURRENCIES),
         key="currency_selector",
         index=0
     )
@@ -9,6 +9,7 @@ TRANSACTION_TYPES = {
         "icon": "🟢",
         "color": "#4CAF50",
         "is_cost_free": False,
+        "holding_sign": 1,
         "description": "暗号資産を購入した取引"
     },
     "Sell": {
@@ -16,6 +17,7 @@ TRANSACTION_TYPES = {
         "icon": "🔴",
         "color": "#F44336",
         "is_cost_free": False,
+        "holding_sign": -1,
         "description": "暗号資産を売却した取引"
     },
     "Transfer": {
@@ -23,6 +25,7 @@ TRANSACTION_TYPES = {
         "icon": "📤",
         "color": "#607D8B",
         "is_cost_free": True,
+        "holding_sign": -1,
         "description": "別ウォレット/取引所への移動（ポートフォリオから除外）"
     },
     "Airdrop": {
@@ -30,6 +33,7 @@ TRANSACTION_TYPES = {
         "icon": "🎁",
         "color": "#9C27B0",
         "is_cost_free": True,
+        "holding_sign": 1,
         "description": "プロジェクトからの無償配布"
     },
     "Staking Reward": {
@@ -37,6 +41,7 @@ TRANSACTION_TYPES = {
         "icon": "💰",
         "color": "#FF9800",
         "is_cost_free": True,
+        "holding_sign": 1,
         "description": "ステーキングによる報酬"
     },
     "Interest": {
@@ -44,6 +49,7 @@ TRANSACTION_TYPES = {
         "icon": "📈",
         "color": "#03A9F4",
         "is_cost_free": True,
+        "holding_sign": 1,
         "description": "レンディングやDeFiプロトコルからの利息"
     },
     "Gift": {
@@ -51,6 +57,7 @@ TRANSACTION_TYPES = {
         "icon": "🎀",
         "color": "#E91E63",
         "is_cost_free": True,
+        "holding_sign": 1,
         "description": "他者からの贈与"
     }
 }
@@ -90,3 +97,21 @@ def is_cost_free_transaction(transaction_type):
     """
     info = get_transaction_type_info(transaction_type)
     return info["is_cost_free"] if info else False
+
+
+# 表示通貨 (USD建て価格 × 為替ベクトルで換算する)
+# decimals: 金額表示の小数桁数 / price_decimals: 単価表示の小数桁数
+DISPLAY_CURRENCIES = {
+    "USD": {"symbol": "$", "decimals": 2, "price_decimals": 6},
+    "JPY": {"symbol": "¥", "decimals": 0, "price_decimals": 2},
+    "EUR": {"symbol": "€", "decimals": 2, "price_decimals": 6},
+    "GBP": {"symbol": "£", "decimals": 2, "price_decimals": 6},
+    "KRW": {"symbol": "₩", "decimals": 0, "price_decimals": 2},
+    "BTC": {"symbol": "₿", "decimals": 8, "price_decimals": 10},
+}
+
+# 為替APIから取得する法定通貨 (USD以外)
+FIAT_CURRENCIES = [c for c in DISPLAY_CURRENCIES if c not in ("USD", "BTC")]
+
+# BTC建ての換算に使う銘柄
+BTC_API_ID = "bitcoin"
@@ -0,0 +1,60 @@
+-- Dashboard payload in a single round trip
+-- Returns per-asset holdings, cost basis inputs and year-to-date Buy/Sell
+-- totals together with asset/transaction counts, so the dashboard can render
+-- after one RPC call instead of assets + balances + count + full ledger.
+--
+-- Usage (PostgREST): POST /rpc/get_dashboard_payload {"p_year": 2026}
+-- p_year defaults to the current year. Years are evaluated in UTC, the same
+-- as the client-side ledger fallback.
+
+CREATE OR REPLACE FUNCTION get_dashboard_payload(p_year integer DEFAULT NULL)
+RETURNS jsonb AS $$
+    WITH target AS (
+        SELECT COALESCE(p_year, extract(year FROM now() AT TIME ZONE 'UTC')::integer) AS year
+    ),
+    per_asset AS (
+        SELECT
+            t.asset_id,
+            SUM(
+                CASE
+                    WHEN t.type IN ('Buy', 'Airdrop', 'Staking Reward', 'Interest', 'Gift') THEN t.quantity
+                    WHEN t.type IN ('Sell', 'Transfer') THEN -t.quantity
+                    ELSE 0
+                END
+            ) AS holdings,
+            SUM(CASE WHEN t.type = 'Buy' THEN t.total_amount ELSE 0 END) AS buy_cost,
+            SUM(CASE WHEN t.type = 'Buy' THEN t.quantity ELSE 0 END) AS bought,
+            SUM(CASE WHEN t.type = 'Sell' THEN t.quantity ELSE 0 END) AS sold,
+            SUM(CASE WHEN t.type = 'Buy' AND extract(year FROM t.date AT TIME ZONE 'UTC') = target.year
+                     THEN t.total_amount ELSE 0 END) AS ytd_buy,
+            SUM(CASE WHEN t.type = 'Sell' AND extract(year FROM t.date AT TIME ZONE 'UTC') = target.year
+                     THEN t.total_amount ELSE 0 END) AS ytd_sell,
+            COUNT(*) AS transaction_count
+        FROM transactions t CROSS JOIN target
+        GROUP BY t.asset_id
+    )
+    SELECT jsonb_build_object(
+        'year', (SELECT year FROM target),
+        'asset_count', (SELECT COUNT(*) FROM assets),
+        'transaction_count', (SELECT COALESCE(SUM(transaction_count), 0) FROM per_asset),
+        'assets', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', a.id,
+                'name', a.name,
+                'symbol', a.symbol,
+                'api_id', a.api_id,
+                'icon_url', a.icon_url,
+                'location', a.location,
+                'holdings', COALESCE(p.holdings, 0),
+                'buy_cost', COALESCE(p.buy_cost, 0),
+                'bought', COALESCE(p.bought, 0),
+                'sold', COALESCE(p.sold, 0),
+                'ytd_buy', COALESCE(p.ytd_buy, 0),
+                'ytd_sell', COALESCE(p.ytd_sell, 0)
+            ) ORDER BY a.created_at DESC)
+            FROM assets a LEFT JOIN per_asset p ON p.asset_id = a.id
+        ), '[]'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION get_dashboard_payload(integer) TO anon;
@@ -0,0 +1,130 @@
+"""
+ダッシュボード用データの並列ローダー
+
+互いに依存しない読み込み (ダッシュボード集計, 為替レート, 価格キャッシュ,
+AIコメント, 資産推移) をスレッドプールで同時に発行し、結果を
+DashboardContext にまとめる。所要時間は合計ではなく最も遅い1件に近づく。
+"""
+
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from database_supabase import (
+    get_dashboard_data,
+    get_data_version,
+    get_latest_ai_comment,
+    get_portfolio_history,
+    load_price_cache,
+)
+from fx_service import DEFAULT_USD_JPY_RATE
+
+# 資産推移チャートの取得日数
+HISTORY_DAYS = 365
+# 同時に発行するクエリ数の上限
+MAX_WORKERS = 6
+
+
+@dataclass
+class DashboardContext:
+    """ダッシュボードの描画に必要な読み込み結果"""
+    portfolio: List[Tuple] = field(default_factory=list)
+    asset_count: int = 0
+    transaction_count: int = 0
+    cost_basis: Dict[int, Dict[str, float]] = field(default_factory=dict)
+    year_investment: float = 0.0
+    year_sales: float = 0.0
+    # 保有数量・コストベース・今年の売買額の内容から作る版 (同じ内容なら同じ値)
+    ledger_version: str = ""
+    exchange_rate: float = DEFAULT_USD_JPY_RATE
+    price_cache: Dict[str, Dict] = field(default_factory=dict)
+    ai_comment: Optional[Dict] = None
+    portfolio_history: List[Tuple] = field(default_factory=list)
+    # 失敗したタスク名 -> エラーメッセージ
+    errors: Dict[str, str] = field(default_factory=dict)
+    # タスク名 -> 所要時間 (秒)。"total" は全体の所要時間
+    timings: Dict[str, float] = field(default_factory=dict)
+    # 読み込んだ時刻 (epoch 秒)
+    loaded_at: float = 0.0
+    # 読み込み開始時点のメモリ上のデータ版 (get_data_version)。DB を呼ばずに変更を検知する
+    data_version: Tuple = ()
+
+    def history(self, days: int = HISTORY_DAYS) -> List[Tuple]:
+        """get_portfolio_history(days=...) 互換 (読み込み済みの推移から切り出す)"""
+        return self.portfolio_history[-days:] if days else self.portfolio_history
+
+
+def ledger_version(dashboard: Dict) -> str:
+    """ダッシュボード集計の内容のハッシュ (評価結果のキャッシュキー用)"""
+    content = repr((dashboard['portfolio'], sorted(dashboard['cost_basis'].items()),
+                    dashboard['year_investment'], dashboard['year_sales']))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def load_dashboard_context(fetch_exchange_rate: Callable[[], float],
+                           load_dashboard: Callable[[], Dict] = get_dashboard_data,
+                           max_workers: int = MAX_WORKERS) -> DashboardContext:
+    """
+    ダッシュボードの読み込みを並列に実行する
+
+    Args:
+        fetch_exchange_rate: USD/JPY レート取得関数 (fx_service.get_usd_jpy_rate)
+        load_dashboard: ダッシュボード集計の取得関数 (キャッシュ付きのものを渡せる)
+        max_workers: 同時実行数
+
+    失敗したタスクは既定値のまま残し、errors に記録する。
+    """
+    # 読み込み中の変更を見逃さないよう、読み込みの前に取る
+    ctx = DashboardContext(data_version=get_data_version())
+    script_ctx = get_script_run_ctx()
+    tasks = {
+        "dashboard": load_dashboard,
+        "exchange_rate": fetch_exchange_rate,
+        "price_cache": load_price_cache,
+        "ai_comment": get_latest_ai_comment,
+        "portfolio_history": lambda: get_portfolio_history(days=HISTORY_DAYS),
+    }
+
+    def run(name: str, func: Callable[[], Any]):
+        # ワーカースレッドでも st.cache_data / st.error が使えるようにする
+        if script_ctx is not None:
+            add_script_run_ctx(threading.current_thread(), script_ctx)
+        t0 = time.perf_counter()
+        try:
+            return func()
+        finally:
+            ctx.timings[name] = time.perf_counter() - t0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard") as executor:
+        futures = {name: executor.submit(run, name, func) for name, func in tasks.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"[dashboard] {name} failed: {e}")
+                ctx.errors[name] = str(e)
+    ctx.timings["total"] = time.perf_counter() - started
+    ctx.loaded_at = time.time()
+
+    dashboard = results.get("dashboard")
+    if dashboard:
+        ctx.portfolio = dashboard['portfolio']
+        ctx.asset_count = dashboard['asset_count']
+        ctx.transaction_count = dashboard['transaction_count']
+        ctx.cost_basis = dashboard['cost_basis']
+        ctx.year_investment = dashboard['year_investment']
+        ctx.year_sales = dashboard['year_sales']
+        ctx.ledger_version = ledger_version(dashboard)
+    if results.get("exchange_rate"):
+        ctx.exchange_rate = results["exchange_rate"]
+    ctx.price_cache = results.get("price_cache") or {}
+    ctx.ai_comment = results.get("ai_comment")
+    ctx.portfolio_history = results.get("portfolio_history") or []
+    return ctx
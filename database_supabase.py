@@ -1,19 +1,118 @@
 
 import streamlit as st
 import requests
+import logging
+import threading
+import bisect
+import time
+import httpx
 from postgrest import SyncPostgrestClient
 from datetime import datetime, date, timezone, timedelta
 import pandas as pd
 from typing import Optional, List, Dict, Any, Tuple
 
+logger = logging.getLogger(__name__)
+
 # Japan Standard Time (UTC+9)
 JST = timezone(timedelta(hours=9))
 
 # --- Constants copied to avoid circular imports if needed, but imported is better ---
-from constants import COST_FREE_TYPES, COST_BASED_TYPES, TRANSACTION_TYPES
+from constants import COST_FREE_TYPES, COST_BASED_TYPES, TRANSACTION_TYPES, VALID_TRANSACTION_TYPES
+from utils import validate_quantity, validate_price
+from ledger import TransactionLedger, LEDGER_COLUMNS, to_epoch_seconds, quantity_matches
+from fx_service import get_fx_version, rates_as_of
+
+# --- Connection Pool ---
+
+# Defaults for the shared HTTP connection pool.
+# Each key can be overridden in .streamlit/secrets.toml under [supabase].
+POOL_DEFAULTS = {
+    "pool_max_connections": 10,      # 同時接続数の上限
+    "pool_max_keepalive": 5,         # keep-aliveで保持するアイドル接続数
+    "pool_keepalive_expiry": 60.0,   # アイドル接続を閉じるまでの秒数
+    "connect_timeout": 5.0,
+    "timeout": 15.0,
+    "http2": False,                  # h2パッケージが必要
+}
+
+
+class _PoolStats:
+    """Thread-safe counters fed by httpcore trace events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    def on_request(self, request: httpx.Request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name: str, info: Dict):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            requests_count = self.requests
+            new_connections = self.new_connections
+            tls_handshakes = self.tls_handshakes
+        reused = max(requests_count - new_connections, 0)
+        return {
+            "requests": requests_count,
+            "new_connections": new_connections,
+            "tls_handshakes": tls_handshakes,
+            "reused_requests": reused,
+            "reuse_ratio": (reused / requests_count) if requests_count else 0.0,
+        }
+
+
+# The HTTP/2 fallback warning is logged once per process
+_h2_fallback_logged = False
+
+def _http2_available() -> bool:
+    global _h2_fallback_logged
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        if not _h2_fallback_logged:
+            logger.warning("HTTP/2 requested but 'h2' is not installed; falling back to HTTP/1.1")
+            _h2_fallback_logged = True
+        return False
+
+def _build_http_client(pool_config: Dict, stats: _PoolStats) -> Tuple[httpx.Client, bool]:
+    """
+    Create the keep-alive httpx client shared by every PostgREST request.
+    Returns (client, whether HTTP/2 is actually in effect).
+    """
+    http2 = bool(pool_config["http2"]) and _http2_available()
+
+    client = httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=int(pool_config["pool_max_connections"]),
+            max_keepalive_connections=int(pool_config["pool_max_keepalive"]),
+            keepalive_expiry=float(pool_config["pool_keepalive_expiry"]),
+        ),
+        timeout=httpx.Timeout(
+            float(pool_config["timeout"]),
+            connect=float(pool_config["connect_timeout"]),
+        ),
+        follow_redirects=True,
+        event_hooks={"request": [stats.on_request]},
+    )
+    return client, http2
+
 
 class CustomSupabaseClient:
-    def __init__(self, url: str, key: str):
+    def __init__(self, url: str, key: str, pool_config: Optional[Dict] = None):
         self.url = url
         self.key = key
         self.headers = {
@@ -22,17 +121,54 @@ class CustomSupabaseClient:
             "Content-Type": "application/json"
         }
         self.rest_url = f"{url}/rest/v1"
-        self.postgrest = SyncPostgrestClient(self.rest_url, headers=self.headers)
+        self.pool_config = {**POOL_DEFAULTS, **(pool_config or {})}
+        self.stats = _PoolStats()
+        self.http_client, self.http2 = _build_http_client(self.pool_config, self.stats)
+        self.postgrest = SyncPostgrestClient(
+            self.rest_url,
+            headers=self.headers,
+            http_client=self.http_client
+        )
         
     def table(self, name: str):
         return self.postgrest.from_(name)
 
+    def rpc(self, func: str, params: Optional[Dict] = None):
+        return self.postgrest.rpc(func, params or {})
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool statistics (open connections, reuse ratio, ...)"""
+        stats = self.stats.snapshot()
+        pool = getattr(getattr(self.http_client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        stats["open_connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        stats["http2"] = self.http2
+        stats["http2_requested"] = bool(self.pool_config["http2"])
+        return stats
+
+
+@st.cache_resource(show_spinner=False)
+def _get_shared_client() -> CustomSupabaseClient:
+    """
+    Process-wide client shared across reruns and sessions.
+    Exceptions are not cached, so a missing secret is retried on the next call.
+    """
+    conf = st.secrets["supabase"]
+    pool_config = {k: conf[k] for k in POOL_DEFAULTS if k in conf}
+    return CustomSupabaseClient(conf["url"], conf["key"], pool_config)
+
+# The shared client as last handed to a script run. Background threads use this
+# instead of calling cache_resource functions outside a script run context.
+_background_client: Optional[CustomSupabaseClient] = None
+
 def init_supabase() -> Optional[CustomSupabaseClient]:
     """Initialize Supabase client using Streamlit secrets"""
+    global _background_client
     try:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        return CustomSupabaseClient(url, key)
+        client = _get_shared_client()
+        _background_client = client
+        return client
     except Exception as e:
         st.error(f"Failed to initialize Supabase: {e}")
         return None
@@ -41,6 +177,37 @@ def init_supabase() -> Optional[CustomSupabaseClient]:
 def get_client():
     return init_supabase()
 
+def get_background_client() -> Optional[CustomSupabaseClient]:
+    """Shared client for background threads (no Streamlit calls; None until a script run created it)"""
+    return _background_client
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Statistics of the shared connection pool (empty if client is unavailable)"""
+    client = get_client()
+    if not client: return {}
+    return client.pool_stats()
+
+# --- Local data version ---
+
+# Bumped by every write from this process that changes dashboard data
+# (transactions and assets), so pages can tell without a query whether data changed
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+def _bump_data_version():
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+
+def get_data_version() -> Tuple[int, int]:
+    """
+    In-memory version of the dashboard data: (local writes, synced ledger version).
+    Never queries the database; changes made by other processes show up only
+    once the ledger has synced them.
+    """
+    ledger = _get_ledger_sync().ledger
+    return _data_version, (ledger.version if ledger is not None else -1)
+
 # --- Assets ---
 
 def get_all_assets() -> List[Tuple]:
@@ -95,6 +262,7 @@ def add_asset(name: str, symbol: str, api_id: str, icon_url: str = "", location:
             "location": location
         }
         client.table("assets").insert(data).execute()
+        _bump_data_version()
         return True
     except Exception as e:
         # Check for unique constraint violation (symbol)
@@ -114,6 +282,7 @@ def update_asset(asset_id, name, symbol, api_id, icon_url, location) -> bool:
             "location": location
         }
         client.table("assets").update(data).eq("id", asset_id).execute()
+        _bump_data_version()
         return True
     except Exception as e:
         print(f"Error updating asset: {e}")
@@ -132,12 +301,37 @@ def delete_asset(asset_id) -> Tuple[bool, str]:
             return False, f"この資産には{count}件の取引記録があります。先に取引を削除してください。"
             
         client.table("assets").delete().eq("id", asset_id).execute()
+        _bump_data_version()
         return True, "削除しました"
     except Exception as e:
         return False, f"削除エラー: {e}"
 
 # --- Transactions ---
 
+def _apply_type_filter(query, filter_type: str):
+    """Apply the transactions page filter (すべて / コストあり / コストなし)"""
+    if filter_type == "コストあり (Buy/Sell)":
+        return query.in_("type", COST_BASED_TYPES)
+    elif filter_type == "コストなし (報酬等)":
+        return query.in_("type", COST_FREE_TYPES)
+    return query
+
+def _to_transaction_tuple(t: Dict) -> Tuple:
+    """Flatten a nested-select row into the SQLite-style transaction tuple"""
+    asset = t.get('assets') or {}
+    return (
+        t['id'],
+        t['date'], # ISO string
+        t['type'],
+        asset.get('symbol', 'UNKNOWN'),
+        asset.get('name', 'Unknown'),
+        t['quantity'],
+        t['price_per_unit'],
+        t['total_amount'],
+        t['notes'],
+        t['asset_id']
+    )
+
 def get_all_transactions(filter_type="すべて") -> List[Tuple]:
     """
     Get all transactions with joined asset info.
@@ -152,35 +346,288 @@ def get_all_transactions(filter_type="すべて") -> List[Tuple]:
         # Using nested select: select(*, assets(symbol, name))
         
         query = client.table("transactions").select("*, assets(symbol, name)").order("date", desc=True)
-        
-        if filter_type == "コストあり (Buy/Sell)":
-            query = query.in_("type", COST_BASED_TYPES)
-        elif filter_type == "コストなし (報酬等)":
-            query = query.in_("type", COST_FREE_TYPES)
+        query = _apply_type_filter(query, filter_type)
             
         res = query.execute()
-        
-        transactions = []
-        for t in res.data:
-            # Flatten structure
-            asset = t.get('assets') or {}
-            transactions.append((
-                t['id'],
-                t['date'], # ISO string
-                t['type'],
-                asset.get('symbol', 'UNKNOWN'),
-                asset.get('name', 'Unknown'),
-                t['quantity'],
-                t['price_per_unit'],
-                t['total_amount'],
-                t['notes'],
-                t['asset_id']
-            ))
-        return transactions
+        return [_to_transaction_tuple(t) for t in res.data]
     except Exception as e:
         st.error(f"Error fetching transactions: {e}")
         return []
 
+def get_transactions_page(filter_type="すべて", limit: int = 50, cursor: Optional[Tuple[str, int]] = None) -> Tuple[List[Tuple], Optional[Tuple[str, int]]]:
+    """
+    Get one page of transactions, newest first, using a keyset cursor on (date, id).
+    cursor: (date, id) of the last row of the previous page, or None for the first page
+    Returns: (rows, next_cursor). rows have the same shape as get_all_transactions;
+    next_cursor is None on the last page.
+    """
+    client = get_client()
+    if not client: return [], None
+    
+    try:
+        query = client.table("transactions")\
+            .select("*, assets(symbol, name)")\
+            .order("date", desc=True)\
+            .order("id", desc=True)\
+            .limit(limit + 1)
+        query = _apply_type_filter(query, filter_type)
+        
+        if cursor is not None:
+            last_date, last_id = cursor
+            query = query.or_(f'date.lt."{last_date}",and(date.eq."{last_date}",id.lt.{int(last_id)})')
+        
+        res = query.execute()
+        rows = [_to_transaction_tuple(t) for t in res.data[:limit]]
+        
+        # One extra row tells whether another page exists
+        next_cursor = None
+        if len(res.data) > limit and rows:
+            next_cursor = (rows[-1][1], rows[-1][0])
+        return rows, next_cursor
+    except Exception as e:
+        st.error(f"Error fetching transactions: {e}")
+        return [], None
+
+def count_transactions(filter_type="すべて") -> int:
+    """Number of transactions matching the page filter (served from the in-memory ledger)"""
+    ledger = get_ledger()
+    if filter_type == "コストあり (Buy/Sell)":
+        return ledger.count_types(COST_BASED_TYPES)
+    elif filter_type == "コストなし (報酬等)":
+        return ledger.count_types(COST_FREE_TYPES)
+    return len(ledger)
+
+# --- Ledger (shared by aggregation functions) ---
+
+# PostgREST returns at most this many rows per request (Supabase default max-rows)
+LEDGER_PAGE_SIZE = 1000
+# Minimum seconds between two delta syncs (collapses calls within one rerun)
+LEDGER_SYNC_INTERVAL = 5
+# Full reload interval: with change markers (ledger_sync.sql) / without them
+LEDGER_FULL_RELOAD_TRACKED = 24 * 3600
+LEDGER_FULL_RELOAD_UNTRACKED = 600
+# Rows whose updated_at is within this window of the watermark are re-read,
+# so that transactions committed late with an older timestamp are not missed
+LEDGER_LOOKBACK_SECONDS = 30
+
+def _fetch_pages(build_query) -> List[Dict]:
+    """Run build_query() page by page (ordered by id) and collect every row"""
+    rows = []
+    offset = 0
+    while True:
+        res = build_query().order("id").range(offset, offset + LEDGER_PAGE_SIZE - 1).execute()
+        rows.extend(res.data)
+        if len(res.data) < LEDGER_PAGE_SIZE:
+            return rows
+        offset += LEDGER_PAGE_SIZE
+
+def _parse_ts(value) -> Optional[pd.Timestamp]:
+    return pd.Timestamp(value) if value else None
+
+class _LedgerSync:
+    """
+    Process-wide ledger kept in sync with the transactions table.
+
+    Only rows past the watermarks are downloaded:
+    - inserts: id greater than the highest id seen
+    - updates / deletes: updated_at and transaction_deletions.deleted_at markers
+      (see ledger_sync.sql); without them edits from other sessions are picked
+      up by a periodic full reload
+    - local writes: ids passed to mark_changed() are re-read by id
+
+    Rows applied by apply_local() do not move the watermarks: inserts from other
+    sessions may have ids below a local insert, so the next sync still reads
+    everything past the last *synced* id and updated_at.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ledger: Optional[TransactionLedger] = None
+        # Highest id read from the server (local inserts are not counted)
+        self.synced_max_id = 0
+        self.tracking = True
+        self.updated_watermark: Optional[pd.Timestamp] = None
+        self.deleted_watermark: Optional[pd.Timestamp] = None
+        self.recent_updates: Dict[int, pd.Timestamp] = {}
+        self.pending_ids = set()
+        self.dirty = False
+        self.last_sync = 0.0
+        self.last_full_sync = 0.0
+
+    def get(self, client: CustomSupabaseClient) -> TransactionLedger:
+        with self.lock:
+            now = time.monotonic()
+            full_interval = LEDGER_FULL_RELOAD_TRACKED if self.tracking else LEDGER_FULL_RELOAD_UNTRACKED
+            if self.ledger is None or now - self.last_full_sync > full_interval:
+                self._full_reload(client)
+                self.last_full_sync = now
+            elif self.dirty or now - self.last_sync >= LEDGER_SYNC_INTERVAL:
+                self._sync(client)
+            self.last_sync = now
+            return self.ledger
+
+    def mark_changed(self, transaction_ids=()):
+        with self.lock:
+            self.dirty = True
+            self.pending_ids.update(int(i) for i in transaction_ids)
+
+    def apply_local(self, rows: List[Dict]):
+        """Apply rows returned by a local insert without another round trip"""
+        with self.lock:
+            if self.ledger is None or not rows:
+                return
+            self.ledger = self.ledger.apply_changes(rows)
+
+    def _full_reload(self, client: CustomSupabaseClient):
+        rows = None
+        if self.tracking:
+            try:
+                rows = _fetch_pages(lambda: client.table("transactions").select(f"{LEDGER_COLUMNS}, updated_at"))
+                res = client.table("transaction_deletions")\
+                    .select("deleted_at")\
+                    .order("deleted_at", desc=True)\
+                    .limit(1)\
+                    .execute()
+                self.deleted_watermark = _parse_ts(res.data[0]["deleted_at"]) if res.data else None
+            except Exception as e:
+                print(f"Ledger change markers unavailable, syncing inserts only: {e}")
+                self.tracking = False
+                rows = None
+        if rows is None:
+            rows = _fetch_pages(lambda: client.table("transactions").select(LEDGER_COLUMNS))
+
+        version = self.ledger.version + 1 if self.ledger is not None else 0
+        ledger = TransactionLedger.from_rows(rows)
+        ledger.version = version
+        self.ledger = ledger
+        self.synced_max_id = ledger.max_id
+        self.recent_updates = {}
+        self.updated_watermark = None
+        self._track_updates(rows)
+        self.pending_ids.clear()
+        self.dirty = False
+
+    def _sync(self, client: CustomSupabaseClient):
+        ledger = self.ledger
+        max_id = self.synced_max_id
+        columns = f"{LEDGER_COLUMNS}, updated_at" if self.tracking else LEDGER_COLUMNS
+
+        # Inserts
+        rows = _fetch_pages(lambda: client.table("transactions").select(columns).gt("id", max_id))
+        new_max_id = max((r["id"] for r in rows), default=max_id)
+        deleted_ids = set()
+
+        # Updates / deletes from other sessions
+        if self.tracking:
+            if self.updated_watermark is not None:
+                since = (self.updated_watermark - pd.Timedelta(seconds=LEDGER_LOOKBACK_SECONDS)).isoformat()
+                updated = _fetch_pages(lambda: client.table("transactions")
+                                       .select(columns)
+                                       .lte("id", max_id)
+                                       .gte("updated_at", since))
+                rows.extend(r for r in updated if self.recent_updates.get(r["id"]) != _parse_ts(r["updated_at"]))
+
+            query = client.table("transaction_deletions").select("transaction_id, deleted_at")
+            if self.deleted_watermark is not None:
+                query = query.gte("deleted_at", self.deleted_watermark.isoformat())
+            for item in query.execute().data:
+                deleted_ids.add(item["transaction_id"])
+                ts = _parse_ts(item["deleted_at"])
+                if self.deleted_watermark is None or ts > self.deleted_watermark:
+                    self.deleted_watermark = ts
+
+        # Local writes: re-read by id, missing ids were deleted
+        if self.pending_ids:
+            pending = list(self.pending_ids)
+            res = client.table("transactions").select(columns).in_("id", pending).execute()
+            rows.extend(res.data)
+            found = {r["id"] for r in res.data}
+            deleted_ids.update(i for i in pending if i not in found)
+
+        # De-duplicate by id (last row wins) and apply the delta
+        by_id = {r["id"]: r for r in rows}
+        self.ledger = ledger.apply_changes(list(by_id.values()), deleted_ids)
+        self._track_updates(by_id.values())
+        self.synced_max_id = new_max_id
+        self.pending_ids.clear()
+        self.dirty = False
+
+    def _track_updates(self, rows):
+        """Advance the updated_at watermark and remember rows inside the lookback window"""
+        if not self.tracking:
+            return
+        for r in rows:
+            ts = _parse_ts(r.get("updated_at"))
+            if ts is None:
+                continue
+            self.recent_updates[r["id"]] = ts
+            if self.updated_watermark is None or ts > self.updated_watermark:
+                self.updated_watermark = ts
+        if self.updated_watermark is not None:
+            cutoff = self.updated_watermark - pd.Timedelta(seconds=LEDGER_LOOKBACK_SECONDS)
+            self.recent_updates = {i: ts for i, ts in self.recent_updates.items() if ts >= cutoff}
+
+_ledger_sync: Optional[_LedgerSync] = None
+_ledger_sync_lock = threading.Lock()
+
+def _get_ledger_sync() -> _LedgerSync:
+    """Process-wide ledger sync (module global, so background threads can use it too)"""
+    global _ledger_sync
+    with _ledger_sync_lock:
+        if _ledger_sync is None:
+            _ledger_sync = _LedgerSync()
+        return _ledger_sync
+
+def get_ledger() -> TransactionLedger:
+    """Columnar ledger of all transactions, synced incrementally"""
+    client = get_client()
+    if not client: return TransactionLedger.empty()
+    
+    try:
+        return _get_ledger_sync().get(client)
+    except Exception as e:
+        st.error(f"Error fetching transactions: {e}")
+        return TransactionLedger.empty()
+
+def mark_ledger_changed(transaction_ids=()):
+    """Force a ledger sync on the next read (re-reading the given ids)"""
+    _get_ledger_sync().mark_changed(transaction_ids)
+    _bump_data_version()
+
+# USD/JPY rate per ledger row, keyed by (ledger version, FX table version)
+_ledger_fx_cache: Dict[str, Any] = {"key": None, "rates": None}
+_ledger_fx_lock = threading.Lock()
+
+def get_ledger_fx_rates(ledger: Optional[TransactionLedger] = None):
+    """
+    USD/JPY rate for each ledger row on its own transaction date (as-of join against
+    the daily FX table). Recomputed only when the ledger or the FX table changes.
+    """
+    ledger = ledger if ledger is not None else get_ledger()
+    key = (ledger.version, len(ledger), get_fx_version())
+    with _ledger_fx_lock:
+        if _ledger_fx_cache["key"] != key:
+            _ledger_fx_cache["rates"] = rates_as_of(ledger.dates)
+            _ledger_fx_cache["key"] = key
+        return _ledger_fx_cache["rates"]
+
+def _to_jst_iso(date_obj) -> str:
+    """
+    Convert a date/datetime to an ISO string with JST timezone.
+    Naive datetimes are treated as JST (user's local time).
+    """
+    if isinstance(date_obj, datetime):
+        # Add JST timezone info if naive datetime
+        if date_obj.tzinfo is None:
+            date_obj = date_obj.replace(tzinfo=JST)
+        return date_obj.isoformat()
+    elif isinstance(date_obj, date):
+        # Convert date to datetime at midnight JST
+        dt = datetime.combine(date_obj, datetime.min.time())
+        dt = dt.replace(tzinfo=JST)
+        return dt.isoformat()
+    return str(date_obj)
+
 def add_transaction(date_obj, trans_type, asset_id, quantity, price_per_unit, total_amount, notes="", skip_duplicate_check=False) -> bool:
     client = get_client()
     if not client: return False
@@ -193,20 +640,7 @@ def add_transaction(date_obj, trans_type, asset_id, quantity, price_per_unit, to
              pass
 
     try:
-        # Convert date to ISO string with JST timezone
-        # Treat the input datetime as JST (user's local time)
-        if isinstance(date_obj, datetime):
-            # Add JST timezone info if naive datetime
-            if date_obj.tzinfo is None:
-                date_obj = date_obj.replace(tzinfo=JST)
-            date_str = date_obj.isoformat()
-        elif isinstance(date_obj, date):
-            # Convert date to datetime at midnight JST
-            dt = datetime.combine(date_obj, datetime.min.time())
-            dt = dt.replace(tzinfo=JST)
-            date_str = dt.isoformat()
-        else:
-            date_str = str(date_obj)
+        date_str = _to_jst_iso(date_obj)
 
         data = {
             "date": date_str,
@@ -217,7 +651,9 @@ def add_transaction(date_obj, trans_type, asset_id, quantity, price_per_unit, to
             "total_amount": total_amount,
             "notes": notes
         }
-        client.table("transactions").insert(data).execute()
+        res = client.table("transactions").insert(data).execute()
+        _get_ledger_sync().apply_local(res.data)
+        _bump_data_version()
         return True
     except Exception as e:
         st.error(f"登録エラー: {e}")
@@ -228,17 +664,7 @@ def update_transaction(transaction_id, date_obj, trans_type, asset_id, quantity,
     if not client: return False
     
     try:
-        # Convert date to ISO string with JST timezone
-        if isinstance(date_obj, datetime):
-            if date_obj.tzinfo is None:
-                date_obj = date_obj.replace(tzinfo=JST)
-            date_str = date_obj.isoformat()
-        elif isinstance(date_obj, date):
-            dt = datetime.combine(date_obj, datetime.min.time())
-            dt = dt.replace(tzinfo=JST)
-            date_str = dt.isoformat()
-        else:
-            date_str = str(date_obj)
+        date_str = _to_jst_iso(date_obj)
             
         data = {
             "date": date_str,
@@ -250,6 +676,7 @@ def update_transaction(transaction_id, date_obj, trans_type, asset_id, quantity,
             "notes": notes
         }
         client.table("transactions").update(data).eq("id", transaction_id).execute()
+        mark_ledger_changed([transaction_id])
         return True
     except Exception as e:
         st.error(f"更新エラー: {e}")
@@ -260,42 +687,176 @@ def delete_transaction(transaction_id) -> bool:
     if not client: return False
     try:
         client.table("transactions").delete().eq("id", transaction_id).execute()
+        mark_ledger_changed([transaction_id])
         return True
     except Exception as e:
         st.error(f"削除エラー: {e}")
         return False
 
+# Rows per insert request in add_transactions_bulk
+BULK_INSERT_CHUNK_SIZE = 500
+
+def _normalize_transaction_date(value, naive_tz: timezone = JST) -> str:
+    """Normalize a date/datetime/ISO string to an ISO string with offset (naive = naive_tz)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if not isinstance(value, (datetime, date)):
+        raise ValueError(f"不正な日時です: {value!r}")
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=naive_tz)
+    return value.isoformat()
+
+def add_transactions_bulk(rows: List[Dict], chunk_size: int = BULK_INSERT_CHUNK_SIZE,
+                          skip_duplicates: bool = True, tolerance_minutes: int = 5,
+                          client: Optional[CustomSupabaseClient] = None,
+                          naive_tz: timezone = JST) -> List[Dict]:
+    """
+    Insert many transactions with batched validation and duplicate checking.
+    
+    Args:
+        rows: [{date, type, asset_id, quantity, price_per_unit, total_amount?, notes?}, ...]
+              total_amount defaults to quantity * price_per_unit
+        chunk_size: rows per insert request
+        skip_duplicates: do not insert rows that match an existing (or earlier in
+                         the batch) transaction of the same asset and quantity
+                         within ±tolerance_minutes
+        client: explicit client (scripts); defaults to the shared client
+        naive_tz: timezone for dates without an offset (JST, like add_transaction)
+    
+    Returns:
+        one result per input row, in order:
+        {'index': int, 'status': 'inserted'|'duplicate'|'invalid'|'error',
+         'id': int or None, 'message': str or None}
+        With skip_duplicates=False, suspected duplicates are inserted and keep
+        the warning in 'message'.
+    """
+    use_shared = client is None
+    if use_shared:
+        client = get_client()
+    results = [{'index': i, 'status': 'error', 'id': None, 'message': None} for i in range(len(rows))]
+    if not client:
+        for r in results:
+            r['message'] = "Client init failed"
+        return results
+    if not rows:
+        return results
+
+    # 1. Validate and normalize
+    valid = []  # (index, data)
+    for i, row in enumerate(rows):
+        try:
+            trans_type = row.get("type")
+            if trans_type not in VALID_TRANSACTION_TYPES:
+                raise ValueError(f"不正な取引タイプです: {trans_type}")
+            quantity = float(row["quantity"])
+            price = float(row.get("price_per_unit") or 0.0)
+            ok, msg = validate_quantity(quantity)
+            if not ok:
+                raise ValueError(msg)
+            ok, msg = validate_price(price)
+            if not ok:
+                raise ValueError(msg)
+            total = row.get("total_amount")
+            valid.append((i, {
+                "date": _normalize_transaction_date(row["date"], naive_tz),
+                "type": trans_type,
+                "asset_id": int(row["asset_id"]),
+                "quantity": quantity,
+                "price_per_unit": price,
+                "total_amount": float(total) if total is not None else quantity * price,
+                "notes": row.get("notes") or ""
+            }))
+        except (KeyError, TypeError, ValueError) as e:
+            results[i]['status'] = 'invalid'
+            results[i]['message'] = str(e) if not isinstance(e, KeyError) else f"必須項目がありません: {e}"
+
+    if not valid:
+        return results
+
+    # 2. De-duplicate against the database (one range query) and within the batch
+    tolerance = tolerance_minutes * 60
+    epochs = to_epoch_seconds([d["date"] for _, d in valid])
+    asset_ids = sorted({d["asset_id"] for _, d in valid})
+    since = datetime.fromtimestamp(int(epochs.min()) - tolerance, tz=timezone.utc).isoformat()
+    until = datetime.fromtimestamp(int(epochs.max()) + tolerance, tz=timezone.utc).isoformat()
+    try:
+        existing = _fetch_pages(lambda: client.table("transactions")
+                                .select(LEDGER_COLUMNS)
+                                .in_("asset_id", asset_ids)
+                                .gte("date", since)
+                                .lte("date", until))
+    except Exception as e:
+        for i, _ in valid:
+            results[i]['message'] = f"重複チェックエラー: {e}"
+        return results
+
+    window = TransactionLedger.from_rows(existing)
+    batch_index = {}  # asset_id -> sorted [(epoch, quantity)] of rows accepted so far
+    to_insert = []
+    for (i, data), epoch in zip(valid, epochs):
+        epoch = int(epoch)
+        seen = batch_index.setdefault(data["asset_id"], [])
+        lo = bisect.bisect_left(seen, (epoch - tolerance, float("-inf")))
+        hi = bisect.bisect_right(seen, (epoch + tolerance, float("inf")))
+        in_batch = quantity_matches([q for _, q in seen[lo:hi]], data["quantity"]).any()
+        if in_batch or len(window.find_near(data["asset_id"], epoch, tolerance, data["quantity"])) > 0:
+            results[i]['message'] = "類似した取引が存在します"
+            if skip_duplicates:
+                results[i]['status'] = 'duplicate'
+                continue
+        bisect.insort(seen, (epoch, data["quantity"]))
+        to_insert.append((i, data))
+
+    # 3. Insert in chunks
+    inserted_rows = []
+    for start in range(0, len(to_insert), chunk_size):
+        chunk = to_insert[start:start + chunk_size]
+        try:
+            res = client.table("transactions").insert([data for _, data in chunk]).execute()
+            for (i, _), item in zip(chunk, res.data):
+                results[i]['status'] = 'inserted'
+                results[i]['id'] = item.get('id')
+            inserted_rows.extend(res.data)
+        except Exception as e:
+            for i, _ in chunk:
+                results[i]['status'] = 'error'
+                results[i]['message'] = f"登録エラー: {e}"
+
+    if use_shared and inserted_rows:
+        _get_ledger_sync().apply_local(inserted_rows)
+        _bump_data_version()
+
+    return results
+
 def check_duplicate_transactions(date_obj, asset_id, quantity, tolerance_minutes=5):
     """
     Simple check if same asset and quantity exists around the time.
+    The window is looked up in the ledger's per-asset sorted date index,
+    so only actual matches are fetched from the database.
     """
     client = get_client()
     if not client: return False, []
     
     try:
-        # We can't easily do date range math in simple Postgrest filter query without custom function.
-        # So we fetch all transactions for that asset with that quantity, and filter in Python.
-        # This is safe because user won't have infinite transactions for exactly same qty of same asset.
+        target_ts = int(to_epoch_seconds([_to_jst_iso(date_obj)])[0])
+        ids = get_ledger().find_near(asset_id, target_ts, tolerance_minutes * 60, quantity)
+        if len(ids) == 0:
+            return False, []
         
         res = client.table("transactions")\
-            .select("*, assets(symbol)")\
-            .eq("asset_id", asset_id)\
-            .eq("quantity", quantity)\
+            .select("id, date, type, quantity, assets(symbol)")\
+            .in_("id", [int(i) for i in ids])\
             .execute()
             
         similar = []
-        target_ts = pd.to_datetime(date_obj).timestamp()
-        
         for t in res.data:
-            existing_ts = pd.to_datetime(t['date']).timestamp()
-            diff = abs(target_ts - existing_ts)
-            if diff <= tolerance_minutes * 60:
-                # Add to similar
-                asset = t.get('assets') or {}
-                # Format similar to resemble SQLite result tuple: (id, date, type, symbol, quantity)
-                similar.append((
-                    t['id'], t['date'], t['type'], asset.get('symbol', ''), t['quantity']
-                ))
+            asset = t.get('assets') or {}
+            # Format similar to resemble SQLite result tuple: (id, date, type, symbol, quantity)
+            similar.append((
+                t['id'], t['date'], t['type'], asset.get('symbol', ''), t['quantity']
+            ))
         
         return len(similar) > 0, similar
         
@@ -334,24 +895,9 @@ def get_portfolio_data() -> Tuple[List[Tuple], int, int]:
     transaction_count = 0
     
     if not used_balances_table:
-        all_trans = get_all_transactions("すべて")
-        transaction_count = len(all_trans)
-        
-        # Calculate holdings in Python
-        for t in all_trans:
-            # (id, date, type, symbol, name, quantity, price, total, notes, asset_id)
-            t_type = t[2]
-            qty = t[5]
-            aid = t[9]
-            
-            current_qty = balances_map.get(aid, 0.0)
-            
-            if t_type in ['Buy', 'Airdrop', 'Staking Reward', 'Interest', 'Gift']:
-                current_qty += qty
-            elif t_type in ['Sell', 'Transfer']:
-                current_qty -= qty
-                
-            balances_map[aid] = current_qty
+        ledger = get_ledger()
+        transaction_count = len(ledger)
+        balances_map = ledger.holdings()
     else:
         # If using balances table, efficiently get transaction count
         try:
@@ -383,107 +929,45 @@ def get_portfolio_data() -> Tuple[List[Tuple], int, int]:
     
     return portfolio, len(assets), transaction_count
 
+def get_held_api_ids(client: Optional[CustomSupabaseClient] = None) -> List[str]:
+    """
+    API IDs of assets with a positive balance (used by the background price refresher).
+    With an explicit client, no Streamlit functions are called (safe from background threads).
+    """
+    client = client or get_client()
+    if not client: return []
+    
+    try:
+        holdings = _get_ledger_sync().get(client).holdings()
+        res = client.table("assets").select("id, api_id").execute()
+    except Exception as e:
+        print(f"Error fetching held assets: {e}")
+        return []
+    return [a['api_id'] for a in res.data if a.get('api_id') and holdings.get(a['id'], 0.0) > 0.00000001]
+
 def calculate_cost_basis() -> Dict:
     """
     Calculate avg cost basis.
     Returns: { asset_id: {avg_cost, holdings, total_cost} }
     """
-    # Simply reuse transaction data logic
-    # We need all transactions again? Yes. 
-    # Optimally we cache transactions in st.session_state if heavy.
-    
-    all_trans = get_all_transactions("すべて")
-    # item: (id, date, type, symbol, name, quantity, price, total, notes, asset_id)
-    
-    data = {} # asset_id -> {total_cost, total_bought, total_sold}
-    
-    for t in all_trans:
-        t_type = t[2]
-        qty = t[5]
-        total = t[7]
-        aid = t[9]
-        
-        if aid not in data:
-            data[aid] = {'cost': 0.0, 'bought': 0.0, 'sold': 0.0}
-            
-        if t_type == 'Buy':
-            data[aid]['cost'] += total
-            data[aid]['bought'] += qty
-        elif t_type == 'Sell':
-            data[aid]['sold'] += qty
-            
-    cost_basis = {}
-    for aid, vals in data.items():
-        bought = vals['bought']
-        cost = vals['cost']
-        sold = vals['sold']
-        
-        if bought > 0:
-            avg_cost = cost / bought
-            holdings = bought - sold
-            # Note: This is simple average cost. 
-            # If current holdings < 0 (impossible theoretically but maybe data error), we clamp?
-            # Or just calc as is.
-            
-            cost_basis[aid] = {
-                'avg_cost': avg_cost,
-                'holdings': holdings,
-                'total_cost': avg_cost * holdings 
-            }
-            
-    return cost_basis
+    return get_ledger().cost_basis()
 
-def get_statistics(start_date=None, end_date=None):
+def get_statistics(start_date=None, end_date=None, with_jpy=False):
     """
     Get aggregated stats (Total Inv, Total Sales, etc.) with date filter.
+    with_jpy=True also returns total_investment_jpy / total_sales_jpy, each row
+    converted at the USD/JPY rate of its own date.
     """
-    all_trans = get_all_transactions("すべて")
+    ledger = get_ledger()
+    mask = ledger.date_mask(start_date, end_date)
     
-    # Filter by date in Python
-    filtered = []
-    for t in all_trans:
-        # t[1] is iso formatted date string or datetime
-        d_val = pd.to_datetime(t[1])
-        # Remove timezone info for comparison (Supabase returns tz-aware timestamps)
-        if d_val.tzinfo is not None:
-            d_val = d_val.tz_localize(None)
-        
-        if start_date:
-            start_dt = pd.to_datetime(start_date)
-            if start_dt.tzinfo is not None:
-                start_dt = start_dt.tz_localize(None)
-            if d_val < start_dt:
-                continue
-        if end_date:
-            end_dt = pd.to_datetime(end_date)
-            if end_dt.tzinfo is not None:
-                end_dt = end_dt.tz_localize(None)
-            if d_val > end_dt:
-                continue
-        filtered.append(t)
-        
-    total_investment = 0.0
-    total_sales = 0.0
+    total_investment, total_sales = ledger.buy_sell_totals(mask)
+    jpy_totals = {}
+    if with_jpy:
+        investment_jpy, sales_jpy = ledger.buy_sell_totals(mask, rates=get_ledger_fx_rates(ledger))
+        jpy_totals = {"total_investment_jpy": investment_jpy, "total_sales_jpy": sales_jpy}
     # Holdings calculation similar to get_portfolio_data but for filtered transactions
-    holdings_map = {} 
-    
-    for t in filtered:
-        t_type = t[2]
-        qty = t[5]
-        total = t[7]
-        aid = t[9]
-        
-        if t_type == 'Buy':
-            total_investment += total
-        elif t_type == 'Sell':
-            total_sales += total
-            
-        current_qty = holdings_map.get(aid, 0.0)
-        if t_type in ['Buy', 'Airdrop', 'Staking Reward', 'Interest', 'Gift']:
-            current_qty += qty
-        elif t_type in ['Sell', 'Transfer']:
-            current_qty -= qty
-        holdings_map[aid] = current_qty
+    holdings_map = ledger.holdings(mask)
 
     # Build holdings list for stats
     # Expected: list of (symbol, name, api_id, icon_url, holdings) desc
@@ -506,31 +990,79 @@ def get_statistics(start_date=None, end_date=None):
     return {
         "total_investment": total_investment,
         "total_sales": total_sales,
-        "transaction_count": len(filtered),
-        "holdings": holdings_list
+        "transaction_count": int(mask.sum()),
+        "holdings": holdings_list,
+        **jpy_totals
     }
 
 def get_current_year_investment_sales():
     """Specific helper for app.py dashboard logic (current year P/L)"""""
     current_year = datetime.now().year
     
-    # Fetch all transactions is easier than custom SQL
-    all_trans = get_all_transactions("すべて")
-    
-    inv = 0.0
-    sales = 0.0
-    
-    for t in all_trans:
-        d = pd.to_datetime(t[1])
-        if d.year == current_year:
-            t_type = t[2]
-            total = t[7]
-            if t_type == 'Buy':
-                inv += total
-            elif t_type == 'Sell':
-                sales += total
-                
-    return inv, sales
+    return get_ledger().year_totals(current_year)
+
+def _dashboard_from_payload(payload: Dict) -> Dict:
+    """get_dashboard_payload の結果を get_portfolio_data / calculate_cost_basis と同じ形に変換"""
+    portfolio = []
+    cost_basis = {}
+    year_investment = 0.0
+    year_sales = 0.0
+    for a in payload.get('assets') or []:
+        aid = a['id']
+        holdings = float(a.get('holdings') or 0)
+        bought = float(a.get('bought') or 0)
+        year_investment += float(a.get('ytd_buy') or 0)
+        year_sales += float(a.get('ytd_sell') or 0)
+        if holdings > 0.00000001:
+            portfolio.append((
+                aid, a['symbol'], a['name'], a['api_id'],
+                a.get('icon_url') or '', a.get('location') or '', holdings
+            ))
+        if bought > 0:
+            avg_cost = float(a.get('buy_cost') or 0) / bought
+            cb_holdings = bought - float(a.get('sold') or 0)
+            cost_basis[aid] = {
+                'avg_cost': avg_cost,
+                'holdings': cb_holdings,
+                'total_cost': avg_cost * cb_holdings
+            }
+    portfolio.sort(key=lambda x: x[6], reverse=True)
+    return {
+        'portfolio': portfolio,
+        'asset_count': int(payload.get('asset_count') or 0),
+        'transaction_count': int(payload.get('transaction_count') or 0),
+        'cost_basis': cost_basis,
+        'year_investment': year_investment,
+        'year_sales': year_sales
+    }
+
+def get_dashboard_data(year: Optional[int] = None) -> Dict:
+    """
+    Dashboard numbers in one round trip (dashboard.sql: get_dashboard_payload).
+    Falls back to the per-request helpers when the function is not installed.
+    Returns: {portfolio, asset_count, transaction_count, cost_basis,
+              year_investment, year_sales}
+    """
+    year = year or datetime.now().year
+    client = get_client()
+    if client:
+        try:
+            res = client.rpc("get_dashboard_payload", {"p_year": year}).execute()
+            if isinstance(res.data, dict):
+                return _dashboard_from_payload(res.data)
+        except Exception as e:
+            print(f"get_dashboard_payload unavailable, falling back: {e}")
+
+    portfolio, asset_count, transaction_count = get_portfolio_data()
+    year_investment, year_sales = get_ledger().year_totals(year)
+    return {
+        'portfolio': portfolio,
+        'asset_count': asset_count,
+        'transaction_count': transaction_count,
+        'cost_basis': calculate_cost_basis(),
+        'year_investment': year_investment,
+        'year_sales': year_sales
+    }
 
 # --- Snapshots ---
 
@@ -612,34 +1144,67 @@ def get_snapshot_count() -> int:
 
 # --- Price Cache (for API rate limit fallback) ---
 
-def save_price_cache(prices_data: Dict) -> bool:
+# Rows per upsert request when saving the price cache
+PRICE_CACHE_CHUNK_SIZE = 500
+
+# Last price cache write: {rows, chunks, elapsed_ms, at}
+_price_cache_write_stats: Dict[str, Any] = {}
+
+def _write_price_cache(client: CustomSupabaseClient, rows: List[Dict]) -> bool:
+    start = time.perf_counter()
+    try:
+        for i in range(0, len(rows), PRICE_CACHE_CHUNK_SIZE):
+            chunk = rows[i:i + PRICE_CACHE_CHUNK_SIZE]
+            client.table("price_cache").upsert(chunk, on_conflict="api_id").execute()
+        return True
+    except Exception as e:
+        print(f"Price cache save error: {e}")
+        return False
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _price_cache_write_stats.update({
+            "rows": len(rows),
+            "chunks": (len(rows) - 1) // PRICE_CACHE_CHUNK_SIZE + 1,
+            "elapsed_ms": elapsed_ms,
+            "at": datetime.now(JST).isoformat(),
+        })
+        logger.debug("price_cache: %d rows upserted in %.0f ms", len(rows), elapsed_ms)
+
+def save_price_cache(prices_data: Dict, background: bool = False,
+                     client: Optional[CustomSupabaseClient] = None) -> bool:
     """
-    価格データをSupabaseにキャッシュとして保存
+    価格データをSupabaseにキャッシュとして保存 (一括upsert)
     prices_data: {api_id: {usd, jpy, usd_24h_change, jpy_24h_change}}
+    background: Trueの場合は別スレッドで書き込み、描画をブロックしない
+    client: 明示的なクライアント (バックグラウンドスレッド用)。省略時は共有クライアント
     """
-    client = get_client()
+    client = client or get_client()
     if not client or not prices_data:
         return False
     
-    try:
-        now = datetime.now(JST).isoformat()
-        
-        # 各通貨の価格をupsert
-        for api_id, data in prices_data.items():
-            if data.get("usd") is not None:
-                cache_data = {
-                    "api_id": api_id,
-                    "price_usd": data.get("usd"),
-                    "price_jpy": data.get("jpy"),
-                    "usd_24h_change": data.get("usd_24h_change"),
-                    "updated_at": now
-                }
-                client.table("price_cache").upsert(cache_data, on_conflict="api_id").execute()
-        
-        return True
-    except Exception as e:
-        print(f"Price cache save error: {e}")
+    now = datetime.now(JST).isoformat()
+    rows = [
+        {
+            "api_id": api_id,
+            "price_usd": data.get("usd"),
+            "price_jpy": data.get("jpy"),
+            "usd_24h_change": data.get("usd_24h_change"),
+            "updated_at": now
+        }
+        for api_id, data in prices_data.items()
+        if data.get("usd") is not None
+    ]
+    if not rows:
         return False
+    
+    if background:
+        threading.Thread(target=_write_price_cache, args=(client, rows), daemon=True).start()
+        return True
+    return _write_price_cache(client, rows)
+
+def get_price_cache_write_stats() -> Dict[str, Any]:
+    """直近の価格キャッシュ書き込み (行数, チャンク数, 経過ミリ秒, 時刻)"""
+    return dict(_price_cache_write_stats)
 
 def load_price_cache() -> Dict:
     """
@@ -668,50 +1233,50 @@ def load_price_cache() -> Dict:
         return {}
 
 
+def _cache_age_seconds(updated_at) -> Optional[float]:
+    """updated_at からの経過秒数（タイムゾーン情報がない場合はJSTとして扱う）"""
+    if not updated_at:
+        return None
+    try:
+        # ISO形式のタイムスタンプをパース
+        if isinstance(updated_at, str):
+            cache_time = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
+        else:
+            cache_time = updated_at
+        if cache_time.tzinfo is None:
+            cache_time = cache_time.replace(tzinfo=JST)
+        return (datetime.now(JST) - cache_time).total_seconds()
+    except Exception as e:
+        print(f"Cache time parse error: {e}")
+        return None
+
 def is_cache_valid(cache_data: Dict, max_age_minutes: int = 5) -> bool:
     """
-    キャッシュが有効期限内かチェック
+    キャッシュの全エントリが有効期限内かチェック (cache_data は変更しない)
     
     Args:
         cache_data: キャッシュデータ（updated_atを含む）
         max_age_minutes: キャッシュの有効期限（分）
     
     Returns:
-        True if cache is still valid
+        True if every entry is still valid
     """
     if not cache_data:
         return False
-    
-    # 任意のエントリのupdated_atをチェック
-    for api_id, data in cache_data.items():
-        updated_at = data.get("updated_at")
-        if updated_at:
-            try:
-                # ISO形式のタイムスタンプをパース
-                if isinstance(updated_at, str):
-                    cache_time = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
-                else:
-                    cache_time = updated_at
-                
-                # タイムゾーン情報がない場合はJSTとして扱う
-                if cache_time.tzinfo is None:
-                    cache_time = cache_time.replace(tzinfo=JST)
-                
-                now = datetime.now(JST)
-                age = (now - cache_time).total_seconds() / 60  # 分単位
-                
-                return age < max_age_minutes
-            except Exception as e:
-                print(f"Cache time parse error: {e}")
-                return False
-    
-    return False
+    for data in cache_data.values():
+        age = _cache_age_seconds(data.get("updated_at"))
+        if age is None or age >= max_age_minutes * 60:
+            return False
+    return True
 
 
 def load_price_cache_if_valid(max_age_minutes: int = 5) -> Optional[Dict]:
     """
     有効期限内のキャッシュがあれば読み込む
     
+    期限切れのエントリの扱い (stale-while-revalidate) は price_service.get_prices と
+    バックグラウンド更新が行う。
+    
     Args:
         max_age_minutes: キャッシュの有効期限（分）
     
@@ -0,0 +1,411 @@
+"""
+為替レートサービス
+
+全ページ・チャート共通の為替レート。USD から各法定通貨 (FIAT_CURRENCIES) への
+日次レートをローカルの SQLite (fx_rates.db) に保存し、最新レートはメモリから返す。
+日次の履歴を持つのは USD/JPY (取引日のレートでの換算用)。取得はバックグラウンドスレッドが一定間隔で行う。
+
+レートが取得できない場合も固定値を黙って使わず、get_fx_status() で
+「いつのレートか」「フォールバック値か」を返して表示側で知らせる。
+
+取得元 (先に成功したもの):
+  1. Frankfurter (ECB の参照レート, 日次の履歴もここから埋める)
+  2. open.er-api.com
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from constants import FIAT_CURRENCIES
+from http_client import http_get
+
+JST = timezone(timedelta(hours=9))
+
+FX_DB_PATH = Path(__file__).parent / "fx_rates.db"
+FX_PAIR = "USDJPY"
+# どの取得元からも取れず、保存済みのレートもない場合の値
+DEFAULT_USD_JPY_RATE = 155.0
+# バックグラウンド更新の間隔と、失敗時のバックオフの上限 (秒)
+FX_REFRESH_INTERVAL = 3600
+FX_REFRESH_MAX_BACKOFF = 6 * 3600
+# 最後に取得できてからこの秒数を過ぎたレートは stale
+FX_STALE_SECONDS = 6 * 3600
+# 保存する日次履歴の日数 (過去の取引を取引日のレートで換算するため長めに持つ)
+FX_HISTORY_DAYS = 3650
+# 履歴の埋め戻しで1回に取得する日数
+FX_HISTORY_CHUNK_DAYS = 365
+FX_REQUEST_TIMEOUT = 5
+# レートが1件もないとき、描画中に同期取得を試みる間隔 (秒)
+FX_COLD_RETRY_SECONDS = 60
+
+FRANKFURTER_URL = "https://api.frankfurter.app"
+OPEN_ER_API_URL = "https://open.er-api.com/v6/latest/USD"
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(FX_DB_PATH, timeout=10)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            pair TEXT NOT NULL,
+            date TEXT NOT NULL,
+            rate REAL NOT NULL,
+            source TEXT,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (pair, date)
+        )
+    """)
+    return conn
+
+
+def _pair(currency: str) -> str:
+    return f"USD{currency}"
+
+
+def _save_rates(rows: List[Tuple[str, float]], source: str, fetched_at: float, pair: str = FX_PAIR):
+    """[(YYYY-MM-DD, rate), ...] を保存する (同じ日付は上書き)"""
+    if not rows:
+        return
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO fx_rates (pair, date, rate, source, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                [(pair, d, float(rate), source, fetched_at) for d, rate in rows]
+            )
+    finally:
+        conn.close()
+
+
+def _load_rates(since: Optional[str] = None, pair: str = FX_PAIR) -> List[Tuple[str, float, str, float]]:
+    """[(date, rate, source, fetched_at), ...] を日付順に返す"""
+    conn = _connect()
+    try:
+        return conn.execute(
+            "SELECT date, rate, source, fetched_at FROM fx_rates WHERE pair = ? AND date >= ? ORDER BY date",
+            (pair, since or "")
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def _load_last_two(pair: str) -> List[Tuple[str, float, str, float]]:
+    """最新と、その前の日付のレート (新しい順, 最大2件)"""
+    conn = _connect()
+    try:
+        return conn.execute(
+            "SELECT date, rate, source, fetched_at FROM fx_rates WHERE pair = ? ORDER BY date DESC LIMIT 2",
+            (pair,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def _fetch_latest() -> Optional[Tuple[str, Dict[str, float], str]]:
+    """
+    最新レートを取得して (date, {通貨: 1 USD あたりのレート}, source) を返す。
+    JPY を含む応答が得られなければ None
+    """
+    try:
+        response = http_get(f"{FRANKFURTER_URL}/latest", params={"from": "USD", "to": ",".join(FIAT_CURRENCIES)},
+                            timeout=FX_REQUEST_TIMEOUT, retries=0)
+        if response is not None and response.status_code == 200:
+            data = response.json()
+            rates = {c: r for c, r in data.get("rates", {}).items() if c in FIAT_CURRENCIES and r}
+            if rates.get("JPY"):
+                return data.get("date") or datetime.now(JST).date().isoformat(), rates, "frankfurter"
+    except Exception as e:
+        print(f"[fx] frankfurter latest failed: {e}")
+
+    try:
+        response = http_get(OPEN_ER_API_URL, timeout=FX_REQUEST_TIMEOUT, retries=0)
+        if response is not None and response.status_code == 200:
+            data = response.json()
+            rates = {c: r for c, r in data.get("rates", {}).items() if c in FIAT_CURRENCIES and r}
+            if rates.get("JPY"):
+                updated = data.get("time_last_update_unix")
+                day = datetime.fromtimestamp(updated, tz=JST).date() if updated else datetime.now(JST).date()
+                return day.isoformat(), rates, "open.er-api"
+    except Exception as e:
+        print(f"[fx] open.er-api failed: {e}")
+    return None
+
+
+def _fetch_history(start: date, end: date) -> Dict[str, List[Tuple[str, float]]]:
+    """start〜end の日次レート {通貨: [(date, rate), ...]} (営業日のみ)。失敗時は空の辞書"""
+    try:
+        response = http_get(f"{FRANKFURTER_URL}/{start.isoformat()}..{end.isoformat()}",
+                            params={"from": "USD", "to": ",".join(FIAT_CURRENCIES)},
+                            timeout=FX_REQUEST_TIMEOUT * 2, retries=1)
+        if response is not None and response.status_code == 200:
+            rates = response.json().get("rates", {})
+            return {
+                c: sorted((d, r[c]) for d, r in rates.items() if r.get(c))
+                for c in FIAT_CURRENCIES
+            }
+    except Exception as e:
+        print(f"[fx] frankfurter history failed: {e}")
+    return {}
+
+
+class _FxService:
+    """最新レートをメモリに持ち、バックグラウンドで日次テーブルを更新する"""
+
+    def __init__(self, interval: float = FX_REFRESH_INTERVAL):
+        self.interval = interval
+        self.delay = interval
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        # {"date", "rate" (JPY), "rates", "previous", "source", "fetched_at"} (未取得なら None)
+        # rates / previous: {通貨: 最新の日付のレート / その前の日付のレート}
+        self.latest: Optional[Dict] = None
+        self.version = 0
+        self.last_error: Optional[str] = None
+        self.cold_attempted_at = 0.0
+        self.thread = threading.Thread(target=self._run, name="fx-refresher", daemon=True)
+        self._load_latest()
+
+    def start(self):
+        if not self.thread.is_alive():
+            self.thread.start()
+
+    def _load_latest(self):
+        """保存済みテーブルから各通貨の最新レートと前日のレートを読み込む"""
+        try:
+            last_two = {c: _load_last_two(_pair(c)) for c in FIAT_CURRENCIES}
+        except sqlite3.Error as e:
+            print(f"[fx] rate table read failed: {e}")
+            return
+        if not last_two.get("JPY"):
+            return
+        d, rate, source, fetched_at = last_two["JPY"][0]
+        with self.lock:
+            self.latest = {
+                "date": d, "rate": rate, "source": source, "fetched_at": fetched_at,
+                "rates": {c: rows[0][1] for c, rows in last_two.items() if rows},
+                "previous": {c: rows[1][1] for c, rows in last_two.items() if len(rows) > 1},
+            }
+
+    def refresh_latest(self, only_if_missing: bool = False) -> bool:
+        """最新レートを取得して保存する。取得できたら True"""
+        with self.refresh_lock:
+            if only_if_missing and self.latest is not None:
+                return True
+            fetched = _fetch_latest()
+            if fetched is None:
+                self.last_error = "all FX sources failed"
+                return False
+            d, rates, source = fetched
+            now = time.time()
+            for currency, rate in rates.items():
+                _save_rates([(d, rate)], source, now, pair=_pair(currency))
+            self._load_latest()
+            with self.lock:
+                self.version += 1
+            self.last_error = None
+            return True
+
+    def backfill_history(self):
+        """保存済みの最も新しい日付 (なければ FX_HISTORY_DAYS 日前) 以降の日次レートを埋める"""
+        today = datetime.now(JST).date()
+        start = today - timedelta(days=FX_HISTORY_DAYS)
+        rows = _load_rates(start.isoformat())
+        # 履歴の先頭が欠けている (初回など) ときは全期間、そうでなければ最後の日付以降だけ
+        if rows and date.fromisoformat(rows[0][0]) <= start + timedelta(days=7):
+            start = max(start, date.fromisoformat(rows[-1][0]) + timedelta(days=1))
+        if start >= today:
+            return
+        while start < today:
+            end = min(today, start + timedelta(days=FX_HISTORY_CHUNK_DAYS))
+            history = _fetch_history(start, end)
+            if not history.get("JPY"):
+                break
+            for currency, rows in history.items():
+                _save_rates(rows, "frankfurter", time.time(), pair=_pair(currency))
+            with self.lock:
+                self.version += 1
+            start = end + timedelta(days=1)
+
+    def _run(self):
+        while True:
+            # 最新レートを先に取得し (起動直後の仮レート表示を早く解消する)、履歴の補完はその後
+            try:
+                ok = self.refresh_latest()
+            except Exception as e:
+                ok = False
+                self.last_error = str(e)
+                print(f"[fx] refresh failed: {e}")
+            try:
+                self.backfill_history()
+            except Exception as e:
+                ok = False
+                self.last_error = str(e)
+                print(f"[fx] history backfill failed: {e}")
+            if ok:
+                self.failures = 0
+                self.delay = self.interval
+            else:
+                self.failures += 1
+                self.delay = min(self.interval * 2 ** self.failures, FX_REFRESH_MAX_BACKOFF)
+                print(f"[fx] 為替レート取得失敗 ({self.last_error})。{self.delay:.0f}秒後に再試行")
+            time.sleep(self.delay)
+
+
+_service: Optional[_FxService] = None
+_service_lock = threading.Lock()
+
+
+def _get_fx_service() -> _FxService:
+    """プロセスに1つの為替サービス (初回にバックグラウンド更新を開始する)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = _FxService()
+            _service.start()
+        return _service
+
+
+def start_fx_refresher():
+    """バックグラウンド為替更新を開始 (2回目以降は何もしない)"""
+    _get_fx_service()
+
+
+def get_usd_jpy_rate() -> float:
+    """
+    最新の USD/JPY レート
+
+    メモリ (起動時に保存済みテーブルから復元) から返す。まだなければ取得を試み
+    (FX_COLD_RETRY_SECONDS に1回まで)、それも失敗したら DEFAULT_USD_JPY_RATE (get_fx_status()["fallback"] が True になる)
+    """
+    service = _get_fx_service()
+    if service.latest is None and time.time() - service.cold_attempted_at > FX_COLD_RETRY_SECONDS:
+        service.cold_attempted_at = time.time()
+        service.refresh_latest(only_if_missing=True)
+    latest = service.latest
+    return latest["rate"] if latest else DEFAULT_USD_JPY_RATE
+
+
+def get_fx_status() -> Dict:
+    """
+    現在のレートの鮮度
+
+    Returns:
+        {rate, date, source, fetched_at, age_seconds, stale, fallback, last_error}
+        fallback=True は保存済みのレートもなく固定値を使っていることを示す
+    """
+    service = _get_fx_service()
+    latest = service.latest
+    if latest is None:
+        return {"rate": DEFAULT_USD_JPY_RATE, "date": None, "source": "default", "fetched_at": None,
+                "age_seconds": None, "stale": True, "fallback": True, "last_error": service.last_error}
+    age = time.time() - latest["fetched_at"]
+    return {
+        "rate": latest["rate"],
+        "date": latest["date"],
+        "source": latest["source"],
+        "fetched_at": datetime.fromtimestamp(latest["fetched_at"], tz=JST).isoformat(),
+        "age_seconds": age,
+        "stale": age > FX_STALE_SECONDS,
+        "fallback": False,
+        "last_error": service.last_error,
+    }
+
+
+def get_usd_rates(currencies: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    1 USD あたりの各通貨のレートと、前の日付からの変化率 (小数) のベクトル
+
+    USD は (1, 0)。レートのない通貨は NaN (JPY は DEFAULT_USD_JPY_RATE で補う)。
+    BTC など法定通貨以外は price_service 側で価格から求める。
+    """
+    latest = _get_fx_service().latest or {}
+    rates = latest.get("rates", {})
+    previous = latest.get("previous", {})
+    values = np.full(len(currencies), np.nan)
+    changes = np.zeros(len(currencies))
+    for i, currency in enumerate(currencies):
+        if currency == "USD":
+            values[i] = 1.0
+        elif currency in rates:
+            values[i] = rates[currency]
+            if previous.get(currency):
+                changes[i] = rates[currency] / previous[currency] - 1
+        elif currency == "JPY":
+            values[i] = DEFAULT_USD_JPY_RATE
+    return values, changes
+
+
+def get_fx_history(days: int = 30) -> List[Tuple[str, float]]:
+    """直近 days 日の日次レート [(YYYY-MM-DD, rate), ...] (営業日のみ, 日付順)"""
+    _get_fx_service()
+    since = (datetime.now(JST).date() - timedelta(days=days)).isoformat()
+    try:
+        return [(d, rate) for d, rate, _, _ in _load_rates(since)]
+    except sqlite3.Error as e:
+        print(f"[fx] rate table read failed: {e}")
+        return []
+
+
+def get_fx_version() -> int:
+    """レートテーブルが更新されるたびに増える番号 (キャッシュキー用)"""
+    return _get_fx_service().version
+
+
+_table_cache: Dict = {"version": None, "days": None, "rates": None}
+_table_lock = threading.Lock()
+
+
+def _fx_table() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (日付の JST 0時のエポック秒, レート) の日付順の配列。テーブル更新ごとに読み直す
+
+    取引日時は JST で記録されるため (_to_jst_iso)、日付の境界も JST に揃える。
+    UTC 0時にすると JST 0:00-8:59 の取引に前日のレートが当たる。
+    """
+    version = get_fx_version()
+    with _table_lock:
+        if _table_cache["version"] != version:
+            since = (datetime.now(JST).date() - timedelta(days=FX_HISTORY_DAYS)).isoformat()
+            try:
+                rows = _load_rates(since)
+            except sqlite3.Error as e:
+                print(f"[fx] rate table read failed: {e}")
+                rows = []
+            utc_midnights = np.array([d for d, _, _, _ in rows], dtype="datetime64[s]").astype(np.int64)
+            _table_cache["days"] = utc_midnights - int(JST.utcoffset(None).total_seconds())
+            _table_cache["rates"] = np.array([r for _, r, _, _ in rows], dtype=np.float64)
+            _table_cache["version"] = version
+        return _table_cache["days"], _table_cache["rates"]
+
+
+def rates_as_of(epochs) -> np.ndarray:
+    """
+    各時点 (UTCエポック秒の配列) に有効な USD/JPY レート
+
+    JST の日付でその日以前の最も新しい日次レートを当てる (pandas.merge_asof の backward と同じ)。
+    履歴より前の時点は最も古いレート、履歴が1件もなければ現在のレートを使う。
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    days, rates = _fx_table()
+    if not len(days):
+        return np.full(len(epochs), get_usd_jpy_rate(), dtype=np.float64)
+    index = np.searchsorted(days, epochs, side="right") - 1
+    return rates[np.clip(index, 0, len(rates) - 1)]
+
+
+def get_fx_warning() -> Optional[str]:
+    """レートが古い・固定値の場合の表示用メッセージ (問題なければ None)"""
+    status = get_fx_status()
+    if status["fallback"]:
+        return f"⚠️ 為替レートを取得できないため、仮のレート (1 USD = {status['rate']:,.2f} JPY) で換算しています"
+    if status["stale"]:
+        hours = status["age_seconds"] / 3600
+        return (f"⚠️ 為替レートが古くなっています: 1 USD = {status['rate']:,.2f} JPY "
+                f"({status['date']}, {hours:.0f}時間前に取得)")
+    return None
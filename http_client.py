@@ -0,0 +1,273 @@
+"""
+外部APIへの共通HTTPレイヤー
+
+- ホストごとに requests.Session を共有し、接続を再利用する
+- リトライとバックオフはここに一本化 (呼び出しごとに上書き可)
+- サーキットブレーカー: 連続して失敗したホストへは一定時間すぐに失敗を返す
+- 同じリクエストが同時に発行された場合は1回の通信にまとめる
+  (後から来た呼び出しは自分の待ち時間だけ待ち、超えたら独立して通信する)
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_DEFAULTS = {
+    "retries": 2,              # 初回に加えて再試行する回数
+    "backoff_base": 1.0,       # 1s, 2s, 4s, ...
+    "backoff_max": 8.0,
+    "retry_statuses": (500, 502, 503, 504),
+    "timeout": 10.0,
+    "rate_limit_retries": 5,   # 429 を受けて送り直す回数の上限 (on_rate_limited 指定時)
+}
+
+BREAKER_DEFAULTS = {
+    "failure_threshold": 5,    # 連続失敗でオープン
+    "cooldown_seconds": 60.0,  # オープン中はすぐに失敗を返す
+}
+
+SESSION_POOL_SIZE = 10
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """サーキットブレーカーがオープン中のため通信しなかった"""
+
+
+class CircuitBreaker:
+    """ホスト単位のサーキットブレーカー (closed → open → half-open → closed)"""
+
+    def __init__(self, failure_threshold: int = BREAKER_DEFAULTS["failure_threshold"],
+                 cooldown_seconds: float = BREAKER_DEFAULTS["cooldown_seconds"]):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at < self.cooldown_seconds:
+            return "open"
+        return "half-open"
+
+    def before_request(self, host: str):
+        """オープン中なら CircuitOpenError。ハーフオープン中は試行を1件だけ通す"""
+        with self.lock:
+            state = self._state(time.monotonic())
+            if state == "open" or (state == "half-open" and self.trial_in_flight):
+                remaining = self.cooldown_seconds - (time.monotonic() - self.opened_at)
+                raise CircuitOpenError(f"{host}: circuit open ({max(0.0, remaining):.0f}s)")
+            if state == "half-open":
+                self.trial_in_flight = True
+
+    def release_trial(self):
+        """ハーフオープンの試行枠を、通信せずに返す"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # ハーフオープンでの失敗はクールダウンをやり直す
+                self.opened_at = time.monotonic()
+
+
+class _HostState:
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=SESSION_POOL_SIZE, pool_maxsize=SESSION_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.breaker = CircuitBreaker()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "coalesced": 0, "coalesce_timeouts": 0, "retries": 0, "failures": 0,
+                      "short_circuited": 0, "rate_limited": 0}
+
+    def count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[requests.Response] = None
+        self.error: Optional[BaseException] = None
+
+
+_hosts: Dict[str, _HostState] = {}
+_in_flight: Dict[Tuple, _InFlight] = {}
+_lock = threading.Lock()
+
+
+def _host_state(url: str) -> Tuple[str, _HostState]:
+    host = urlparse(url).netloc
+    with _lock:
+        state = _hosts.get(host)
+        if state is None:
+            state = _hosts[host] = _HostState()
+        return host, state
+
+
+def _request_key(url: str, params: Optional[Dict], group=None) -> Tuple:
+    return ("GET", url, tuple(sorted((k, str(v)) for k, v in (params or {}).items())), group)
+
+
+def _call_budget(timeout: float, retries: int, backoff_base: float, backoff_max: float) -> float:
+    """1回の呼び出しにかかりうる最大秒数 (全試行のタイムアウト + バックオフ)"""
+    backoff = sum(min(backoff_max, backoff_base * 2 ** i) for i in range(retries))
+    return timeout * (retries + 1) + backoff
+
+
+def _get_with_retry(url: str, params: Optional[Dict], timeout: float, retries: int,
+                    backoff_base: float, backoff_max: float, retry_statuses,
+                    gate: Optional[Callable[[], bool]],
+                    on_rate_limited: Optional[Callable[[requests.Response], None]],
+                    rate_limit_retries: int) -> Optional[requests.Response]:
+    host, state = _host_state(url)
+    attempt = 0
+    rate_limited = 0
+    response = None
+    while True:
+        try:
+            state.breaker.before_request(host)
+        except CircuitOpenError:
+            state.count("short_circuited")
+            raise
+        if gate is not None and not gate():
+            state.breaker.release_trial()
+            return response
+
+        state.count("requests")
+        try:
+            response = state.session.get(url, params=params, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            state.count("failures")
+            state.breaker.record_failure()
+            if attempt >= retries:
+                raise
+        else:
+            if response.status_code == 429 and on_rate_limited is not None:
+                # レート制限は障害として数えず、gate (リミッター) で待ち直す (上限回数まで)
+                state.breaker.record_success()
+                state.count("rate_limited")
+                on_rate_limited(response)
+                if rate_limited >= rate_limit_retries:
+                    return response
+                rate_limited += 1
+                continue
+            if response.status_code not in retry_statuses:
+                state.breaker.record_success()
+                return response
+            state.count("failures")
+            state.breaker.record_failure()
+            if attempt >= retries:
+                return response
+
+        state.count("retries")
+        time.sleep(min(backoff_max, backoff_base * 2 ** attempt))
+        attempt += 1
+
+
+def http_get(url: str, params: Optional[Dict] = None, timeout: Optional[float] = None,
+             retries: Optional[int] = None, backoff_base: Optional[float] = None,
+             coalesce: bool = True, gate: Optional[Callable[[], bool]] = None,
+             on_rate_limited: Optional[Callable[[requests.Response], None]] = None,
+             coalesce_group=None, wait_timeout: Optional[float] = None,
+             rate_limit_retries: Optional[int] = None) -> Optional[requests.Response]:
+    """
+    共通セッション・リトライ・サーキットブレーカー付きの GET
+
+    Args:
+        timeout / retries / backoff_base: RETRY_DEFAULTS の上書き
+        coalesce: 同じ URL とパラメータのリクエストが実行中なら、その結果を共有する
+        coalesce_group: まとめる単位の追加キー (優先度など。違う値の呼び出しはまとめない)
+        wait_timeout: 実行中のリクエストを待つ最大秒数。超えたら独立して通信する
+                      (None なら自分の timeout・リトライ回数から求めた上限)
+        gate: 各通信の直前に呼ばれ、False を返すと通信せずに終了する (レートリミッター用)
+        on_rate_limited: 429 応答時に呼ばれる。指定した場合は gate を通して再送する
+                         (rate_limit_retries 回まで。超えたら最後の 429 応答を返す)
+        rate_limit_retries: RETRY_DEFAULTS["rate_limit_retries"] の上書き
+
+    Returns:
+        最後の応答 (ステータスコードは呼び出し側で確認する)。gate が最初から
+        通信を許可しなかった場合は None
+
+    Raises:
+        CircuitOpenError: ブレーカーがオープン中
+        requests.exceptions.RequestException: リトライしても通信できなかった
+    """
+    timeout = timeout if timeout is not None else RETRY_DEFAULTS["timeout"]
+    retries = retries if retries is not None else RETRY_DEFAULTS["retries"]
+    backoff_base = backoff_base if backoff_base is not None else RETRY_DEFAULTS["backoff_base"]
+    call = lambda: _get_with_retry(
+        url, params, timeout, retries, backoff_base,
+        RETRY_DEFAULTS["backoff_max"], RETRY_DEFAULTS["retry_statuses"],
+        gate, on_rate_limited,
+        rate_limit_retries if rate_limit_retries is not None else RETRY_DEFAULTS["rate_limit_retries"]
+    )
+    if not coalesce:
+        return call()
+
+    key = _request_key(url, params, coalesce_group)
+    with _lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = _InFlight()
+    if not leader:
+        state = _host_state(url)[1]
+        state.count("coalesced")
+        if wait_timeout is None:
+            wait_timeout = _call_budget(timeout, retries, backoff_base, RETRY_DEFAULTS["backoff_max"])
+        if flight.done.wait(timeout=wait_timeout):
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+        # 先行のリクエストが自分の待ち時間内に終わらなかった (より長い予算の呼び出しなど)
+        state.count("coalesce_timeouts")
+        return call()
+
+    try:
+        flight.response = call()
+        return flight.response
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _in_flight.pop(key, None)
+        flight.done.set()
+
+
+def get_http_stats() -> Dict[str, Dict]:
+    """ホストごとの通信統計とブレーカーの状態"""
+    with _lock:
+        hosts = dict(_hosts)
+    return {
+        host: {**state.snapshot(), "breaker": state.breaker.state, "consecutive_failures": state.breaker.failures}
+        for host, state in hosts.items()
+    }
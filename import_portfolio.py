@@ -1,6 +1,5 @@
 import sqlite3
-import requests
-import time
+from rate_limiter import PRIORITY_BACKFILL, coingecko_get
 from datetime import datetime
 from database import DB_PATH
 
@@ -26,11 +25,8 @@ def get_coin_info(api_id):
     """Fetch name and icon URL"""
     url = f"https://api.coingecko.com/api/v3/coins/{api_id}"
     try:
-        response = requests.get(url, params={"localization": "false", "tickers": "false", "market_data": "false", "community_data": "false", "developer_data": "false", "sparkline": "false"}, timeout=10)
-        if response.status_code == 429:
-            print(f"Rate limit hit for info {api_id}, waiting...")
-            time.sleep(60)
-            return get_coin_info(api_id)
+        # Rate limits are queued by the shared limiter (lowest priority)
+        response = coingecko_get(url, params={"localization": "false", "tickers": "false", "market_data": "false", "community_data": "false", "developer_data": "false", "sparkline": "false"}, priority=PRIORITY_BACKFILL, timeout=10)
         response.raise_for_status()
         data = response.json()
         return {
@@ -46,11 +42,7 @@ def get_historical_price(api_id, date_str):
     url = f"https://api.coingecko.com/api/v3/coins/{api_id}/history"
     params = {"date": date_str, "localization": "false"}
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 429:
-            print(f"Rate limit hit for history {api_id}, waiting...")
-            time.sleep(60)
-            return get_historical_price(api_id, date_str)
+        response = coingecko_get(url, params=params, priority=PRIORITY_BACKFILL, timeout=10)
         response.raise_for_status()
         data = response.json()
         price = data.get("market_data", {}).get("current_price", {}).get("usd")
@@ -115,7 +107,6 @@ def main():
             asset_id = cursor.lastrowid
             conn.commit()
             print(f"Created new asset {symbol} (ID: {asset_id}).")
-            time.sleep(2) # Be nice to API
 
         # Fetch Price
         print(f"Fetching price for {api_id} on {TARGET_DATE}...")
@@ -137,8 +128,6 @@ def main():
         
         conn.commit()
         print(f"Recorded transaction for {symbol}.")
-        
-        time.sleep(3) # Wait between requests to avoid rate limit (free tier ~10-30 req/min)
 
     conn.close()
     print("\n--- Import Complete ---")
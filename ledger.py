@@ -0,0 +1,369 @@
+"""
+取引台帳 - 集計用の列指向インメモリ表現
+
+取引テーブルを一度だけ読み込み、NumPy配列として保持する。
+保有数量・コストベース・期間集計はすべてこの構造上のベクトル演算で行う。
+差分同期では apply_changes() が変更行だけを反映し、資産別・年別の集計値も
+差分で更新する (全件の再集計は行わない)。
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from constants import TRANSACTION_TYPES
+
+# 取引タイプ <-> 整数コード
+TYPE_NAMES = list(TRANSACTION_TYPES.keys())
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+UNKNOWN_TYPE_CODE = len(TYPE_NAMES)
+
+# 取引タイプごとの保有数量への符号 (末尾は未知タイプ用の0)
+HOLDING_SIGNS = np.array(
+    [TRANSACTION_TYPES[t]["holding_sign"] for t in TYPE_NAMES] + [0],
+    dtype=np.float64
+)
+
+BUY_CODE = TYPE_CODES["Buy"]
+SELL_CODE = TYPE_CODES["Sell"]
+
+# 台帳の構築に必要なカラム
+LEDGER_COLUMNS = "id, date, type, asset_id, quantity, total_amount"
+
+# 重複判定で数量を同一とみなす相対誤差
+QUANTITY_RTOL = 1e-12
+
+
+def to_epoch_seconds(values) -> np.ndarray:
+    """
+    日時の配列をUTCエポック秒 (int64) に変換
+    タイムゾーンなしの値はUTCとして扱う
+    """
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    parsed = pd.to_datetime(pd.Series(values), utc=True, format="ISO8601")
+    return parsed.dt.tz_convert(None).to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+def quantity_matches(quantities, quantity: float) -> np.ndarray:
+    """重複判定用の数量一致マスク (find_near と一括登録のバッチ内判定で共通)"""
+    return np.isclose(np.asarray(quantities, dtype=np.float64), float(quantity), rtol=QUANTITY_RTOL, atol=0.0)
+
+
+def _epoch_bound(value) -> Optional[int]:
+    """期間フィルターの境界値をエポック秒に変換 (Noneはそのまま)"""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return int(ts.to_datetime64().astype("datetime64[s]").astype(np.int64))
+
+
+# 資産別集計のカラム: 符号付き数量, Buy金額, Buy数量, Sell数量, 行数
+_SIGNED_QTY, _BUY_COST, _BOUGHT, _SOLD, _ASSET_ROWS = range(5)
+# 年別集計のカラム: Buy金額, Sell金額, 行数
+_YEAR_BUY, _YEAR_SELL, _YEAR_ROWS = range(3)
+
+
+class TransactionLedger:
+    """
+    取引履歴の列指向表現 (インスタンスは不変として扱う)
+
+    dates: UTCエポック秒 (int64)
+    type_codes: TYPE_NAMES のインデックス (int8)
+    quantities / totals: float64
+    version: apply_changes() のたびに増える台帳バージョン
+    """
+
+    def __init__(self, ids, dates, type_codes, asset_ids, quantities, totals,
+                 version: int = 0, aggregates: Optional[Tuple[Dict, Dict]] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.type_codes = np.asarray(type_codes, dtype=np.int8)
+        self.asset_ids = np.asarray(asset_ids, dtype=np.int64)
+        self.quantities = np.asarray(quantities, dtype=np.float64)
+        self.totals = np.asarray(totals, dtype=np.float64)
+        self.version = version
+
+        # 資産ごとのグループ化インデックス (bincount用)
+        self.asset_keys, self.asset_index = np.unique(self.asset_ids, return_inverse=True)
+
+        # 資産別・年別の集計値 (差分更新の対象)
+        if aggregates is None:
+            aggregates = _aggregate(self.dates, self.type_codes, self.asset_ids,
+                                    self.quantities, self.totals)
+        self._asset_aggs, self._year_aggs = aggregates
+
+        # (資産ID, 日時) 順のソート済みインデックス (重複検出用、遅延構築)
+        self._date_index = None
+
+    @classmethod
+    def empty(cls) -> "TransactionLedger":
+        return cls([], [], [], [], [], [])
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict]) -> "TransactionLedger":
+        """PostgRESTのレスポンス行 (LEDGER_COLUMNS) から台帳を構築"""
+        if not rows:
+            return cls.empty()
+        return cls(*_columns_from_rows(rows))
+
+    @property
+    def max_id(self) -> int:
+        """同期済みの最大ID (新規行取得のウォーターマーク)"""
+        return int(self.ids.max()) if len(self.ids) else 0
+
+    def apply_changes(self, rows: List[Dict], deleted_ids=()) -> "TransactionLedger":
+        """
+        追加・更新された行と削除IDを反映した新しい台帳を返す
+
+        rows に含まれる既存IDは置き換え、deleted_ids は取り除く。
+        追加のみなら集計値に新しい行を加算する。既存行の更新・削除を含む場合は
+        減算による浮動小数点の誤差が積み重ならないよう、影響する資産・年の集計値を
+        反映後の行から計算し直す。
+        """
+        new_cols = _columns_from_rows(rows) if rows else ([], [], [], [], [], [])
+        new_ids = np.asarray(new_cols[0], dtype=np.int64)
+        remove_ids = np.union1d(new_ids, np.asarray(list(deleted_ids), dtype=np.int64))
+        removed = np.isin(self.ids, remove_ids)
+        kept = ~removed
+        if not rows and not removed.any():
+            return self
+
+        columns = (
+            np.concatenate([self.ids[kept], new_ids]),
+            np.concatenate([self.dates[kept], np.asarray(new_cols[1], dtype=np.int64)]),
+            np.concatenate([self.type_codes[kept], np.asarray(new_cols[2], dtype=np.int8)]),
+            np.concatenate([self.asset_ids[kept], np.asarray(new_cols[3], dtype=np.int64)]),
+            np.concatenate([self.quantities[kept], np.asarray(new_cols[4], dtype=np.float64)]),
+            np.concatenate([self.totals[kept], np.asarray(new_cols[5], dtype=np.float64)]),
+        )
+
+        asset_aggs = {aid: v.copy() for aid, v in self._asset_aggs.items()}
+        year_aggs = {year: v.copy() for year, v in self._year_aggs.items()}
+        if removed.any():
+            _recompute(asset_aggs, year_aggs, columns,
+                       touched_assets=np.union1d(self.asset_ids[removed], np.asarray(new_cols[3], dtype=np.int64)),
+                       touched_years=np.union1d(_years(self.dates[removed]), _years(np.asarray(new_cols[1], dtype=np.int64))))
+        elif rows:
+            _merge(asset_aggs, year_aggs, _aggregate(*new_cols[1:]), sign=1.0)
+
+        ledger = TransactionLedger(*columns, version=self.version + 1, aggregates=(asset_aggs, year_aggs))
+        if self._date_index is not None:
+            # 構築済みのソート済みインデックスは引き継ぐ (取り除いた行を落とし、追加行を二分探索で挿入)
+            ledger._date_index = self._updated_date_index(kept, columns, len(new_ids))
+        return ledger
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # --- Masks ---
+
+    def date_mask(self, start_date=None, end_date=None) -> np.ndarray:
+        """start_date <= date <= end_date の行を示すブールマスク"""
+        mask = np.ones(len(self), dtype=bool)
+        start = _epoch_bound(start_date)
+        end = _epoch_bound(end_date)
+        if start is not None:
+            mask &= self.dates >= start
+        if end is not None:
+            mask &= self.dates <= end
+        return mask
+
+    # --- Lookups ---
+
+    def _sorted_by_asset_date(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._date_index is None:
+            order = np.lexsort((self.dates, self.asset_ids))
+            self._date_index = (order, self.asset_ids[order], self.dates[order])
+        return self._date_index
+
+    def _updated_date_index(self, kept: np.ndarray, columns: Tuple,
+                            added: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        apply_changes() 後の台帳 (columns) 用のソート済みインデックスを、全体を
+        並べ替えずに作る。kept は残した行のマスク、末尾 added 行が追加行
+        """
+        order, _, _ = self._date_index
+        # 残した行の新しい位置 (並び順はそのまま)
+        new_position = np.cumsum(kept) - 1
+        order = new_position[order[kept[order]]]
+        _, dates, _, asset_ids, _, _ = columns
+        sorted_assets, sorted_dates = asset_ids[order], dates[order]
+        if added:
+            start = len(asset_ids) - added
+            add_order = start + np.lexsort((dates[start:], asset_ids[start:]))
+            positions = []
+            for i in add_order.tolist():
+                lo = np.searchsorted(sorted_assets, asset_ids[i], side="left")
+                hi = np.searchsorted(sorted_assets, asset_ids[i], side="right")
+                positions.append(lo + np.searchsorted(sorted_dates[lo:hi], dates[i], side="right"))
+            order = np.insert(order, positions, add_order)
+            sorted_assets, sorted_dates = asset_ids[order], dates[order]
+        return order, sorted_assets, sorted_dates
+
+    def find_near(self, asset_id: int, epoch: int, tolerance_seconds: int,
+                  quantity: Optional[float] = None) -> np.ndarray:
+        """
+        同じ資産で epoch ± tolerance_seconds 以内の取引IDを返す (二分探索, O(log n))
+        quantity を指定した場合は数量も一致するものに限定する
+        """
+        order, sorted_assets, sorted_dates = self._sorted_by_asset_date()
+        lo = np.searchsorted(sorted_assets, asset_id, side="left")
+        hi = np.searchsorted(sorted_assets, asset_id, side="right")
+        asset_dates = sorted_dates[lo:hi]
+        start = lo + np.searchsorted(asset_dates, epoch - tolerance_seconds, side="left")
+        end = lo + np.searchsorted(asset_dates, epoch + tolerance_seconds, side="right")
+        idx = order[start:end]
+        if quantity is not None:
+            idx = idx[quantity_matches(self.quantities[idx], quantity)]
+        return self.ids[idx]
+
+    # --- Reductions ---
+
+    def count_types(self, type_names: List[str]) -> int:
+        """指定した取引タイプの行数"""
+        codes = [TYPE_CODES[t] for t in type_names if t in TYPE_CODES]
+        return int(np.isin(self.type_codes, codes).sum())
+
+    def _group_sum(self, weights: np.ndarray) -> np.ndarray:
+        return np.bincount(self.asset_index, weights=weights, minlength=len(self.asset_keys))
+
+    def holdings(self, mask: Optional[np.ndarray] = None) -> Dict[int, float]:
+        """資産ごとの保有数量 {asset_id: quantity}"""
+        if mask is None:
+            return {aid: float(v[_SIGNED_QTY]) for aid, v in self._asset_aggs.items()}
+        signed = np.where(mask, HOLDING_SIGNS[self.type_codes] * self.quantities, 0.0)
+        sums = self._group_sum(signed)
+        present = self._group_sum(mask.astype(np.float64)) > 0
+        return {int(a): float(q) for a, q, p in zip(self.asset_keys, sums, present) if p}
+
+    def buy_sell_totals(self, mask: Optional[np.ndarray] = None,
+                        rates: Optional[np.ndarray] = None) -> Tuple[float, float]:
+        """
+        (Buyの合計金額, Sellの合計金額)
+        rates を渡すと各行の金額に掛けてから合計する (行ごとの為替レートでの換算用)
+        """
+        is_buy = self.type_codes == BUY_CODE
+        is_sell = self.type_codes == SELL_CODE
+        if mask is not None:
+            is_buy &= mask
+            is_sell &= mask
+        totals = self.totals if rates is None else self.totals * rates
+        return float(totals[is_buy].sum()), float(totals[is_sell].sum())
+
+    def year_totals(self, year: int) -> Tuple[float, float]:
+        """指定した年 (UTC) の (Buy合計金額, Sell合計金額)"""
+        totals = self._year_aggs.get(year)
+        if totals is None:
+            return 0.0, 0.0
+        return float(totals[_YEAR_BUY]), float(totals[_YEAR_SELL])
+
+    def cost_basis(self) -> Dict[int, Dict[str, float]]:
+        """
+        単純平均法によるコストベース
+        Returns: { asset_id: {avg_cost, holdings, total_cost} }
+        """
+        result = {}
+        for aid, v in self._asset_aggs.items():
+            bought = v[_BOUGHT]
+            if bought > 0:
+                avg_cost = v[_BUY_COST] / bought
+                holdings = bought - v[_SOLD]
+                result[aid] = {
+                    'avg_cost': float(avg_cost),
+                    'holdings': float(holdings),
+                    'total_cost': float(avg_cost * holdings)
+                }
+        return result
+
+
+def _columns_from_rows(rows: List[Dict]) -> Tuple:
+    """PostgRESTの行から (ids, dates, type_codes, asset_ids, quantities, totals) を作る"""
+    return (
+        [r["id"] for r in rows],
+        to_epoch_seconds([r["date"] for r in rows]),
+        [TYPE_CODES.get(r["type"], UNKNOWN_TYPE_CODE) for r in rows],
+        [r["asset_id"] for r in rows],
+        [float(r["quantity"] or 0) for r in rows],
+        [float(r["total_amount"] or 0) for r in rows],
+    )
+
+
+def _aggregate(dates, type_codes, asset_ids, quantities, totals) -> Tuple[Dict, Dict]:
+    """行集合の資産別・年別集計値を計算"""
+    dates = np.asarray(dates, dtype=np.int64)
+    type_codes = np.asarray(type_codes, dtype=np.int8)
+    asset_ids = np.asarray(asset_ids, dtype=np.int64)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    if len(asset_ids) == 0:
+        return {}, {}
+
+    is_buy = (type_codes == BUY_CODE).astype(np.float64)
+    is_sell = (type_codes == SELL_CODE).astype(np.float64)
+
+    keys, index = np.unique(asset_ids, return_inverse=True)
+    columns = [
+        HOLDING_SIGNS[type_codes] * quantities,
+        totals * is_buy,
+        quantities * is_buy,
+        quantities * is_sell,
+        np.ones(len(asset_ids)),
+    ]
+    asset_sums = np.stack([np.bincount(index, weights=c, minlength=len(keys)) for c in columns], axis=1)
+    asset_aggs = {int(aid): asset_sums[i] for i, aid in enumerate(keys)}
+
+    years = _years(dates)
+    year_keys, year_index = np.unique(years, return_inverse=True)
+    year_sums = np.stack([
+        np.bincount(year_index, weights=totals * is_buy, minlength=len(year_keys)),
+        np.bincount(year_index, weights=totals * is_sell, minlength=len(year_keys)),
+        np.bincount(year_index, minlength=len(year_keys)).astype(np.float64),
+    ], axis=1)
+    year_aggs = {int(y): year_sums[i] for i, y in enumerate(year_keys)}
+
+    return asset_aggs, year_aggs
+
+
+def _years(dates: np.ndarray) -> np.ndarray:
+    """エポック秒 -> 年 (UTC)"""
+    return np.asarray(dates, dtype=np.int64).astype("datetime64[s]").astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+def _recompute(asset_aggs: Dict, year_aggs: Dict, columns: Tuple,
+               touched_assets: np.ndarray, touched_years: np.ndarray):
+    """指定した資産・年の集計値を台帳の行 (columns) から計算し直して置き換える"""
+    _, dates, type_codes, asset_ids, quantities, totals = columns
+    for aid in touched_assets.tolist():
+        asset_aggs.pop(int(aid), None)
+    for year in touched_years.tolist():
+        year_aggs.pop(int(year), None)
+
+    in_assets = np.isin(asset_ids, touched_assets)
+    fresh_assets, _ = _aggregate(dates[in_assets], type_codes[in_assets], asset_ids[in_assets],
+                                 quantities[in_assets], totals[in_assets])
+    in_years = np.isin(_years(dates), touched_years)
+    _, fresh_years = _aggregate(dates[in_years], type_codes[in_years], asset_ids[in_years],
+                                quantities[in_years], totals[in_years])
+    asset_aggs.update(fresh_assets)
+    year_aggs.update(fresh_years)
+
+
+def _merge(asset_aggs: Dict, year_aggs: Dict, delta: Tuple[Dict, Dict], sign: float):
+    """集計値に差分を加算 (sign=-1.0 で減算)。行数が0になったキーは削除する"""
+    delta_assets, delta_years = delta
+    for aid, v in delta_assets.items():
+        merged = asset_aggs.get(aid, np.zeros(len(v))) + sign * v
+        if merged[_ASSET_ROWS] > 0.5:
+            asset_aggs[aid] = merged
+        else:
+            asset_aggs.pop(aid, None)
+    for year, v in delta_years.items():
+        merged = year_aggs.get(year, np.zeros(len(v))) + sign * v
+        if merged[_YEAR_ROWS] > 0.5:
+            year_aggs[year] = merged
+        else:
+            year_aggs.pop(year, None)
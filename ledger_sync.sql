@@ -0,0 +1,55 @@
+-- Change markers for incremental ledger sync
+-- The app fetches only rows newer than its watermark:
+--   * inserts: id > last seen id
+--   * updates: updated_at >= last seen updated_at
+--   * deletes: transaction_deletions.deleted_at >= last seen deleted_at
+-- Without this file the app still syncs inserts by id and falls back to a
+-- periodic full reload to pick up edits made from other sessions.
+
+-- 1. updated_at column on transactions
+ALTER TABLE transactions
+    ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone default timezone('utc'::text, now()) not null;
+
+CREATE INDEX IF NOT EXISTS transactions_updated_at_idx ON transactions (updated_at);
+
+CREATE OR REPLACE FUNCTION touch_transaction_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS on_transaction_touch ON transactions;
+CREATE TRIGGER on_transaction_touch
+BEFORE UPDATE ON transactions
+FOR EACH ROW EXECUTE FUNCTION touch_transaction_updated_at();
+
+-- 2. Tombstones for deleted transactions
+CREATE TABLE IF NOT EXISTS transaction_deletions (
+    transaction_id bigint primary key,
+    deleted_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+CREATE INDEX IF NOT EXISTS transaction_deletions_deleted_at_idx ON transaction_deletions (deleted_at);
+
+ALTER TABLE transaction_deletions ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Enable all for anon" ON transaction_deletions;
+CREATE POLICY "Enable all for anon" ON transaction_deletions FOR ALL USING (true) WITH CHECK (true);
+
+CREATE OR REPLACE FUNCTION record_transaction_deletion()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO transaction_deletions (transaction_id, deleted_at)
+    VALUES (OLD.id, now())
+    ON CONFLICT (transaction_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    -- Tombstones older than 30 days are no longer needed by any client
+    DELETE FROM transaction_deletions WHERE deleted_at < now() - interval '30 days';
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS on_transaction_delete ON transactions;
+CREATE TRIGGER on_transaction_delete
+AFTER DELETE ON transactions
+FOR EACH ROW EXECUTE FUNCTION record_transaction_deletion();
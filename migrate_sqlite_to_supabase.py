@@ -1,8 +1,8 @@
 
 import sqlite3
 import toml
-from database_supabase import CustomSupabaseClient
-from datetime import datetime
+from database_supabase import CustomSupabaseClient, add_transactions_bulk
+from datetime import datetime, timezone
 
 # Connect to local SQLite
 SQLITE_DB_PATH = "crypto_portfolio.db"
@@ -55,39 +55,37 @@ def migrate_transactions(asset_map):
     cursor.execute("SELECT date, type, asset_id, quantity, price_per_unit, total_amount, notes FROM transactions")
     rows = cursor.fetchall()
     
-    count = 0
+    batch = []
     for row in rows:
         date_str, type_, asset_id, quantity, price, total, notes = row
         
         if asset_id not in asset_map:
             print(f"  Skipping transaction for unknown asset ID {asset_id}")
             continue
-            
-        new_asset_id = asset_map[asset_id]
-        
-        # Format date assuming ISO string or similar from SQLite
-        # SQLite: 2026-01-05 12:00:00 -> Supabase: needs ISO8601
         
-        data = {
+        # SQLite: 2026-01-05 12:00:00 -> Supabase: ISO8601
+        batch.append({
             "date": date_str,
             "type": type_,
-            "asset_id": new_asset_id,
+            "asset_id": asset_map[asset_id],
             "quantity": quantity,
             "price_per_unit": price,
             "total_amount": total,
             "notes": notes
-        }
-        
-        try:
-            # Check for duplicates? Hard to tell exact duplicates.
-            # For simplicity, we just insert. If user runs this twice, they get dupes. 
-            # Ideally we check, but let's assume one-time run.
-            supabase.table("transactions").insert(data).execute()
+        })
+    
+    # Batched insert; rows already in Supabase (e.g. a second run) are skipped.
+    # Naive SQLite timestamps are stored as UTC, as the per-row insert did
+    # (Postgres reads an offset-less timestamptz in the session timezone, UTC).
+    results = add_transactions_bulk(batch, client=supabase, naive_tz=timezone.utc)
+    count = 0
+    for r in results:
+        if r['status'] == 'inserted':
             count += 1
-            if count % 10 == 0:
-                print(f"  Migrated {count} transactions...")
-        except Exception as e:
-            print(f"  Error inserting transaction: {e}")
+        elif r['status'] == 'duplicate':
+            print(f"  Skipping duplicate transaction #{r['index']}")
+        else:
+            print(f"  Error inserting transaction #{r['index']}: {r['message']}")
             
     print(f"Done. Migrated {count} transactions.")
 
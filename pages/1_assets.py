@@ -3,7 +3,6 @@
 """
 
 import streamlit as st
-import requests
 from pathlib import Path
 import base64
 from io import BytesIO
@@ -16,6 +15,8 @@ from database_supabase import (
     delete_asset, 
     update_asset
 )
+from price_service import get_prices, peek_price
+from fx_service import get_usd_jpy_rate
 
 # ページ設定
 st.set_page_config(
@@ -68,131 +69,20 @@ def process_uploaded_image(uploaded_file):
         st.error(f"画像処理エラー: {e}")
         return None
 
-# USD/JPY為替レート取得（CoinGecko以外のAPI）
-def get_usd_jpy_rate():
-    """USD/JPY為替レートを取得"""
-    if "usd_jpy_rate" not in st.session_state:
-        # 方法1: Open Exchange Rates API (無料)
-        try:
-            response = requests.get(
-                "https://open.er-api.com/v6/latest/USD",
-                timeout=5
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if "rates" in data:
-                    st.session_state.usd_jpy_rate = data["rates"].get("JPY", 155.0)
-                    return st.session_state.usd_jpy_rate
-        except:
-            pass
-        # フォールバック
-        st.session_state.usd_jpy_rate = 155.0
-    return st.session_state.usd_jpy_rate
-
-# CoinGecko APIから価格を取得（バッチ処理 - USDのみ取得してJPYは計算）
+# 価格は price_service のプロセス共通キャッシュから取得（ページ移動で再取得しない）
 def get_crypto_prices_batch(api_ids, force_refresh=False):
-    """複数の暗号資産の価格を一度に取得してキャッシュ(USDのみ取得、JPYは計算)"""
-    import time
-    
-    # セッションステートにキャッシュがあれば使用
-    if "price_cache" not in st.session_state:
-        st.session_state.price_cache = {}
-    
-    # 為替レートを取得
-    usd_jpy_rate = get_usd_jpy_rate()
-    
-    # 強制更新の場合は全て再取得
-    if force_refresh:
-        ids_to_fetch = api_ids
-    else:
-        # まだ取得していないIDのみ取得
-        ids_to_fetch = [id for id in api_ids if id not in st.session_state.price_cache]
-    
-    if ids_to_fetch:
-        max_retries = 2
-        retry_delay = 1  # 秒
-        
-        for attempt in range(max_retries):
-            try:
-                # USDのみ取得（JPYはレート計算で対応）
-                url = "https://api.coingecko.com/api/v3/simple/price"
-                params = {
-                    "ids": ",".join(ids_to_fetch),
-                    "vs_currencies": "usd",
-                    "include_24hr_change": "true"
-                }
-                response = requests.get(url, params=params, timeout=10)
-                
-                # レート制限エラーの場合
-                if response.status_code == 429:
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay * (attempt + 1))  # 指数バックオフ
-                        continue
-                    else:
-                        st.warning("⚠️ CoinGecko APIのレート制限に達しました。数秒後に再度お試しください。")
-                        # 既存のキャッシュがあればそれを使用
-                        return st.session_state.price_cache
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                # キャッシュに保存(USDを取得し、JPYは計算)
-                for api_id in ids_to_fetch:
-                    if api_id in data:
-                        usd_price = data[api_id].get("usd")
-                        usd_change = data[api_id].get("usd_24h_change")
-                        st.session_state.price_cache[api_id] = {
-                            "usd": usd_price,
-                            "jpy": usd_price * usd_jpy_rate if usd_price else None,
-                            "usd_24h_change": usd_change,
-                            "jpy_24h_change": usd_change  # 変動率はUSDと同じ
-                        }
-                    else:
-                        st.session_state.price_cache[api_id] = {
-                            "usd": None,
-                            "jpy": None,
-                            "usd_24h_change": None,
-                            "jpy_24h_change": None
-                        }
-                
-                # 成功したらループを抜ける
-                if force_refresh:
-                    st.success("✅ 価格を更新しました")
-                break
-                
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    st.error(f"❌ 価格取得エラー: {str(e)}")
-                    # エラー時は既存のキャッシュを保持
-                    for api_id in ids_to_fetch:
-                        if api_id not in st.session_state.price_cache:
-                            st.session_state.price_cache[api_id] = {
-                                "usd": None,
-                                "jpy": None
-                            }
-            except Exception as e:
-                st.error(f"❌ 予期しないエラー: {str(e)}")
-                # エラー時は既存のキャッシュを保持
-                for api_id in ids_to_fetch:
-                    if api_id not in st.session_state.price_cache:
-                        st.session_state.price_cache[api_id] = {
-                            "usd": None,
-                            "jpy": None,
-                            "usd_24h_change": None,
-                            "jpy_24h_change": None
-                        }
-                break
+    """複数の暗号資産の価格を一度に取得(USDのみ取得、JPYは計算)"""
+    prices = get_prices(api_ids, get_usd_jpy_rate(), force_refresh=force_refresh)
     
-    return st.session_state.price_cache
+    if api_ids and not prices:
+        st.warning("⚠️ CoinGecko APIのレート制限に達しました。数秒後に再度お試しください。")
+    elif force_refresh and not any(p.get("stale") for p in prices.values()):
+        st.success("✅ 価格を更新しました")
+    return prices
 
 def get_crypto_price(api_id):
     """単一の暗号資産価格を取得(キャッシュから) - USD & JPY"""
-    if "price_cache" in st.session_state and api_id in st.session_state.price_cache:
-        return st.session_state.price_cache[api_id]
-    return {"usd": None, "jpy": None, "usd_24h_change": None, "jpy_24h_change": None}
+    return peek_price(api_id, get_usd_jpy_rate())
 
 # Note: create/update/delete functions are now imported
 
@@ -7,12 +7,13 @@ import pandas as pd
 from datetime import datetime
 from pathlib import Path
 from constants import TRANSACTION_TYPES, is_cost_free_transaction
-import requests
 import time
 
 # Import from Supabase adapter
 from database_supabase import (
     get_all_transactions, 
+    get_transactions_page,
+    count_transactions,
     add_transaction, 
     update_transaction, 
     delete_transaction, 
@@ -20,6 +21,9 @@ from database_supabase import (
     get_statistics,
     get_assets_list
 )
+from price_service import get_prices
+from fx_service import get_usd_jpy_rate, get_fx_warning, rates_as_of
+from ledger import to_epoch_seconds
 
 # ページ設定
 st.set_page_config(
@@ -59,60 +63,13 @@ currency = st.sidebar.radio(
 )
 currency_symbol = "$" if currency == "USD" else "¥"
 
-# 為替レートを取得(USD -> JPY)
-@st.cache_data(ttl=1800)  # 30分キャッシュ（APIレート制限対策）
-def get_exchange_rate():
-    """現在の為替レートを取得(1 USD = ? JPY)"""
-    try:
-        # Tetherの価格で代用するのが安定(1 USDT ≒ 1 USD)
-        url = "https://api.coingecko.com/api/v3/simple/price"
-        params = {
-            "ids": "tether",
-            "vs_currencies": "jpy"
-        }
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        rate = data.get("tether", {}).get("jpy", 150.0) # フォールバック値
-        return rate
-    except:
-        return 150.0 # 取得失敗時のフォールバック
-
-# 現在価格の取得(USD/JPY) - キャッシュ有効化(TTL: 60秒)
-@st.cache_data(ttl=1800)  # 30分キャッシュ（APIレート制限対策）
-def fetch_current_prices(api_ids, vs_curr="usd"):
-    """CoinGecko APIから現在価格を取得"""
-    if not api_ids:
-        return {}
-        
-    url = "https://api.coingecko.com/api/v3/simple/price"
-    params = {
-        "ids": ",".join(api_ids),
-        "vs_currencies": vs_curr
-    }
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            if response.status_code == 429:
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                    continue
-                return None
-            response.raise_for_status()
-            return response.json()
-        except:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            return None
-    return None
-
 # レート取得
 exchange_rate = 1.0
 if currency == "JPY":
-    exchange_rate = get_exchange_rate()
+    exchange_rate = get_usd_jpy_rate()
+    fx_warning = get_fx_warning()
+    if fx_warning:
+        st.sidebar.caption(fx_warning)
 
 # Note: Database functions (get_all_transactions, etc.) are now imported from database_supabase
 
@@ -263,10 +220,12 @@ elif filter_mode == "年月指定" and selected_year and selected_month:
     period_label = f"{selected_year}年{selected_month}月"
 
 # 統計情報の表示（期間フィルター適用）
+# JPY表示では投資額・売却額を各取引日のレートで換算する
 if start_date:
-    stats = get_statistics(start_date.strftime("%Y-%m-%d %H:%M:%S"), end_date.strftime("%Y-%m-%d %H:%M:%S"))
+    stats = get_statistics(start_date.strftime("%Y-%m-%d %H:%M:%S"), end_date.strftime("%Y-%m-%d %H:%M:%S"),
+                           with_jpy=currency == "JPY")
 else:
-    stats = get_statistics()
+    stats = get_statistics(with_jpy=currency == "JPY")
 
 # 現在のポートフォリオ価値を計算(USDベース)
 current_holdings_value_usd = 0.0
@@ -276,12 +235,11 @@ if holdings_data:
     # API IDリスト作成
     api_ids = [item[2] for item in holdings_data if item[2]] # item[2] is api_id
     
-    # 現在価格取得(USD)
-    prices = fetch_current_prices(api_ids, vs_curr="usd")
+    # 現在価格取得(USD) - 全ページ共通のキャッシュから
+    prices = get_prices(api_ids)
     
-    if prices is None:
+    if (api_ids and not prices) or any(p.get("stale") for p in prices.values()):
         st.warning("⚠️ APIレート制限中。現在価格の一部が取得できませんでした。", icon="⚠️")
-        prices = {}
     
     for item in holdings_data:
         symbol, name, api_id, icon_url, qty = item  # 5つの値にアンパック
@@ -293,10 +251,15 @@ if holdings_data:
 # Total P/L = (現在の資産価値 + 売却額) - 投資額
 total_pl_usd = (current_holdings_value_usd + stats['total_sales']) - stats['total_investment']
 
-# 表示用に変換
-disp_total_investment = stats['total_investment'] * exchange_rate
-disp_total_sales = stats['total_sales'] * exchange_rate
-disp_total_pl = total_pl_usd * exchange_rate
+# 表示用に変換 (JPY: 投資額・売却額は取引日のレート、現在の資産価値は現在のレート)
+if currency == "JPY":
+    disp_total_investment = stats['total_investment_jpy']
+    disp_total_sales = stats['total_sales_jpy']
+    disp_total_pl = current_holdings_value_usd * exchange_rate + disp_total_sales - disp_total_investment
+else:
+    disp_total_investment = stats['total_investment']
+    disp_total_sales = stats['total_sales']
+    disp_total_pl = total_pl_usd
 
 col1, col2, col3, col4 = st.columns(4)
 
@@ -349,8 +312,29 @@ with tab1:
     st.markdown("## 取引履歴一覧")
     st.markdown("<br>", unsafe_allow_html=True)
     
-    # フィルターを適用して取引履歴を取得
-    transactions = get_all_transactions(transaction_filter)
+    # ページネーション設定
+    ITEMS_PER_PAGE = 50
+    total_items = count_transactions(transaction_filter)
+    total_pages = (total_items - 1) // ITEMS_PER_PAGE + 1 if total_items > 0 else 1
+    
+    # ページごとのキーセットカーソル (フィルター変更時はリセット)
+    if st.session_state.get("transaction_page_filter") != transaction_filter:
+        st.session_state["transaction_page_filter"] = transaction_filter
+        st.session_state["transaction_page_cursors"] = [None]
+    page_cursors = st.session_state.setdefault("transaction_page_cursors", [None])
+    page = len(page_cursors)
+    
+    # 表示するページ分のみ取得
+    transactions, next_cursor = get_transactions_page(
+        transaction_filter,
+        limit=ITEMS_PER_PAGE,
+        cursor=page_cursors[-1]
+    )
+    
+    if not transactions and page > 1:
+        # 削除などでページが空になった場合は先頭に戻す
+        st.session_state["transaction_page_cursors"] = [None]
+        st.rerun()
     
     if not transactions:
         st.info("取引が記録されていません。「新規取引」タブから追加してください。")
@@ -358,30 +342,23 @@ with tab1:
         # データフレームに変換
         df_trans = pd.DataFrame(transactions, columns=['id', 'date', 'type', 'symbol', 'name', 'quantity', 'price', 'total', 'notes', 'asset_id'])
         
-        # ページネーション設定
-        ITEMS_PER_PAGE = 50
-        total_items = len(df_trans)
-        total_pages = (total_items - 1) // ITEMS_PER_PAGE + 1 if total_items > 0 else 1
-        
         # ページ選択（一番上に配置）
-        if total_items > ITEMS_PER_PAGE:
+        if total_items > ITEMS_PER_PAGE or page > 1:
             st.markdown(f"**全{total_items}件** （ページあたり{ITEMS_PER_PAGE}件表示）")
             col_page1, col_page2, col_page3 = st.columns([1, 2, 1])
+            with col_page1:
+                if st.button("← 前へ", key="transaction_page_prev", disabled=page <= 1, width='stretch'):
+                    page_cursors.pop()
+                    st.rerun()
             with col_page2:
-                page = st.number_input(
-                    f"ページ (1-{total_pages})", 
-                    min_value=1, 
-                    max_value=total_pages,
-                    value=1,
-                    key="transaction_page",
-                    help=f"全{total_pages}ページ"
-                )
+                st.markdown(f"<div style='text-align: center;'>ページ {page} / {total_pages}</div>", unsafe_allow_html=True)
+            with col_page3:
+                if st.button("次へ →", key="transaction_page_next", disabled=next_cursor is None, width='stretch'):
+                    page_cursors.append(next_cursor)
+                    st.rerun()
             
-            # ページに応じたデータを抽出
             start_idx = (page - 1) * ITEMS_PER_PAGE
-            end_idx = min(start_idx + ITEMS_PER_PAGE, total_items)
-            df_trans = df_trans.iloc[start_idx:end_idx].copy()  # ページ分のみ
-            
+            end_idx = start_idx + len(df_trans)
             st.caption(f"表示中: {start_idx + 1}〜{end_idx}件目")
         else:
             st.markdown(f"**全{total_items}件**")
@@ -400,9 +377,13 @@ with tab1:
             lambda t: f"{TRANSACTION_TYPES[t]['icon']} {t}" if t in TRANSACTION_TYPES else t
         )
             
-        # 通貨換算（表示用カラムに追加）
-        df_display['display_price'] = df_display['price'] * exchange_rate
-        df_display['display_total'] = df_display['total'] * exchange_rate
+        # 通貨換算（表示用カラムに追加）- JPYは各取引日のレートで換算 (as-of join)
+        if currency == "JPY":
+            row_rates = rates_as_of(to_epoch_seconds(df_trans['date'].tolist()))
+        else:
+            row_rates = 1.0
+        df_display['display_price'] = df_display['price'] * row_rates
+        df_display['display_total'] = df_display['total'] * row_rates
 
         # カラム設定
         column_config = {
@@ -499,21 +480,19 @@ with tab1:
         # CSVエクスポートボタン
         st.markdown("<br>", unsafe_allow_html=True)
         
-        # 全トランザクションを取得してエクスポート
-        all_trans = get_all_transactions("すべて")
-        if all_trans:
+        # 全トランザクションはダウンロード時にのみ取得してエクスポート
+        def build_export_csv():
+            all_trans = get_all_transactions("すべて")
             df_export = pd.DataFrame(all_trans, columns=['id', 'date', 'type', 'symbol', 'name', 'quantity', 'price_usd', 'total_usd', 'notes', 'asset_id'])
-            csv = df_export.to_csv(index=False).encode('utf-8-sig')
-            
-            st.download_button(
-                label="📥 CSVエクスポート",
-                data=csv,
-                file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-                width='stretch',
-            )
-        else:
-            st.button("📥 CSVエクスポート", disabled=True, width='stretch', help="取引データがありません")
+            return df_export.to_csv(index=False).encode('utf-8-sig')
+        
+        st.download_button(
+            label="📥 CSVエクスポート",
+            data=build_export_csv,
+            file_name=f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            width='stretch',
+        )
 
 
 
@@ -3,7 +3,6 @@
 """
 
 import streamlit as st
-import requests
 from pathlib import Path
 from datetime import datetime
 import time
@@ -14,7 +13,19 @@ from database_supabase import (
     get_all_transactions, 
     get_latest_snapshot, 
     get_snapshot_count,
-    save_portfolio_snapshot
+    save_portfolio_snapshot,
+    get_pool_stats,
+    get_price_cache_write_stats
+)
+from rate_limiter import get_rate_limit_stats
+from http_client import get_http_stats
+from chart_cache import get_chart_cache_stats
+from fx_service import get_usd_jpy_rate, get_fx_status
+from price_service import (
+    get_prices,
+    get_price_service_stats,
+    get_price_refresher_status,
+    clear_price_memory_cache
 )
 
 # ページ設定
@@ -120,51 +131,28 @@ with col_snap2:
                         holdings_map[api_id] = holdings_map.get(api_id, 0) + holdings
                 
                 if holdings_map:
-                    # CoinGecko APIから現在価格を取得(JPY)
+                    # 現在価格を取得(JPY) - 全ページ共通の価格サービス経由
+                    # 保存する値なので、鮮度切れ・未取得の銘柄はこのスレッドで API から取得する
                     api_ids = list(holdings_map.keys())
+                    prices = get_prices(api_ids, get_usd_jpy_rate(), fetch=True)
                     
-                    prices = {}
-                    batch_size = 250
-                    max_retries = 3
-                    
-                    for i in range(0, len(api_ids), batch_size):
-                        batch = api_ids[i:i + batch_size]
-                        
-                        for attempt in range(max_retries):
-                            try:
-                                if i > 0 or attempt > 0:
-                                    time.sleep(2)
-                                
-                                url = "https://api.coingecko.com/api/v3/simple/price"
-                                params = {
-                                    "ids": ",".join(batch),
-                                    "vs_currencies": "jpy"
-                                }
-                                response = requests.get(url, params=params, timeout=15)
-                                
-                                if response.status_code == 429:
-                                    wait_time = 2 ** (attempt + 1)
-                                    st.info(f"⏳ APIレート制限中... {wait_time}秒後に再試行します")
-                                    time.sleep(wait_time)
-                                    continue
-                                
-                                response.raise_for_status()
-                                batch_prices = response.json()
-                                prices.update(batch_prices)
-                                break
-                                
-                            except requests.exceptions.RequestException as e:
-                                if attempt == max_retries - 1:
-                                    st.warning(f"⚠️ 一部の価格取得に失敗: {batch}")
+                    missing = [a for a in api_ids if a not in prices]
+                    stale = [a for a in api_ids if a in prices and prices[a].get("stale")]
+                    if missing and prices:
+                        st.warning(f"⚠️ 一部の価格取得に失敗: {missing}")
                     
                     if not prices:
                         st.error("❌ 価格データを取得できませんでした。しばらく待ってから再試行してください。")
+                    elif stale:
+                        # 取得に失敗して古い価格しかない銘柄があれば保存しない
+                        st.error(f"❌ 最新の価格を取得できない銘柄があるため保存しませんでした: {stale}。"
+                                 "しばらく待ってから再試行してください。")
                     else:
                         # 総資産額を計算
                         total_value_jpy = 0
                         for api_id, holdings in holdings_map.items():
                             if api_id in prices:
-                                price_jpy = prices[api_id].get("jpy", 0)
+                                price_jpy = prices[api_id].get("jpy") or 0
                                 total_value_jpy += holdings * price_jpy
                         
                         # スナップショットを保存
@@ -194,10 +182,91 @@ with col_e:
 with col_f:
     if st.button("🗑️ キャッシュをクリア", width='stretch'):
         st.cache_data.clear()
+        clear_price_memory_cache()
         st.success("✅ キャッシュをクリアしました")
         time.sleep(0.5)
         st.rerun()
 
+price_service_stats = get_price_service_stats()
+st.caption(
+    f"価格キャッシュ: {price_service_stats['entries']}/{price_service_stats['max_entries']}銘柄 / "
+    f"API呼び出し: {price_service_stats['api_calls']}回"
+    + (f" / 直近のエラー: {price_service_stats['last_error']}" if price_service_stats['last_error'] else "")
+)
+
+chart_cache_stats = get_chart_cache_stats()
+st.caption(
+    f"チャートキャッシュ: {chart_cache_stats['series']}系列 / {chart_cache_stats['points']}点"
+    + (f" / 取得失敗で待機中: {chart_cache_stats['negative']}系列" if chart_cache_stats['negative'] else "")
+)
+
+fx_status = get_fx_status()
+st.caption(
+    f"為替レート: 1 USD = {fx_status['rate']:,.2f} JPY / "
+    + ("取得できていません (仮のレート)" if fx_status['fallback'] else
+       f"{fx_status['date']} ({fx_status['source']}, {fx_status['age_seconds'] / 60:.0f}分前に取得)")
+    + (f" / 直近のエラー: {fx_status['last_error']}" if fx_status['last_error'] else "")
+)
+
+refresher_status = get_price_refresher_status()
+st.caption(
+    f"バックグラウンド価格更新: {'稼働中' if refresher_status['running'] else '停止'} / "
+    f"最終成功: {(refresher_status['last_success_at'] or '-')[:19]} / "
+    f"次回まで最大{refresher_status['delay']:.0f}秒 (間隔 {refresher_status['interval']:.0f}秒)"
+    + (f" / 連続失敗: {refresher_status['failures']}回" if refresher_status['failures'] else "")
+)
+
+hedge_stats = price_service_stats['hedge']
+st.caption(
+    f"価格プロバイダー: {' → '.join(hedge_stats['providers'])} / "
+    f"ヘッジ待ち時間: {hedge_stats['hedge_delay']:.2f}秒 (p{hedge_stats['percentile']:.0f}, {hedge_stats['samples']}件) / "
+    f"ヘッジ: {hedge_stats['hedged']}/{hedge_stats['requests']}回 / フォールバック: {hedge_stats['fallbacks']}回 / "
+    "採用: " + ", ".join(f"{name} {count}" for name, count in hedge_stats['won'].items())
+)
+
+st.markdown("### CoinGecko APIレート制限")
+rate_stats = get_rate_limit_stats()
+col_r1, col_r2, col_r3, col_r4 = st.columns(4)
+col_r1.metric("残りトークン", f"{rate_stats['tokens']:.1f} / {rate_stats['capacity']:.0f}")
+col_r2.metric("上限", f"{rate_stats['calls_per_minute']:.0f} 回/分")
+col_r3.metric("待機中", sum(rate_stats['queued'].values()))
+col_r4.metric("429応答", rate_stats['throttled'])
+st.caption(
+    "払い出し: " + " / ".join(f"{name} {count}" for name, count in rate_stats['granted'].items())
+    + (f" / 停止中: あと{rate_stats['blocked_seconds']:.0f}秒" if rate_stats['blocked_seconds'] > 0 else "")
+    + (f" / 待ち切れず断念: {rate_stats['timeouts']}" if rate_stats['timeouts'] else "")
+)
+
+http_stats = get_http_stats()
+if http_stats:
+    breaker_labels = {"closed": "正常", "open": "遮断中", "half-open": "試行中"}
+    for host, hs in http_stats.items():
+        st.caption(
+            f"{host}: {breaker_labels.get(hs['breaker'], hs['breaker'])} / "
+            f"リクエスト {hs['requests']} / 共有 {hs['coalesced']} / リトライ {hs['retries']} / "
+            f"失敗 {hs['failures']} / 遮断で省略 {hs['short_circuited']}"
+        )
+
+st.markdown("### 接続プール")
+pool_stats = get_pool_stats()
+if pool_stats:
+    col_p1, col_p2, col_p3, col_p4 = st.columns(4)
+    col_p1.metric("リクエスト数", pool_stats["requests"])
+    col_p2.metric("新規接続", pool_stats["new_connections"])
+    col_p3.metric("接続再利用率", f"{pool_stats['reuse_ratio'] * 100:.1f}%")
+    col_p4.metric("オープン接続", pool_stats["open_connections"])
+    st.caption(f"TLSハンドシェイク: {pool_stats['tls_handshakes']}回 / HTTP/2: {'有効' if pool_stats['http2'] else '無効'}")
+else:
+    st.caption("接続プールの情報を取得できません")
+
+price_cache_write = get_price_cache_write_stats()
+if price_cache_write:
+    st.caption(
+        f"価格キャッシュ書き込み: {price_cache_write['rows']}件 / "
+        f"{price_cache_write['chunks']}リクエスト / {price_cache_write['elapsed_ms']:.0f} ms "
+        f"({price_cache_write['at'][:19]})"
+    )
+
 st.markdown("<br><br>", unsafe_allow_html=True)
 
 # フッター
@@ -0,0 +1,285 @@
+"""
+価格プロバイダーとヘッジ付き取得
+
+PriceProvider は「api_id のリスト → {api_id: {usd, usd_24h_change}}」を返す差し替え可能な
+インターフェース。HedgedPriceFetcher はプライマリの応答が直近レイテンシの指定パーセンタイルを
+超えても返らない場合だけバックアップにも問い合わせ、得られた応答を銘柄ごとにマージする
+(プライマリの値を優先)。全銘柄が揃うまでは部分的な応答では返らない。
+通常時はプライマリ1回のみなので、リクエスト量はほぼ増えない。
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set
+
+from http_client import http_get
+
+# ヘッジを出すまでの待ち時間 = プライマリの直近レイテンシのこのパーセンタイル
+HEDGE_PERCENTILE = 95.0
+# パーセンタイルの計算に使う直近のサンプル数
+HEDGE_LATENCY_WINDOW = 200
+# サンプルが揃うまでのヘッジ待ち時間 (秒)
+HEDGE_DEFAULT_DELAY = 2.0
+# ヘッジ待ち時間の下限 (秒)
+HEDGE_MIN_DELAY = 0.3
+HEDGE_MIN_SAMPLES = 20
+# 遅延によるヘッジは要求数のこの割合まで (プライマリの失敗時のフォールバックは数えない)
+HEDGE_BUDGET_RATIO = 0.1
+HEDGE_BUDGET_BURST = 3
+
+CRYPTOCOMPARE_URL = "https://min-api.cryptocompare.com/data/pricemultifull"
+# CryptoCompare の fsyms の上限
+CRYPTOCOMPARE_BATCH_SIZE = 50
+# CoinGecko の api_id -> CryptoCompare のシンボル (同じシンボルの別銘柄がないことを確認済みのもの)
+# ティッカーが衝突する銘柄 (SP, HOLY, PKM など) は含めず、バックアップに問い合わせない
+CRYPTOCOMPARE_VERIFIED_SYMBOLS = {
+    "bitcoin": "BTC",
+    "ethereum": "ETH",
+    "tether": "USDT",
+    "usd-coin": "USDC",
+    "dai": "DAI",
+    "binancecoin": "BNB",
+    "ripple": "XRP",
+    "solana": "SOL",
+    "cardano": "ADA",
+    "dogecoin": "DOGE",
+    "tron": "TRX",
+    "polkadot": "DOT",
+    "litecoin": "LTC",
+    "bitcoin-cash": "BCH",
+    "ethereum-classic": "ETC",
+    "chainlink": "LINK",
+    "stellar": "XLM",
+    "avalanche-2": "AVAX",
+    "cosmos": "ATOM",
+    "monero": "XMR",
+    "uniswap": "UNI",
+    "shiba-inu": "SHIB",
+    "near": "NEAR",
+    "aptos": "APT",
+    "arbitrum": "ARB",
+    "optimism": "OP",
+    "filecoin": "FIL",
+    "internet-computer": "ICP",
+    "hedera-hashgraph": "HBAR",
+    "algorand": "ALGO",
+    "tezos": "XTZ",
+    "wrapped-bitcoin": "WBTC",
+}
+
+
+class PriceProvider:
+    """価格プロバイダーの基底クラス"""
+
+    name = "base"
+
+    def fetch(self, api_ids: List[str], **options) -> Dict[str, Dict]:
+        """
+        {api_id: {usd, usd_24h_change}} を返す。応答に含まれない銘柄は省略してよい。
+        失敗時は例外を送出するか空の辞書を返す。options (リトライ回数など) は
+        対応しないプロバイダーでは無視する。
+        """
+        raise NotImplementedError
+
+    def covers(self, api_ids: List[str]) -> List[str]:
+        """このプロバイダーに問い合わせてよい銘柄 (既定は全て)"""
+        return list(api_ids)
+
+
+class CoinGeckoProvider(PriceProvider):
+    """CoinGecko simple/price (チャンク分割・レート制限は fetch_func 側)"""
+
+    name = "coingecko"
+
+    def __init__(self, fetch_func: Callable[..., Dict[str, Dict]]):
+        self.fetch_func = fetch_func
+
+    def fetch(self, api_ids: List[str], **options) -> Dict[str, Dict]:
+        return self.fetch_func(api_ids, **options)
+
+
+class CryptoCompareProvider(PriceProvider):
+    """
+    CryptoCompare pricemultifull (シンボル指定)
+
+    CoinGecko の api_id は確認済みの対応表 (CRYPTOCOMPARE_VERIFIED_SYMBOLS + symbols) で
+    シンボルに変換する。対応表にない銘柄は、ティッカーが同じ別銘柄の価格を
+    取り違えないよう問い合わせない。バックアップ専用。
+    """
+
+    name = "cryptocompare"
+
+    def __init__(self, symbols: Optional[Dict[str, str]] = None):
+        self.symbols = {k: v.upper() for k, v in {**CRYPTOCOMPARE_VERIFIED_SYMBOLS, **(symbols or {})}.items() if v}
+
+    def covers(self, api_ids: List[str]) -> List[str]:
+        return [api_id for api_id in api_ids if api_id in self.symbols]
+
+    def fetch(self, api_ids: List[str], **options) -> Dict[str, Dict]:
+        by_symbol: Dict[str, List[str]] = {}
+        for api_id in self.covers(api_ids):
+            by_symbol.setdefault(self.symbols[api_id], []).append(api_id)
+
+        result = {}
+        fsyms = sorted(by_symbol)
+        for i in range(0, len(fsyms), CRYPTOCOMPARE_BATCH_SIZE):
+            batch = fsyms[i:i + CRYPTOCOMPARE_BATCH_SIZE]
+            response = http_get(CRYPTOCOMPARE_URL, params={"fsyms": ",".join(batch), "tsyms": "USD"},
+                                timeout=10, retries=0)
+            response.raise_for_status()
+            raw = response.json().get("RAW", {})
+            for symbol in batch:
+                usd = raw.get(symbol, {}).get("USD")
+                if not usd or usd.get("PRICE") is None:
+                    continue
+                for api_id in by_symbol[symbol]:
+                    result[api_id] = {"usd": usd["PRICE"], "usd_24h_change": usd.get("CHANGEPCT24HOUR")}
+        return result
+
+
+class HedgedPriceFetcher:
+    """プライマリが遅いときだけバックアップにヘッジ要求を出す"""
+
+    def __init__(self, primary: PriceProvider, backups: Optional[List[PriceProvider]] = None,
+                 percentile: float = HEDGE_PERCENTILE):
+        self.primary = primary
+        self.backups = list(backups or [])
+        self.percentile = percentile
+        self.latencies: deque = deque(maxlen=HEDGE_LATENCY_WINDOW)
+        self.lock = threading.Lock()
+        # 遅れて完了したプライマリもここで走り切り、レイテンシを記録する
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="price-hedge")
+        self.stats = {"requests": 0, "hedged": 0, "fallbacks": 0, "over_budget": 0, "won": {}}
+
+    def hedge_delay(self) -> float:
+        """プライマリの直近レイテンシの percentile (サンプル不足時は既定値)"""
+        with self.lock:
+            samples = sorted(self.latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100.0))
+        return max(HEDGE_MIN_DELAY, samples[index])
+
+    def _take_hedge_budget(self) -> bool:
+        """遅延ヘッジの予算があれば消費して True (通常時の要求量を倍にしないため)"""
+        with self.lock:
+            if self.stats["hedged"] < self.stats["requests"] * HEDGE_BUDGET_RATIO + HEDGE_BUDGET_BURST:
+                self.stats["hedged"] += 1
+                return True
+            self.stats["over_budget"] += 1
+            return False
+
+    def _timed_primary(self, api_ids: List[str], options: Dict) -> Dict[str, Dict]:
+        started = time.perf_counter()
+        result = self.primary.fetch(api_ids, **options)
+        if result:
+            with self.lock:
+                self.latencies.append(time.perf_counter() - started)
+        return result
+
+    def fetch(self, api_ids: List[str], timeout: Optional[float] = None, **options) -> Dict[str, Dict]:
+        """
+        各プロバイダーの応答を銘柄ごとにマージして返す (同じ銘柄はプライマリの値を優先)
+
+        全銘柄が揃った時点で返す。一部しか得られなかった場合は、残りの銘柄について
+        プライマリ (遅れて返るものを含む) とバックアップを待ち、全て終わった
+        (または timeout 秒経った) 時点で得られた分を返す。すべて失敗したら空の辞書。
+
+        Args:
+            timeout: 全体の待ち時間の上限。None なら上限を設けず、呼び出し元の予算
+                     (options の max_wait など) で各プロバイダー自身が打ち切るのを待つ
+            options: 各プロバイダーの fetch にそのまま渡す
+        """
+        if not api_ids:
+            return {}
+        with self.lock:
+            self.stats["requests"] += 1
+        deadline = None if timeout is None else time.monotonic() + timeout
+        futures: Dict[Future, PriceProvider] = {self.executor.submit(self._timed_primary, api_ids, options): self.primary}
+        pending_backups = list(self.backups)
+        merged: Dict[str, Dict] = {}
+        contributors: Set[str] = set()
+        hedge_at = time.monotonic() + self.hedge_delay()
+        may_hedge = True
+
+        # プライマリが hedge_delay 内に返るか、それより早く失敗するのを待つ
+        wait(futures, timeout=self._seconds_until(hedge_at, deadline))
+        while True:
+            for future in [f for f in futures if f.done()]:
+                provider = futures.pop(future)
+                self._merge(merged, contributors, provider, self._result(future, provider.name))
+
+            missing = [api_id for api_id in api_ids if api_id not in merged]
+            if not missing or (deadline is not None and time.monotonic() >= deadline):
+                return self._finish(merged, contributors)
+
+            # プライマリが終わって欠けがある → フォールバック、まだ返らない (遅い) → 予算内ならヘッジ
+            primary_running = self.primary in futures.values()
+            if pending_backups and (not primary_running or (may_hedge and time.monotonic() >= hedge_at)):
+                backup = pending_backups[0]
+                ids = backup.covers(missing)
+                if not ids:
+                    # このバックアップでは残りの銘柄を取れない
+                    pending_backups.pop(0)
+                elif primary_running and not self._take_hedge_budget():
+                    # 予算切れ: 以降はプライマリの失敗時のみバックアップを使う
+                    may_hedge = False
+                else:
+                    if not primary_running:
+                        with self.lock:
+                            self.stats["fallbacks"] += 1
+                    pending_backups.pop(0)
+                    futures[self.executor.submit(backup.fetch, ids, **options)] = backup
+                    hedge_at = time.monotonic() + self.hedge_delay()
+                continue
+
+            if not futures:
+                return self._finish(merged, contributors)
+            hedge_pending = primary_running and pending_backups and may_hedge
+            wait(futures, timeout=self._seconds_until(hedge_at if hedge_pending else None, deadline),
+                 return_when=FIRST_COMPLETED)
+
+    @staticmethod
+    def _seconds_until(*times: Optional[float]) -> Optional[float]:
+        """最も早い時刻 (monotonic) までの秒数。すべて None なら None (無制限)"""
+        times = [t for t in times if t is not None]
+        return max(0.0, min(times) - time.monotonic()) if times else None
+
+    def _merge(self, merged: Dict[str, Dict], contributors: Set[str], provider: PriceProvider,
+               result: Dict[str, Dict]):
+        """応答を merged に加える。バックアップの値はプライマリの価格を上書きしない"""
+        is_primary = provider is self.primary
+        for api_id, data in result.items():
+            if api_id not in merged or (is_primary and data.get("usd") is not None):
+                merged[api_id] = data
+                contributors.add(provider.name)
+
+    def _finish(self, merged: Dict[str, Dict], contributors: Set[str]) -> Dict[str, Dict]:
+        with self.lock:
+            for name in contributors:
+                self.stats["won"][name] = self.stats["won"].get(name, 0) + 1
+        return merged
+
+    @staticmethod
+    def _result(future: Future, name: str) -> Dict[str, Dict]:
+        try:
+            return future.result() or {}
+        except Exception as e:
+            print(f"[price-provider] {name} failed: {e}")
+            return {}
+
+    def snapshot(self) -> Dict:
+        """ヘッジの状態 (現在の待ち時間, 要求数, ヘッジ数, プロバイダー別の採用数)"""
+        return {
+            "hedge_delay": self.hedge_delay(),
+            "percentile": self.percentile,
+            "samples": len(self.latencies),
+            "requests": self.stats["requests"],
+            "hedged": self.stats["hedged"],
+            "fallbacks": self.stats["fallbacks"],
+            "over_budget": self.stats["over_budget"],
+            "won": dict(self.stats["won"]),
+            "providers": [self.primary.name] + [b.name for b in self.backups],
+        }
@@ -0,0 +1,735 @@
+"""
+価格サービス
+
+全ページ共通の現在価格取得。3段階で解決する:
+  1. プロセス共通のメモリキャッシュ (件数上限付き LRU)
+  2. Supabase の price_cache テーブル (永続キャッシュ)
+  3. CoinGecko API (リトライ方針はここに一本化)。応答が遅いときは
+     price_providers のバックアップ (CryptoCompare) にヘッジ要求を出す
+
+鮮度内の価格はどのページから要求されても API を呼ばない。
+表示通貨 (DISPLAY_CURRENCIES) での価格は、USD 価格ベクトルと為替ベクトルの外積
+(_ValuationMatrix) として価格・為替の更新ごとに1回だけ計算する。
+API 取得に失敗した銘柄は、古いキャッシュがあれば stale=True で返す。
+
+ページ描画中は API を呼ばない。API 取得はプロセスに1つのバックグラウンド
+スレッド (_PriceRefresher) が一定間隔で行い、描画はキャッシュを読むだけにする。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+import requests
+import streamlit as st
+
+from database_supabase import JST, get_background_client, get_held_api_ids, load_price_cache, save_price_cache
+from constants import BTC_API_ID, DISPLAY_CURRENCIES
+from fx_service import get_fx_version, get_usd_jpy_rate, get_usd_rates
+from http_client import CircuitOpenError
+from price_providers import HEDGE_PERCENTILE, CoinGeckoProvider, CryptoCompareProvider, HedgedPriceFetcher
+from rate_limiter import PRIORITY_PRICES, coingecko_get, get_rate_limit_stats
+
+COINGECKO_SIMPLE_PRICE_URL = "https://api.coingecko.com/api/v3/simple/price"
+# この秒数以内に取得した価格は再取得しない
+PRICE_FRESH_SECONDS = 300
+# メモリキャッシュに保持する銘柄数の上限
+PRICE_CACHE_MAX_ENTRIES = 1000
+# 1リクエストあたりの銘柄数の上限
+PRICE_BATCH_SIZE = 250
+# 1リクエストの URL 長の上限 (414 を受けたら自動で縮める)
+PRICE_MAX_URL_LENGTH = 2000
+# チャンクを同時に取得するスレッド数 (実際の送信ペースはレートリミッターが決める)
+PRICE_FETCH_WORKERS = 4
+# 試行回数 (リトライとバックオフは http_client)
+PRICE_MAX_RETRIES = 3
+PRICE_REQUEST_TIMEOUT = 15
+# レート制限時にリミッターの待ち行列で待つ最大秒数
+PRICE_RATE_LIMIT_WAIT = 20.0
+# バックグラウンド更新の間隔 (秒)。secrets の [prices] refresh_interval_seconds で変更可
+PRICE_REFRESH_INTERVAL = 60
+# バックグラウンド更新がリミッターで待つ最大秒数 (超えたら間隔の延長で対応)
+PRICE_REFRESH_LIMIT_WAIT = 60.0
+# レート制限時のバックオフ上限 (秒)
+PRICE_REFRESH_MAX_BACKOFF = 1800
+# 価格が1件もない銘柄を描画時に待つ最大秒数
+PRICE_COLD_WAIT_SECONDS = 5.0
+# 描画で要求された銘柄を、最後の要求からこの秒数だけ定期更新の対象にする
+PRICE_TRACK_TTL = 900
+# 応答に含まれなかった銘柄 (不明なID・一時的な欠落) を再取得しない秒数
+PRICE_UNKNOWN_TTL = 120
+
+
+class _PriceStore:
+    """
+    プロセス共通の価格キャッシュ {api_id: {usd, usd_24h_change, fetched_at}}
+
+    応答に含まれなかった銘柄は価格とは別に unknown に記録し (PRICE_UNKNOWN_TTL の間は再取得しない)、
+    手元の価格は上書きしない
+    """
+
+    def __init__(self, max_entries: int = PRICE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # 応答に含まれなかった銘柄 -> 記録した時刻
+        self.unknown: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        # 同じ銘柄を複数セッションから同時に取得しないよう API 呼び出しを直列化する
+        self.fetch_lock = threading.Lock()
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.api_calls = 0
+        self.last_error: Optional[str] = None
+        # 414 (URI Too Long) を受けて学習した URL 長の上限
+        self.max_url_length = PRICE_MAX_URL_LENGTH
+        # 直近の429応答の Retry-After (秒)
+        self.retry_after: Optional[float] = None
+        # put() のたびに増える番号と、それに対応する換算マトリクス
+        self.version = 0
+        self.matrix: Optional["_ValuationMatrix"] = None
+        self.matrix_key: Optional[Tuple] = None
+
+    def get(self, api_id: str) -> Optional[Dict]:
+        with self.lock:
+            entry = self.entries.get(api_id)
+            if entry is not None:
+                self.entries.move_to_end(api_id)
+            return entry
+
+    def put(self, api_id: str, usd: Optional[float], usd_24h_change: Optional[float], fetched_at: float):
+        with self.lock:
+            current = self.entries.get(api_id)
+            # 永続キャッシュ由来の古い値で新しい値を上書きしない
+            if current is not None and current["fetched_at"] > fetched_at:
+                self.entries.move_to_end(api_id)
+                return
+            self.entries[api_id] = {
+                "usd": usd,
+                "usd_24h_change": usd_24h_change,
+                "fetched_at": fetched_at,
+            }
+            self.entries.move_to_end(api_id)
+            self.unknown.pop(api_id, None)
+            self.version += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def mark_unknown(self, api_id: str, checked_at: float):
+        """応答に価格がなかった銘柄を記録する (既存の価格はそのまま)"""
+        with self.lock:
+            self.unknown[api_id] = checked_at
+            # 件数上限: 古いものから捨てる (dict は挿入順)
+            while len(self.unknown) > self.max_entries:
+                self.unknown.pop(next(iter(self.unknown)))
+
+    def unknown_since(self, api_id: str) -> Optional[float]:
+        """PRICE_UNKNOWN_TTL 以内に「価格なし」と記録された時刻 (なければ None)"""
+        with self.lock:
+            checked_at = self.unknown.get(api_id)
+        if checked_at is None or time.time() - checked_at > PRICE_UNKNOWN_TTL:
+            return None
+        return checked_at
+
+    def missing(self, api_ids: List[str], max_age_seconds: float) -> List[str]:
+        """鮮度内の価格を持たない銘柄 (直前に「価格なし」だった銘柄は除く)"""
+        now = time.time()
+        result = []
+        for api_id in api_ids:
+            entry = self.get(api_id)
+            if entry is None or now - entry["fetched_at"] > max_age_seconds:
+                if self.unknown_since(api_id) is None:
+                    result.append(api_id)
+        return result
+
+
+_store: Optional[_PriceStore] = None
+_store_lock = threading.Lock()
+
+
+def _get_price_store() -> _PriceStore:
+    """プロセスに1つの価格キャッシュ (バックグラウンドスレッドからも使うためモジュール変数で持つ)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = _PriceStore()
+        return _store
+
+
+def _parse_updated_at(value) -> Optional[float]:
+    """price_cache.updated_at を epoch 秒に変換 (タイムゾーンなしは JST)"""
+    if not value:
+        return None
+    try:
+        dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=JST)
+    return dt.timestamp()
+
+
+class _UrlTooLongError(Exception):
+    """simple/price の URL が長すぎた (414)"""
+
+    def __init__(self, url_length: int):
+        super().__init__(f"URL too long ({url_length})")
+        self.url_length = url_length
+
+
+def _request_with_retry(params: Dict, max_retries: int = PRICE_MAX_RETRIES,
+                        max_wait: Optional[float] = PRICE_RATE_LIMIT_WAIT) -> Optional[Dict]:
+    """
+    CoinGecko simple/price を呼び出す
+
+    レート制限はプロセス共通のリミッターが待ち行列で吸収し (最大 max_wait 秒)、
+    サーバーエラー・通信エラーのリトライとサーキットブレーカーは http_client が行う。
+    """
+    store = _get_price_store()
+    store.api_calls += 1
+    try:
+        response = coingecko_get(COINGECKO_SIMPLE_PRICE_URL, params=params, priority=PRIORITY_PRICES,
+                                 timeout=PRICE_REQUEST_TIMEOUT, max_wait=max_wait, retries=max_retries - 1)
+    except CircuitOpenError as e:
+        store.last_error = "circuit_open"
+        print(f"[API] 接続を一時停止中: {e}")
+        return None
+    except requests.exceptions.Timeout:
+        store.last_error = "timeout"
+        print(f"[API] タイムアウト ({max_retries}回試行)")
+        return None
+    except requests.exceptions.ConnectionError:
+        store.last_error = "connection"
+        print(f"[API] 接続エラー ({max_retries}回試行)")
+        return None
+    except Exception as e:
+        store.last_error = str(e)
+        print(f"[API] 予期しないエラー: {e}")
+        return None
+
+    # レート制限 (リミッターの待ち時間内に解消しなかった)
+    if response is None or response.status_code == 429:
+        store.last_error = "rate_limit"
+        store.retry_after = get_rate_limit_stats()["blocked_seconds"] or None
+        print("[API] レート制限: 待ち時間の上限に達しました")
+        return None
+
+    if response.status_code == 414:
+        raise _UrlTooLongError(len(response.url or ""))
+
+    if response.status_code >= 500:
+        store.last_error = "server_error"
+        print(f"[API] サーバーエラー: {response.status_code}")
+        return None
+
+    try:
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        store.last_error = str(e)
+        print(f"[API] 予期しないエラー: {e}")
+        return None
+    store.last_error = None
+    return data
+
+
+_PRICE_QUERY_SUFFIX = "&vs_currencies=usd&include_24hr_change=true"
+
+
+def _price_url_length(api_ids: List[str]) -> int:
+    """ids を指定した simple/price の URL 長 (カンマは %2C にエンコードされる)"""
+    ids_length = sum(len(quote(a, safe="")) for a in api_ids) + 3 * max(0, len(api_ids) - 1)
+    return len(COINGECKO_SIMPLE_PRICE_URL) + len("?ids=") + ids_length + len(_PRICE_QUERY_SUFFIX)
+
+
+def _chunk_ids(api_ids: List[str], max_url_length: int, max_ids: int = PRICE_BATCH_SIZE) -> List[List[str]]:
+    """URL 長と銘柄数の上限に収まるように分割"""
+    chunks = []
+    current: List[str] = []
+    for api_id in api_ids:
+        if current and (len(current) >= max_ids or _price_url_length(current + [api_id]) > max_url_length):
+            chunks.append(current)
+            current = []
+        current.append(api_id)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _fetch_chunk(batch: List[str], max_retries: int, max_wait: Optional[float]) -> Dict[str, Dict]:
+    """1チャンク分を取得。414 の場合は上限を学習して半分に分けて取り直す"""
+    try:
+        data = _request_with_retry({
+            "ids": ",".join(batch),
+            "vs_currencies": "usd",
+            "include_24hr_change": "true"
+        }, max_retries=max_retries, max_wait=max_wait)
+    except _UrlTooLongError:
+        store = _get_price_store()
+        store.max_url_length = min(store.max_url_length, _price_url_length(batch) - 1)
+        if len(batch) == 1:
+            return {}
+        mid = len(batch) // 2
+        result = _fetch_chunk(batch[:mid], max_retries, max_wait)
+        result.update(_fetch_chunk(batch[mid:], max_retries, max_wait))
+        return result
+    if data is None:
+        return {}
+    # 応答に含まれない銘柄 (不明なID) も「価格なし」として記録し、毎回再取得しない
+    return {api_id: data.get(api_id, {}) for api_id in batch}
+
+
+def _fetch_usd_prices(api_ids: List[str], max_retries: int = PRICE_MAX_RETRIES,
+                      max_wait: Optional[float] = PRICE_RATE_LIMIT_WAIT) -> Dict[str, Dict]:
+    """
+    CoinGecko から USD 価格と24h変動率を取得
+
+    URL 長に収まるチャンクに分け、並列に取得して結果をまとめる。
+    失敗したチャンクの銘柄は含まれない (部分的な結果を返す)。
+    """
+    chunks = _chunk_ids(api_ids, _get_price_store().max_url_length)
+    if len(chunks) <= 1:
+        return _fetch_chunk(chunks[0], max_retries, max_wait) if chunks else {}
+
+    prices = {}
+    with ThreadPoolExecutor(max_workers=min(PRICE_FETCH_WORKERS, len(chunks)),
+                            thread_name_prefix="price-fetch") as executor:
+        futures = [executor.submit(_fetch_chunk, chunk, max_retries, max_wait) for chunk in chunks]
+        for future in futures:
+            try:
+                prices.update(future.result())
+            except Exception as e:
+                print(f"[API] チャンク取得エラー: {e}")
+    return prices
+
+
+def _hedge_percentile() -> float:
+    try:
+        return float(st.secrets.get("prices", {}).get("hedge_percentile", HEDGE_PERCENTILE))
+    except Exception:
+        return HEDGE_PERCENTILE
+
+
+def _cryptocompare_symbols() -> Dict[str, str]:
+    """secrets の [prices.cryptocompare_symbols] で追加した {api_id: シンボル} (確認済みのもののみ書く)"""
+    try:
+        return dict(st.secrets.get("prices", {}).get("cryptocompare_symbols", {}))
+    except Exception:
+        return {}
+
+
+@st.cache_resource(show_spinner=False)
+def _get_hedged_fetcher() -> HedgedPriceFetcher:
+    """CoinGecko をプライマリ、CryptoCompare をバックアップとするヘッジ付き取得 (プロセスに1つ)"""
+    primary = CoinGeckoProvider(_fetch_usd_prices)
+    return HedgedPriceFetcher(primary, [CryptoCompareProvider(_cryptocompare_symbols())],
+                              percentile=_hedge_percentile())
+
+
+def _fetch_usd_prices_hedged(api_ids: List[str], max_retries: int = PRICE_MAX_RETRIES,
+                             max_wait: Optional[float] = PRICE_RATE_LIMIT_WAIT) -> Dict[str, Dict]:
+    """_fetch_usd_prices をヘッジ付きで実行 (遅い・欠けた銘柄はバックアップの応答で補う。待ち時間は max_wait まで)"""
+    return _get_hedged_fetcher().fetch(api_ids, max_retries=max_retries, max_wait=max_wait)
+
+
+def _load_persistent(store: _PriceStore, api_ids: List[str], persisted: Optional[Dict] = None):
+    """永続キャッシュ (price_cache テーブル) の値をメモリキャッシュに取り込む"""
+    rows = persisted if persisted is not None else load_price_cache()
+    wanted = set(api_ids)
+    for api_id, row in (rows or {}).items():
+        if api_id not in wanted or row.get("usd") is None:
+            continue
+        fetched_at = _parse_updated_at(row.get("updated_at"))
+        if fetched_at is not None:
+            store.put(api_id, float(row["usd"]), row.get("usd_24h_change"), fetched_at)
+
+
+class _ValuationMatrix:
+    """
+    全銘柄 × 表示通貨の価格と24h変動率
+
+    prices = USD価格ベクトル ⊗ 為替ベクトル (1 USD あたりの各通貨)
+    changes = (1 + USD建て変動率) ⊗ (1 + 為替の変動率) - 1
+    表示通貨の切り替えは列の参照だけで済む。
+    """
+
+    def __init__(self, api_ids: List[str], currencies: List[str], usd: np.ndarray, usd_changes: np.ndarray,
+                 fx: np.ndarray, fx_changes: np.ndarray):
+        self.index = {api_id: i for i, api_id in enumerate(api_ids)}
+        self.currencies = currencies
+        self.columns = {c: j for j, c in enumerate(currencies)}
+        self.fx = fx
+        self.fx_changes = fx_changes
+        self.prices = np.outer(usd, fx)
+        self.changes = (np.outer(1 + usd_changes / 100, 1 + fx_changes) - 1) * 100
+
+    def rate(self, currency: str) -> Optional[float]:
+        """1 USD あたりの currency (取得できていなければ None)"""
+        j = self.columns.get(currency.upper())
+        return None if j is None or np.isnan(self.fx[j]) else float(self.fx[j])
+
+    def rate_change(self, currency: str) -> float:
+        """rate(currency) の24h変動率 (%)。不明なら 0"""
+        j = self.columns.get(currency.upper())
+        return 0.0 if j is None or np.isnan(self.fx_changes[j]) else float(self.fx_changes[j] * 100)
+
+    def row(self, api_id: str) -> Dict[str, Optional[float]]:
+        """{通貨(小文字): 価格, "{通貨}_24h_change": 変動率} (値がなければ None)"""
+        i = self.index.get(api_id)
+        result = {}
+        for currency, j in self.columns.items():
+            key = currency.lower()
+            price = self.prices[i, j] if i is not None else np.nan
+            change = self.changes[i, j] if i is not None else np.nan
+            result[key] = None if np.isnan(price) else float(price)
+            result[f"{key}_24h_change"] = None if np.isnan(change) else float(change)
+        return result
+
+
+def _build_matrix(store: _PriceStore, usd_jpy_rate: Optional[float]) -> _ValuationMatrix:
+    with store.lock:
+        entries = list(store.entries.items())
+    api_ids = [api_id for api_id, _ in entries]
+    as_float = lambda v: np.nan if v is None else float(v)
+    usd = np.array([as_float(e["usd"]) for _, e in entries], dtype=np.float64)
+    usd_changes = np.array([as_float(e["usd_24h_change"]) for _, e in entries], dtype=np.float64)
+
+    currencies = list(DISPLAY_CURRENCIES)
+    fx, fx_changes = get_usd_rates(currencies)
+    if usd_jpy_rate and "JPY" in currencies:
+        fx[currencies.index("JPY")] = usd_jpy_rate
+    if "BTC" in currencies:
+        # BTC建て: 1 USD = 1 / BTC価格 (BTC), 変動率は BTC の値動きの逆数
+        btc = dict(entries).get(BTC_API_ID) or {}
+        j = currencies.index("BTC")
+        fx[j] = 1.0 / btc["usd"] if btc.get("usd") else np.nan
+        fx_changes[j] = 1.0 / (1 + btc["usd_24h_change"] / 100) - 1 if btc.get("usd_24h_change") is not None else 0.0
+    fx_changes[np.isnan(fx)] = np.nan
+    return _ValuationMatrix(api_ids, currencies, usd, usd_changes, fx, fx_changes)
+
+
+def _get_matrix(store: _PriceStore, usd_jpy_rate: Optional[float]) -> _ValuationMatrix:
+    """価格・為替が変わったときだけ作り直す"""
+    key = (store.version, get_fx_version(), usd_jpy_rate)
+    matrix = store.matrix
+    if matrix is None or store.matrix_key != key:
+        matrix = _build_matrix(store, usd_jpy_rate)
+        store.matrix, store.matrix_key = matrix, key
+    return matrix
+
+
+def _to_price_entry(entry: Dict, row: Dict[str, Optional[float]], stale: bool) -> Dict:
+    return {
+        "age_seconds": time.time() - entry["fetched_at"],
+        **row,
+        "usd": entry["usd"],
+        "usd_24h_change": entry["usd_24h_change"],
+        "updated_at": datetime.fromtimestamp(entry["fetched_at"], tz=JST).isoformat(),
+        "stale": stale,
+    }
+
+
+def _store_fetched(store: _PriceStore, fetched: Dict[str, Dict], usd_jpy_rate: Optional[float],
+                   background: bool = True, client=None, persist: bool = True) -> bool:
+    """
+    取得結果をメモリキャッシュと price_cache テーブルに書き込む。価格が1件以上あれば True
+    persist=False ならメモリキャッシュのみ (クライアントのないバックグラウンドスレッド用)
+    """
+    now = time.time()
+    for api_id, data in fetched.items():
+        if data.get("usd") is None:
+            # 一時的に欠けただけかもしれないので、手元の価格は消さずに短時間だけ記録する
+            store.mark_unknown(api_id, now)
+        else:
+            store.put(api_id, data.get("usd"), data.get("usd_24h_change"), now)
+    if not any(data.get("usd") is not None for data in fetched.values()):
+        return False
+    if not persist:
+        return True
+    save_price_cache({
+        api_id: {"usd": data.get("usd"), "usd_24h_change": data.get("usd_24h_change"),
+                 "jpy": data.get("usd") * usd_jpy_rate if data.get("usd") and usd_jpy_rate else None}
+        for api_id, data in fetched.items()
+    }, background=background, client=client)
+    return True
+
+
+class _PriceRefresher:
+    """
+    保有銘柄と描画で要求された銘柄の価格を一定間隔で取得するバックグラウンドスレッド
+
+    レート制限やエラーの間は間隔を倍々に延ばし (Retry-After があればそれ以上)、
+    成功したら元の間隔に戻す。
+    対象は毎サイクル、保有銘柄 + 固定の銘柄 + PRICE_TRACK_TTL 以内に描画で要求された銘柄から作り直す。
+    スレッド内では Streamlit の関数 (st.cache_* を含む) を呼ばない。
+    """
+
+    def __init__(self, store: _PriceStore, fetcher: HedgedPriceFetcher, interval: float = PRICE_REFRESH_INTERVAL,
+                 pinned: Tuple[str, ...] = (), track_ttl: float = PRICE_TRACK_TTL):
+        self.store = store
+        self.fetcher = fetcher
+        self.interval = interval
+        self.delay = interval
+        self.failures = 0
+        # 常に更新する銘柄 (BTC建て換算用の BTC など)
+        self.pinned = set(pinned)
+        self.track_ttl = track_ttl
+        # 描画で要求された銘柄 -> 最後に要求された時刻
+        self.tracked: Dict[str, float] = {}
+        # 期限切れとして再取得を要求された銘柄 (次のサイクルを待たずに取得する)
+        self.urgent: set = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.cycle_done = threading.Condition()
+        self.cycles = 0
+        self.last_attempt_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.thread = threading.Thread(target=self._run, name="price-refresher", daemon=True)
+
+    def start(self):
+        if not self.thread.is_alive():
+            self.thread.start()
+
+    def track(self, api_ids: List[str]):
+        """描画で使う銘柄を定期更新の対象に加える (PRICE_TRACK_TTL 秒要求がなければ外れる)"""
+        now = time.time()
+        with self.lock:
+            self.tracked.update((api_id, now) for api_id in api_ids)
+
+    def _targets(self) -> List[str]:
+        """定期サイクルの取得対象 (期限切れの要求はここで捨てる)"""
+        client = get_background_client()
+        held = get_held_api_ids(client) if client else []
+        cutoff = time.time() - self.track_ttl
+        with self.lock:
+            self.tracked = {a: t for a, t in self.tracked.items() if t >= cutoff}
+            targets = sorted(self.pinned.union(self.tracked, held, self.urgent))
+            self.urgent.clear()
+        return targets
+
+    def revalidate(self, api_ids: List[str]):
+        """期限切れの銘柄だけを、次のサイクルを待たずに再取得する"""
+        if not api_ids:
+            return
+        with self.lock:
+            self.urgent.update(api_ids)
+        self.wake.set()
+
+    def wait_for_cycle(self, timeout: float) -> bool:
+        """次の取得サイクルの完了を最大 timeout 秒待つ"""
+        with self.cycle_done:
+            start = self.cycles
+            return self.cycle_done.wait_for(lambda: self.cycles > start, timeout=timeout)
+
+    def _run(self):
+        next_run = time.time()  # 起動直後に1回取得する
+        while True:
+            self.wake.wait(timeout=max(0.0, next_run - time.time()))
+            self.wake.clear()
+            scheduled = time.time() >= next_run
+            if not scheduled and self.failures:
+                # バックオフ中は描画からの要求でも前倒ししない
+                self._finish_cycle()
+                continue
+            with self.lock:
+                urgent = sorted(self.urgent)
+                self.urgent.clear()
+            try:
+                # 定期サイクルは全銘柄、前倒しの要求は期限切れの銘柄のみ
+                self.refresh_once(None if scheduled else urgent)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"[price-refresher] {e}")
+            next_run = time.time() + self.delay
+            self._finish_cycle()
+
+    def _finish_cycle(self):
+        with self.cycle_done:
+            self.cycles += 1
+            self.cycle_done.notify_all()
+
+    def refresh_once(self, api_ids: Optional[List[str]] = None):
+        self.last_attempt_at = time.time()
+        if api_ids is None:
+            api_ids = self._targets()
+        if not api_ids:
+            return
+
+        # スレッド内ではリトライで眠らず、失敗時は間隔の延長で対応する
+        with self.store.fetch_lock:
+            fetched = self.fetcher.fetch(api_ids, max_retries=1, max_wait=PRICE_REFRESH_LIMIT_WAIT)
+            client = get_background_client()
+            ok = _store_fetched(self.store, fetched, get_usd_jpy_rate(), background=False,
+                                client=client, persist=client is not None)
+
+        if ok and len(fetched) == len(api_ids):
+            self.failures = 0
+            self.delay = self.interval
+            self.last_success_at = time.time()
+            self.last_error = None
+            return
+
+        if ok:
+            self.last_success_at = time.time()
+        self.failures += 1
+        self.last_error = self.store.last_error
+        backoff = min(self.interval * 2 ** self.failures, PRICE_REFRESH_MAX_BACKOFF)
+        self.delay = max(backoff, self.store.retry_after or 0)
+        print(f"[price-refresher] 取得失敗 ({self.last_error})。{self.delay:.0f}秒後に再試行")
+
+
+def _refresh_interval() -> float:
+    try:
+        return float(st.secrets.get("prices", {}).get("refresh_interval_seconds", PRICE_REFRESH_INTERVAL))
+    except Exception:
+        return PRICE_REFRESH_INTERVAL
+
+
+@st.cache_resource(show_spinner=False)
+def _get_price_refresher() -> _PriceRefresher:
+    # ストア・ヘッジ取得はここ (スクリプトの実行中) で用意してスレッドに渡す
+    # BTC は BTC建て表示の換算に使うため常に更新する
+    refresher = _PriceRefresher(_get_price_store(), _get_hedged_fetcher(), _refresh_interval(),
+                                pinned=(BTC_API_ID,))
+    refresher.start()
+    return refresher
+
+
+def start_price_refresher():
+    """バックグラウンド価格更新スレッドを開始 (プロセスに1つ、2回目以降は何もしない)"""
+    _get_price_refresher()
+
+
+def get_price_refresher_status() -> Dict:
+    """バックグラウンド更新の状態 (最終成功時刻, 次回までの秒数, 連続失敗数, ...)"""
+    refresher = _get_price_refresher()
+    to_iso = lambda t: datetime.fromtimestamp(t, tz=JST).isoformat() if t else None
+    return {
+        "running": refresher.thread.is_alive(),
+        "interval": refresher.interval,
+        "delay": refresher.delay,
+        "failures": refresher.failures,
+        "tracked": len(refresher.tracked),
+        "last_attempt_at": to_iso(refresher.last_attempt_at),
+        "last_success_at": to_iso(refresher.last_success_at),
+        "last_error": refresher.last_error,
+    }
+
+
+def get_prices(api_ids: List[str], usd_jpy_rate: Optional[float] = None,
+               max_age_seconds: float = PRICE_FRESH_SECONDS, force_refresh: bool = False,
+               persisted: Optional[Dict] = None, fetch: bool = False,
+               wait_seconds: float = PRICE_COLD_WAIT_SECONDS) -> Dict[str, Dict]:
+    """
+    現在価格を取得
+
+    Args:
+        api_ids: CoinGecko の API ID
+        usd_jpy_rate: JPY 価格の換算レート (None の場合は fx_service の最新レート)
+        max_age_seconds: この秒数以内の価格は API を呼ばずに返す
+        force_refresh: キャッシュを無視して取得し直す
+        persisted: 読み込み済みの price_cache (load_price_cache の戻り値)。省略時は必要な場合のみ読み込む
+        fetch: True ならこのスレッドで API を呼ぶ (スクリプト用)。
+               False (既定) ならバックグラウンド更新に任せ、キャッシュを読むだけ
+        wait_seconds: fetch=False で価格が1件もない銘柄がある場合 (または force_refresh)、
+                      バックグラウンド更新を待つ最大秒数
+
+    Returns:
+        {api_id: {usd, jpy, eur, ..., usd_24h_change, jpy_24h_change, ..., updated_at, age_seconds, stale}}
+        表示通貨 (DISPLAY_CURRENCIES) ごとの価格と24h変動率を含む (換算できない通貨は None)。
+        価格が一度も取得できていない銘柄は含まれない
+    """
+    api_ids = list(dict.fromkeys(a for a in api_ids if a))
+    if not api_ids:
+        return {}
+
+    store = _get_price_store()
+    to_fetch = api_ids if force_refresh else store.missing(api_ids, max_age_seconds)
+
+    if to_fetch and not force_refresh:
+        _load_persistent(store, to_fetch, persisted)
+        to_fetch = store.missing(to_fetch, max_age_seconds)
+
+    if not fetch:
+        refresher = _get_price_refresher()
+        requested_at = time.time()
+        refresher.track(api_ids)
+        # stale-while-revalidate: 期限切れの銘柄だけを非同期に再取得し、手元の値はすぐ返す
+        refresher.revalidate(to_fetch)
+        if force_refresh:
+            pending = lambda: [a for a in to_fetch if (store.get(a) or {}).get("fetched_at", 0) < requested_at
+                               and (store.unknown_since(a) or 0) < requested_at]
+        else:
+            pending = lambda: [a for a in to_fetch if store.get(a) is None and store.unknown_since(a) is None]
+        deadline = requested_at + wait_seconds
+        # 価格が1件もない銘柄 (または強制更新) のみ、バックグラウンド更新を短時間だけ待つ
+        while pending() and time.time() < deadline:
+            if not refresher.wait_for_cycle(deadline - time.time()) or refresher.failures:
+                break
+    elif to_fetch:
+        with store.fetch_lock:
+            # 待っている間に別のセッションが取得していれば再取得しない
+            if not force_refresh:
+                to_fetch = store.missing(to_fetch, max_age_seconds)
+            if to_fetch:
+                # 永続キャッシュへの書き込みは描画をブロックしないよう別スレッドで行う
+                _store_fetched(store, _fetch_usd_prices_hedged(to_fetch), usd_jpy_rate, background=True)
+
+    now = time.time()
+    matrix = _get_matrix(store, usd_jpy_rate)
+    result = {}
+    for api_id in api_ids:
+        entry = store.get(api_id)
+        if entry is not None and entry["usd"] is not None:
+            result[api_id] = _to_price_entry(entry, matrix.row(api_id), now - entry["fetched_at"] > max_age_seconds)
+    return result
+
+
+def peek_price(api_id: str, usd_jpy_rate: Optional[float] = None) -> Dict:
+    """API を呼ばずにメモリキャッシュの価格を返す (未取得なら値は None)"""
+    store = _get_price_store()
+    entry = store.get(api_id)
+    if entry is None or entry["usd"] is None:
+        return {key: None for c in DISPLAY_CURRENCIES for key in (c.lower(), f"{c.lower()}_24h_change")}
+    row = _get_matrix(store, usd_jpy_rate).row(api_id)
+    return _to_price_entry(entry, row, time.time() - entry["fetched_at"] > PRICE_FRESH_SECONDS)
+
+
+def get_currency_rate(currency: str, usd_jpy_rate: Optional[float] = None) -> Optional[float]:
+    """1 USD あたりの表示通貨 (換算マトリクスと同じレート。換算できなければ None)"""
+    return _get_matrix(_get_price_store(), usd_jpy_rate).rate(currency)
+
+
+def get_currency_change(currency: str, usd_jpy_rate: Optional[float] = None) -> float:
+    """get_currency_rate() のレートの24h変動率 (%)。不明なら 0"""
+    return _get_matrix(_get_price_store(), usd_jpy_rate).rate_change(currency)
+
+
+def get_price_version() -> int:
+    """メモリキャッシュの価格が更新されるたびに増える番号 (評価結果のキャッシュキー用)"""
+    return _get_price_store().version
+
+
+def clear_price_memory_cache():
+    """メモリキャッシュを空にする (次回の取得は永続キャッシュまたは API から)"""
+    store = _get_price_store()
+    with store.lock:
+        store.entries.clear()
+        store.unknown.clear()
+        store.version += 1
+
+
+def get_price_service_stats() -> Dict:
+    """価格サービスの状態 (キャッシュ件数, API呼び出し回数, 直近のエラー)"""
+    store = _get_price_store()
+    return {
+        "entries": len(store.entries),
+        "max_entries": store.max_entries,
+        "api_calls": store.api_calls,
+        "last_error": store.last_error,
+        "hedge": _get_hedged_fetcher().snapshot(),
+    }
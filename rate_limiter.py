@@ -0,0 +1,176 @@
+"""
+CoinGecko 向けのプロセス共通レートリミッター (トークンバケット)
+
+全セッション・全スレッドの CoinGecko 呼び出しがこのバケットを共有する。
+トークンがなければ 429 で失敗させずに待ち行列に並べ、優先度の高い順
+(現在価格 → チャート → バックフィル → 先読み) に払い出す。429 を受けたら
+Retry-After の間はバケット全体を止める。
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from http_client import http_get
+
+# 優先度 (小さいほど優先)
+PRIORITY_PRICES = 0
+PRIORITY_CHARTS = 1
+PRIORITY_BACKFILL = 2
+PRIORITY_PREFETCH = 3
+PRIORITY_NAMES = {
+    PRIORITY_PRICES: "prices",
+    PRIORITY_CHARTS: "charts",
+    PRIORITY_BACKFILL: "backfill",
+    PRIORITY_PREFETCH: "prefetch",
+}
+
+# 無料プランは 10-30 req/min 程度のため余裕を持たせる
+COINGECKO_CALLS_PER_MINUTE = 25
+COINGECKO_BURST = 5
+# 429 に Retry-After がない場合に止める秒数
+RATE_LIMIT_DEFAULT_PENALTY = 30.0
+
+
+class TokenBucket:
+    """優先度付き待ち行列を持つトークンバケット"""
+
+    def __init__(self, calls_per_minute: float = COINGECKO_CALLS_PER_MINUTE,
+                 capacity: float = COINGECKO_BURST):
+        self.rate = calls_per_minute / 60.0
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.cond = threading.Condition()
+        self.waiters = []  # heap of (priority, seq)
+        self.seq = itertools.count()
+        self.granted = {p: 0 for p in PRIORITY_NAMES}
+        self.timeouts = 0
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority: int = PRIORITY_BACKFILL, timeout: Optional[float] = None) -> bool:
+        """
+        トークンを1つ取得する。待ち行列の先頭になり、トークンがあり、
+        429 による停止中でなければ払い出す。timeout 秒以内に取れなければ False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        entry = (priority, next(self.seq))
+        with self.cond:
+            heapq.heappush(self.waiters, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                is_head = self.waiters[0] == entry
+                if is_head and self.tokens >= 1.0 and now >= self.blocked_until:
+                    heapq.heappop(self.waiters)
+                    self.tokens -= 1.0
+                    self.granted[priority] = self.granted.get(priority, 0) + 1
+                    self.cond.notify_all()
+                    return True
+
+                if deadline is not None and now >= deadline:
+                    self.waiters.remove(entry)
+                    heapq.heapify(self.waiters)
+                    self.timeouts += 1
+                    self.cond.notify_all()
+                    return False
+
+                # 先頭は次のトークンまで眠り、それ以外は先頭が進むまで待つ
+                wait = None
+                if is_head:
+                    wait = max(self.blocked_until - now, (1.0 - self.tokens) / self.rate, 0.01)
+                if deadline is not None:
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self.cond.wait(timeout=wait)
+
+    def penalize(self, retry_after: Optional[float] = None):
+        """429 を受けたとき、トークンを捨てて retry_after 秒間払い出しを止める"""
+        with self.cond:
+            self.throttled += 1
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until,
+                                     time.monotonic() + (retry_after or RATE_LIMIT_DEFAULT_PENALTY))
+            self.cond.notify_all()
+
+    def stats(self) -> Dict:
+        """残りトークン、待ち行列、払い出し数などの状態"""
+        with self.cond:
+            now = time.monotonic()
+            self._refill(now)
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self.waiters:
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            return {
+                "tokens": self.tokens,
+                "capacity": self.capacity,
+                "calls_per_minute": self.rate * 60.0,
+                "blocked_seconds": max(0.0, self.blocked_until - now),
+                "queued": queued,
+                "granted": {PRIORITY_NAMES.get(p, str(p)): n for p, n in self.granted.items()},
+                "timeouts": self.timeouts,
+                "throttled": self.throttled,
+            }
+
+
+_limiter: Optional[TokenBucket] = None
+_limiter_lock = threading.Lock()
+
+
+def get_coingecko_limiter() -> TokenBucket:
+    """プロセスに1つの CoinGecko 用バケット"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenBucket()
+        return _limiter
+
+
+def get_rate_limit_stats() -> Dict:
+    return get_coingecko_limiter().stats()
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def coingecko_get(url: str, params: Optional[Dict] = None, priority: int = PRIORITY_BACKFILL,
+                  timeout: float = 15, max_wait: Optional[float] = None,
+                  retries: Optional[int] = None) -> Optional[requests.Response]:
+    """
+    リミッター経由で CoinGecko に GET する (通信は http_client の共通レイヤー)
+
+    通信のたびにトークンを1つ使う。429 を受けたらバケットを止めて並び直す。
+    max_wait 秒 (None なら無制限) 以内、かつ 429 による再送が上限
+    (http_client の rate_limit_retries) 以内に成功しなければ、最後の 429 応答
+    (トークンが取れなかった場合は None) を返す。通信エラーは呼び出し元に送出する。
+    """
+    limiter = get_coingecko_limiter()
+    deadline = None if max_wait is None else time.monotonic() + max_wait
+
+    def gate() -> bool:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return limiter.acquire(priority, timeout=remaining)
+
+    def on_rate_limited(response: requests.Response):
+        retry_after = _retry_after_seconds(response)
+        print(f"[API] レート制限検出 ({PRIORITY_NAMES.get(priority, priority)})。"
+              f"{retry_after or RATE_LIMIT_DEFAULT_PENALTY:.0f}秒間リクエストを停止します")
+        limiter.penalize(retry_after)
+
+    # 同じリクエストは同じ優先度の間でだけまとめる。実行中のリクエストは自分の
+    # max_wait (+ 通信1回分) までしか待たない
+    return http_get(url, params=params, timeout=timeout, retries=retries,
+                    gate=gate, on_rate_limited=on_rate_limited, coalesce_group=priority,
+                    wait_timeout=None if max_wait is None else max_wait + timeout)
@@ -0,0 +1,151 @@
+"""
+HedgedPriceFetcher のテスト
+
+ネットワークには接続せず、レイテンシと失敗を指定できるスタブのプロバイダーを使う。
+"""
+
+import threading
+import time
+
+import pytest
+
+from price_providers import CryptoCompareProvider, HedgedPriceFetcher, PriceProvider
+
+HEDGE_DELAY = 0.1
+
+
+class StubProvider(PriceProvider):
+    """latency 秒後に prices のうち要求された銘柄を返す (fail=True なら例外)"""
+
+    def __init__(self, name, prices, latency=0.0, fail=False, covered=None):
+        self.name = name
+        self.prices = prices
+        self.latency = latency
+        self.fail = fail
+        self.covered = covered
+        self.calls = []
+        self.called = threading.Event()
+
+    def covers(self, api_ids):
+        return [a for a in api_ids if self.covered is None or a in self.covered]
+
+    def fetch(self, api_ids, **options):
+        self.calls.append((time.monotonic(), list(api_ids), options))
+        self.called.set()
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        return {a: self.prices[a] for a in api_ids if a in self.prices}
+
+
+def price(usd):
+    return {"usd": usd, "usd_24h_change": 0.0}
+
+
+PRIMARY_PRICES = {"bitcoin": price(100.0), "ethereum": price(10.0)}
+BACKUP_PRICES = {"bitcoin": price(101.0), "ethereum": price(11.0)}
+IDS = ["bitcoin", "ethereum"]
+
+
+def make_fetcher(primary, backup):
+    fetcher = HedgedPriceFetcher(primary, [backup])
+    fetcher.hedge_delay = lambda: HEDGE_DELAY
+    return fetcher
+
+
+def test_primary_wins_without_hedging():
+    primary = StubProvider("primary", PRIMARY_PRICES, latency=0.01)
+    backup = StubProvider("backup", BACKUP_PRICES)
+    fetcher = make_fetcher(primary, backup)
+
+    assert fetcher.fetch(IDS, max_wait=5) == PRIMARY_PRICES
+    assert backup.calls == []
+    assert fetcher.stats["hedged"] == 0
+    assert fetcher.stats["won"] == {"primary": 1}
+    # 呼び出し元の予算はプロバイダーにそのまま渡る
+    assert primary.calls[0][2] == {"max_wait": 5}
+
+
+def test_hedge_fires_after_hedge_delay():
+    primary = StubProvider("primary", PRIMARY_PRICES, latency=1.0)
+    backup = StubProvider("backup", BACKUP_PRICES)
+    fetcher = make_fetcher(primary, backup)
+
+    started = time.monotonic()
+    result = fetcher.fetch(IDS)
+    elapsed = time.monotonic() - started
+
+    assert result == BACKUP_PRICES
+    hedged_at = backup.calls[0][0] - started
+    assert HEDGE_DELAY <= hedged_at < primary.latency
+    assert elapsed < primary.latency
+    assert fetcher.stats["hedged"] == 1
+    assert fetcher.stats["fallbacks"] == 0
+
+
+def test_partial_hedge_waits_for_late_primary():
+    # バックアップは bitcoin しか取れない: 欠けた ethereum はプライマリの遅い応答で補う
+    primary = StubProvider("primary", PRIMARY_PRICES, latency=0.4)
+    backup = StubProvider("backup", BACKUP_PRICES, covered={"bitcoin"})
+    fetcher = make_fetcher(primary, backup)
+
+    result = fetcher.fetch(IDS)
+
+    assert result == PRIMARY_PRICES
+    assert backup.calls[0][1] == ["bitcoin"]
+
+
+def test_fallback_when_primary_fails():
+    primary = StubProvider("primary", PRIMARY_PRICES, fail=True)
+    backup = StubProvider("backup", BACKUP_PRICES)
+    fetcher = make_fetcher(primary, backup)
+
+    started = time.monotonic()
+    assert fetcher.fetch(IDS) == BACKUP_PRICES
+    # 失敗したらヘッジの待ち時間を待たずにバックアップへ
+    assert backup.calls[0][0] - started < HEDGE_DELAY
+    assert fetcher.stats["fallbacks"] == 1
+    assert fetcher.stats["hedged"] == 0
+
+
+def test_budget_exhausted_waits_for_primary():
+    primary = StubProvider("primary", PRIMARY_PRICES, latency=0.3)
+    backup = StubProvider("backup", BACKUP_PRICES)
+    fetcher = make_fetcher(primary, backup)
+    fetcher.stats["hedged"] = 1000
+
+    assert fetcher.fetch(IDS) == PRIMARY_PRICES
+    assert backup.calls == []
+    assert fetcher.stats["over_budget"] == 1
+
+
+def test_budget_exhausted_still_falls_back_on_failure():
+    primary = StubProvider("primary", PRIMARY_PRICES, latency=0.3, fail=True)
+    backup = StubProvider("backup", BACKUP_PRICES)
+    fetcher = make_fetcher(primary, backup)
+    fetcher.stats["hedged"] = 1000
+
+    assert fetcher.fetch(IDS) == BACKUP_PRICES
+    assert fetcher.stats["fallbacks"] == 1
+
+
+def test_timeout_returns_what_arrived():
+    primary = StubProvider("primary", PRIMARY_PRICES, latency=1.0)
+    backup = StubProvider("backup", BACKUP_PRICES, covered={"bitcoin"})
+    fetcher = make_fetcher(primary, backup)
+
+    started = time.monotonic()
+    assert fetcher.fetch(IDS, timeout=0.3) == {"bitcoin": BACKUP_PRICES["bitcoin"]}
+    assert time.monotonic() - started < primary.latency
+
+
+@pytest.mark.parametrize("api_id, expected", [("bitcoin", True), ("spartan-protocol-token", False)])
+def test_cryptocompare_only_covers_verified_symbols(api_id, expected):
+    provider = CryptoCompareProvider()
+    assert (provider.covers([api_id]) == [api_id]) is expected
+
+
+def test_cryptocompare_accepts_configured_symbols():
+    provider = CryptoCompareProvider({"my-coin": "mine"})
+    assert provider.covers(["my-coin", "unknown"]) == ["my-coin"]
+    assert provider.symbols["my-coin"] == "MINE"
@@ -0,0 +1,209 @@
+"""
+ポートフォリオ評価エンジン
+
+保有数量・コストベース・価格フレームから、銘柄別の評価額・損益と
+ポートフォリオ全体の合計・24h変動・上昇/下落トップを1回のベクトル演算で求める。
+Streamlit には依存しないため、ベンチマークや単体の検証からそのまま呼び出せる。
+ダッシュボード (app.py) は value_portfolio() の結果を描画するだけ。
+
+評価は基準通貨 (USD) で一度だけ行い、表示通貨への換算は in_currency() で
+レートを掛けるだけにする。時刻に依存する値 (価格の経過秒数など) は持たないため、
+結果は価格・台帳が変わるまでキャッシュできる。
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# get_portfolio_data() / get_dashboard_data() の保有資産タプルの並び
+HOLDING_COLUMNS = ["id", "symbol", "name", "api_id", "icon_url", "location", "holdings"]
+# 価格フレームのカラム
+PRICE_COLUMNS = ["price", "price_usd", "change_24h"]
+
+
+@dataclass
+class PriceFrame:
+    """
+    api_id ごとの価格を並べた表 (build_price_frame() で作る)
+
+    values の各列は PRICE_COLUMNS の順:
+        price: 表示通貨建ての価格 / price_usd: USD建ての価格
+        change_24h: 表示通貨建ての24h変動率 (%)
+    価格がない値は NaN。末尾に全列 NaN の行を持ち、価格のない銘柄はこの行を参照する
+    """
+    index: Dict[str, int]
+    values: np.ndarray
+
+    def take(self, api_ids: Sequence[Optional[str]]) -> np.ndarray:
+        """api_ids の並びに揃えた values"""
+        missing = len(self.index)
+        rows = np.fromiter((self.index.get(a, missing) for a in api_ids), dtype=np.intp, count=len(api_ids))
+        return self.values[rows]
+
+
+def build_price_frame(prices: Dict[str, Dict], vs_currency: str = "usd") -> PriceFrame:
+    """get_prices() の結果を価格フレームに変換する"""
+    currency = vs_currency.lower()
+    change_key = f"{currency}_24h_change"
+    keys = (currency, "usd", change_key)
+    values = np.array(
+        [[p.get(k) for k in keys] for p in prices.values()] + [[None] * len(keys)],
+        dtype=np.float64
+    )
+    return PriceFrame(index={api_id: i for i, api_id in enumerate(prices)}, values=values)
+
+
+# 銘柄ごとの計算結果のカラム (HOLDING_COLUMNS の後ろに付く)
+ASSET_COLUMNS = ["price", "value", "avg_cost", "pl_percent", "unrealized_pl", "change_24h"]
+
+
+@dataclass
+class PortfolioValuation:
+    """
+    value_portfolio() の結果 (価格・評価額・24h変動は価格フレームの通貨建て、損益は USD 建て)
+
+    銘柄ごとの値は配列 (columns) のまま持ち、dict の行は records() / row() で必要なときに作る
+    """
+    portfolio: Sequence[Tuple] = ()
+    # ASSET_COLUMNS (+ 24h変動率がある銘柄のマスク "has_change") -> 保有資産と同じ並びの配列
+    columns: Dict[str, np.ndarray] = field(default_factory=dict)
+    total_value: float = 0.0
+    total_value_usd: float = 0.0
+    change_24h: float = 0.0
+    change_24h_percent: float = 0.0
+    top_index: Optional[int] = None
+    worst_index: Optional[int] = None
+
+    def row(self, i: int) -> Dict:
+        """i 番目の銘柄の行 (portfolio_display_data の要素と同じキー)"""
+        item = dict(zip(HOLDING_COLUMNS, self.portfolio[i]))
+        for col in ASSET_COLUMNS:
+            item[col] = self.columns[col][i].item()
+        return item
+
+    def records(self) -> List[Dict]:
+        """全銘柄の行 (portfolio_display_data 互換)"""
+        if not self.portfolio:
+            return []
+        values = [self.columns[col].tolist() for col in ASSET_COLUMNS]
+        records = []
+        for item, row in zip(self.portfolio, zip(*values)):
+            record = dict(zip(HOLDING_COLUMNS, item))
+            record.update(zip(ASSET_COLUMNS, row))
+            records.append(record)
+        return records
+
+    @property
+    def top_performer(self) -> Optional[Dict]:
+        return None if self.top_index is None else self.row(self.top_index)
+
+    @property
+    def top_change(self) -> float:
+        return 0.0 if self.top_index is None else float(self.columns["change_24h"][self.top_index])
+
+    @property
+    def worst_performer(self) -> Optional[Dict]:
+        return None if self.worst_index is None else self.row(self.worst_index)
+
+    @property
+    def worst_change(self) -> float:
+        return 0.0 if self.worst_index is None else float(self.columns["change_24h"][self.worst_index])
+
+    def in_currency(self, rate: float, fx_change: float = 0.0) -> "PortfolioValuation":
+        """
+        基準通貨の評価を表示通貨に換算する (配列の掛け算のみ)
+
+        Args:
+            rate: 基準通貨 1 単位あたりの表示通貨
+            fx_change: そのレートの24h変動率 (%)
+
+        24h変動率は (1 + 価格の変動率) * (1 + レートの変動率) - 1 で合成する。
+        平均取得単価・損益は USD 建てのまま
+        """
+        if not self.portfolio:
+            return self
+        # 変動率がない銘柄は換算後も 0 のまま
+        change = np.where(
+            self.columns["has_change"],
+            ((1 + self.columns["change_24h"] / 100) * (1 + fx_change / 100) - 1) * 100,
+            0.0
+        )
+        value = self.columns["value"] * rate
+        total_value = self.total_value * rate
+        change_24h = float(value @ change / 100)
+        return PortfolioValuation(
+            portfolio=self.portfolio,
+            columns={**self.columns, "price": self.columns["price"] * rate, "value": value, "change_24h": change},
+            total_value=total_value,
+            total_value_usd=self.total_value_usd,
+            change_24h=change_24h,
+            change_24h_percent=(change_24h / total_value * 100) if total_value > 0 else 0.0,
+            top_index=int(np.argmax(change)),
+            worst_index=int(np.argmin(change)),
+        )
+
+    def total_pl(self, net_investment: float) -> Tuple[float, float]:
+        """
+        含み益 (USD) と損益率 (%)
+
+        Args:
+            net_investment: 期間中の投資額 - 売却額 (USD)
+        """
+        pl_usd = self.total_value_usd - net_investment
+        pl_percent = (pl_usd / net_investment * 100) if net_investment > 0 else 0.0
+        return pl_usd, pl_percent
+
+
+def value_portfolio(portfolio: Sequence[Tuple], cost_basis: Dict[int, Dict[str, float]],
+                    price_frame: PriceFrame) -> PortfolioValuation:
+    """
+    ポートフォリオを評価する
+
+    Args:
+        portfolio: 保有資産タプルのリスト (HOLDING_COLUMNS の並び)
+        cost_basis: {asset_id: {"avg_cost", "holdings", "total_cost"}} (USD建て)
+        price_frame: build_price_frame() の結果
+
+    価格がない銘柄は価格・評価額0、24h変動0として扱う。
+    損益率・未実現損益は平均取得単価がある銘柄のみ USD 建てで計算する。
+    """
+    if not portfolio:
+        return PortfolioValuation()
+
+    # 価格・コストベースを保有資産の並びに揃える (Python のループはここの参照のみ)
+    px = price_frame.take([item[3] for item in portfolio])
+    holdings = np.nan_to_num(np.array([item[6] for item in portfolio], dtype=np.float64))
+    no_cost = {}
+    cb = np.array(
+        [(c.get("avg_cost"), c.get("total_cost")) for c in (cost_basis.get(item[0], no_cost) for item in portfolio)],
+        dtype=np.float64
+    )
+
+    price, price_usd, change = (np.nan_to_num(px[:, i]) for i in range(3))
+    has_change = ~np.isnan(px[:, 2])
+    avg_cost, total_cost = np.nan_to_num(cb[:, 0]), np.nan_to_num(cb[:, 1])
+
+    value = holdings * price
+    value_usd = holdings * price_usd
+    has_cost = avg_cost > 0
+    safe_avg = np.where(has_cost, avg_cost, 1.0)
+    unrealized_pl = np.where(has_cost, value_usd - total_cost, 0.0)
+    pl_percent = np.where(has_cost, (price_usd - avg_cost) / safe_avg * 100, 0.0)
+
+    total_value = float(value.sum())
+    change_24h = float(value @ change / 100)
+    return PortfolioValuation(
+        portfolio=portfolio,
+        columns={
+            "price": price, "value": value, "avg_cost": avg_cost, "pl_percent": pl_percent,
+            "unrealized_pl": unrealized_pl, "change_24h": change, "has_change": has_change,
+        },
+        total_value=total_value,
+        total_value_usd=float(value_usd.sum()),
+        change_24h=change_24h,
+        change_24h_percent=(change_24h / total_value * 100) if total_value > 0 else 0.0,
+        # 同率なら先頭の銘柄 (max()/min() と同じ)
+        top_index=int(np.argmax(change)),
+        worst_index=int(np.argmin(change)),
+    )